@@ -6,6 +6,7 @@ Watches for probe completion, updates parameters, regenerates toolpaths, exports
 import adsk.core
 import adsk.fusion
 import adsk.cam
+import sys
 import threading
 import time
 import os
@@ -14,6 +15,7 @@ import json
 import math
 import traceback
 import shutil
+import subprocess
 
 # Global variables
 app = None
@@ -35,16 +37,68 @@ CONFIG = {
     'min_points_per_band': 3,
     'front_overhang': 0.005,
     'tail_overhang': 0.01,
+    # Bootstrap confidence intervals - Scripts/KeytopBootstrap.py, run outside Fusion (its Python has no NumPy)
+    'bootstrap_python': 'python',  # Python with NumPy that runs the bootstrap, '' to skip it
+    'bootstrap_timeout': 300,      # Seconds before the bootstrap process is abandoned
+    'bootstrap_samples': 200,      # Resamples per key for confidence intervals
+    'bootstrap_ci': 95,            # Confidence interval percentage
+    'bootstrap_max_ci_in': 0.025,    # Flag keys whose X/Width CI is wider than this
+    'bootstrap_max_ci_step': 0.090,  # Flag keys whose LStep/RStep CI is wider than this
+    'bootstrap_max_ci_deg': 1.25,    # Flag keys whose angle CI is wider than this
+    # Placement check - same thresholds as the ProbeKeys validation report in Mach4
+    'placement_mode': 'reject',        # 'reject' stops before Fusion work, 'flag' only logs
+    'placement_z_tolerance': 0.025,    # Sample key Z vs average
+    'placement_y_tolerance': 0.020,    # Front (Y+) probe vs median
+    'placement_shoulder_min': 0.075,   # Smallest step that counts as a shoulder
+    'placement_shoulder_max': 0.500,
+    'placement_outlier_x': 0.012,      # Front X outliers excluded from step calculation
+    'placement_step_split_y': 0.5,     # Y below this is front, above is back (for steps)
+    # Warm-started angle search from previously solved jobs (KeyPriors.json)
+    'prior_min_jobs': 3,         # Jobs needed for a key before its prior is used
+    'prior_window_sigma': 3.0,   # Search window half-width in robust standard deviations
+    'prior_min_window': 0.10,    # Smallest search window half-width (degrees)
+    # Compaction of the exported program (collinear G1 merge, redundant words) - see Scripts/CompactGCode.py
+    'compact_gcode': True,
+    'compact_tolerance': 0.0002,       # Max distance of a dropped point from the merged move
+    'compact_strip_comments': False,   # Tool table header comments are always kept
+    # Run From Here checkpoint index ({piano_id}.tap.rfh) - see Scripts/RunFromHereIndex.py
+    'run_from_here_index': True,
+    'run_from_here_interval': 500,     # Lines between checkpoints (longest replay in ScreenLoad.lua)
 }
 
 # Network path to Mach4 Logs folder on CNC machine (BLPCN)
 # The add-in watches this folder for probe completion triggers and exports G-code here
 MACH4_LOGS_DIR = r"\\BLPCNC\Mach4Hobby\Profiles\BLP\Logs"
+# Scripts/ of the Mach4 profile - its pure-Python modules (CompactGCode, LogsMirror, RunFromHereIndex) are shared
+# with the add-in. KeytopBootstrap needs NumPy and runs as a separate process.
+# The add-in's own checkout comes first, then the profile share next to the Logs folder.
+SCRIPTS_DIRS = (os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', 'Scripts')),
+                os.path.join(os.path.dirname(MACH4_LOGS_DIR), 'Scripts'))
+for scripts_dir in SCRIPTS_DIRS:
+    if os.path.isdir(scripts_dir) and scripts_dir not in sys.path:
+        sys.path.append(scripts_dir)
+try:
+    import CompactGCode
+    import LogsMirror
+    import RunFromHereIndex
+except ImportError:
+    # Scripts/ unreachable - Logs files are read from the share, the exported program is published as is
+    CompactGCode = LogsMirror = RunFromHereIndex = None
+# Local read-through mirror of the Logs share - the same cache the Scripts tools use
+mirror = LogsMirror.get_mirror() if LogsMirror else None
 # Local watch directory for trigger files (ProbeKeys writes triggers here)
 WATCH_DIR = MACH4_LOGS_DIR
+# Piano folder subfolder where an exported program is compacted and indexed before it is published
+PUBLISH_STAGING_DIR = "Publishing"
 # Heartbeat file path - written every 5 seconds to indicate add-in is running
 HEARTBEAT_FILE = os.path.join(MACH4_LOGS_DIR, "FUSION_HEARTBEAT.txt")
 HEARTBEAT_INTERVAL = 5  # seconds between heartbeat writes
+# Per section/key angle and width of every solved job - seeds the angle search
+PRIORS_FILE = os.path.join(MACH4_LOGS_DIR, "KeyPriors.json")
+# Solver sidecar ({piano}_Solver.json) - read by Scripts/KeytopSolver.load_solver_sidecar
+SOLVER_SIDECAR_VERSION = 1
+# Per-key parameter suffixes sent to Fusion as Key{n}{suffix}
+FUSION_KEY_PARAMS = ('X', 'Angle', 'Width', 'LStep', 'RStep')
 
 current_piano_id = None  # Track current piano being processed
 current_section = None   # Track current section being processed
@@ -63,17 +117,33 @@ def get_piano_folder(piano_id):
     return os.path.join(MACH4_LOGS_DIR, piano_id)
 
 
-def log(msg):
-    """Write debug info to debug log file"""
-    if current_piano_id:
-        piano_folder = get_piano_folder(current_piano_id)
+def log(msg, piano_id=None):
+    """Write debug info to debug log file (of the current piano unless one is given)"""
+    piano_id = piano_id or current_piano_id
+    if piano_id:
+        piano_folder = get_piano_folder(piano_id)
         os.makedirs(piano_folder, exist_ok=True)
-        debug_log_path = os.path.join(piano_folder, f"DEBUG_{current_piano_id}.txt")
+        debug_log_path = os.path.join(piano_folder, f"DEBUG_{piano_id}.txt")
 
         with open(debug_log_path, 'a') as f:
             f.write(f"{time.strftime('%H:%M:%S')} - {msg}\n")
 
 
+def mirror_path(path):
+    """Local copy of a Logs file to read from (the share path itself without Scripts/LogsMirror.py)"""
+    return mirror.path(path) if mirror else path
+
+
+def prefetch_piano_folder(piano_id):
+    """Copy a piano folder into the local mirror, except the programs the job is about to replace"""
+    try:
+        piano_folder = get_piano_folder(piano_id)
+        if os.path.isdir(piano_folder):
+            mirror.prefetch(piano_folder, skip_ext=LogsMirror.PROGRAM_EXTENSIONS)
+    except Exception:
+        pass  # Prefetch is only a speed-up - reads fall back to copying on demand
+
+
 def median(values):
     """Calculate median of a list"""
     if not values:
@@ -137,7 +207,7 @@ def key_shoulders(key_num):
 def parse_csv(csv_path):
     """Parse probe data from CSV into structured format"""
     data = {}
-    with open(csv_path, 'r') as f:
+    with open(mirror_path(csv_path), 'r') as f:
         reader = csv.DictReader(f)
         for row in reader:
             key = int(row['PianoKey#'])
@@ -189,59 +259,93 @@ def calculate_global_params(probe_data):
     return shoulder_length, key_height
 
 
-def optimize_angle(left_points, right_points, center):
-    """Find the optimal rotation angle to minimize slack"""
+def angle_metric(bands, angle, center):
+    """Weighted front/tail slack of the banded edge points rotated by angle"""
+    left_front, left_tail, right_front, right_tail = bands
+
+    # Rotate all bands
+    lf_rot = [rotate_point(p, angle, center) for p in left_front]
+    lt_rot = [rotate_point(p, angle, center) for p in left_tail]
+    rf_rot = [rotate_point(p, angle, center) for p in right_front]
+    rt_rot = [rotate_point(p, angle, center) for p in right_tail]
+
+    # Calculate walls
+    xl_outer = min(
+        min((p[0] for p in lf_rot), default=float('inf')),
+        min((p[0] for p in lt_rot), default=float('inf'))
+    )
+    xr_outer = max(
+        max((p[0] for p in rf_rot), default=float('-inf')),
+        max((p[0] for p in rt_rot), default=float('-inf'))
+    )
+
+    # Calculate slack for each band
+    front_slack = (
+        max((p[0] - xl_outer for p in lf_rot), default=0) +
+        max((xr_outer - p[0] for p in rf_rot), default=0)
+    )
+    tail_slack = (
+        max((p[0] - xl_outer for p in lt_rot), default=0) +
+        max((xr_outer - p[0] for p in rt_rot), default=0)
+    )
+
+    # Weighted metric
+    return front_slack + CONFIG['tail_weight'] * tail_slack
+
+
+def optimize_angle(left_points, right_points, center, prior=None, stats=None):
+    """Find the optimal rotation angle to minimize slack
+
+    With a prior (angle, half_width) the search starts in a window around the
+    historical angle and widens only when the best angle lands on the window
+    edge. Evaluation and fallback counts are added to stats if given.
+    """
     if not left_points or not right_points:
         return 0
 
-    best_angle = 0
-    best_metric = float('inf')
-
     # Split points into bands for metric calculation
-    left_front = [p for p in left_points if p[1] <= CONFIG['band_split_y']]
-    left_tail = [p for p in left_points if p[1] > CONFIG['band_split_y']]
-    right_front = [p for p in right_points if p[1] <= CONFIG['band_split_y']]
-    right_tail = [p for p in right_points if p[1] > CONFIG['band_split_y']]
-
-    # Search for best angle
-    for angle_int in range(int(-CONFIG['max_rotation']/CONFIG['angle_step']),
-                          int(CONFIG['max_rotation']/CONFIG['angle_step']) + 1):
-        angle = angle_int * CONFIG['angle_step']
-
-        # Rotate all bands
-        lf_rot = [rotate_point(p, angle, center) for p in left_front]
-        lt_rot = [rotate_point(p, angle, center) for p in left_tail]
-        rf_rot = [rotate_point(p, angle, center) for p in right_front]
-        rt_rot = [rotate_point(p, angle, center) for p in right_tail]
-
-        # Calculate walls
-        xl_outer = min(
-            min((p[0] for p in lf_rot), default=float('inf')),
-            min((p[0] for p in lt_rot), default=float('inf'))
-        )
-        xr_outer = max(
-            max((p[0] for p in rf_rot), default=float('-inf')),
-            max((p[0] for p in rt_rot), default=float('-inf'))
-        )
-
-        # Calculate slack for each band
-        front_slack = (
-            max((p[0] - xl_outer for p in lf_rot), default=0) +
-            max((xr_outer - p[0] for p in rf_rot), default=0)
-        )
-        tail_slack = (
-            max((p[0] - xl_outer for p in lt_rot), default=0) +
-            max((xr_outer - p[0] for p in rt_rot), default=0)
-        )
-
-        # Weighted metric
-        metric = front_slack + CONFIG['tail_weight'] * tail_slack
-
-        if metric < best_metric:
-            best_metric = metric
-            best_angle = angle
-
-    return best_angle
+    bands = (
+        [p for p in left_points if p[1] <= CONFIG['band_split_y']],
+        [p for p in left_points if p[1] > CONFIG['band_split_y']],
+        [p for p in right_points if p[1] <= CONFIG['band_split_y']],
+        [p for p in right_points if p[1] > CONFIG['band_split_y']],
+    )
+
+    step = CONFIG['angle_step']
+    limit = int(CONFIG['max_rotation'] / step)
+    if prior is None:
+        lo, hi = -limit, limit
+    else:
+        mid = int(round(prior[0] / step))
+        half = max(1, int(math.ceil(prior[1] / step)))
+        lo, hi = max(-limit, mid - half), min(limit, mid + half)
+
+    metrics = {}
+    fallbacks = 0
+    while True:
+        for angle_int in range(lo, hi + 1):
+            if angle_int not in metrics:
+                metrics[angle_int] = angle_metric(bands, angle_int * step, center)
+
+        # Lowest angle wins ties, same as a full ascending scan
+        best_int = min(sorted(metrics), key=metrics.get)
+
+        # Optimum on a window edge (not the search limit) - widen that side and retry
+        width = hi - lo + 1
+        if best_int == lo and lo > -limit:
+            lo = max(-limit, lo - width)
+        elif best_int == hi and hi < limit:
+            hi = min(limit, hi + width)
+        else:
+            break
+        fallbacks += 1
+
+    if stats is not None:
+        stats['evaluations'] += len(metrics)
+        stats['warm' if prior else 'cold'] += 1
+        stats['fallbacks'] += fallbacks
+
+    return best_int * step
 
 
 def calculate_key_params(left_points, right_points, front_points, center, angle, key_num):
@@ -286,11 +390,19 @@ def calculate_key_params(left_points, right_points, front_points, center, angle,
         'Angle': -angle,  # Inverted for Fusion
         'Width': width,
         'LStep': left_step,
-        'RStep': right_step
+        'RStep': right_step,
+        # Rotated-frame geometry (solver sidecar / plotting only, not sent to Fusion)
+        'y_front': y_front,
+        'xl_front': xl_front,
+        'xl_tail': xl_tail,
+        'xr_front': xr_front,
+        'xr_tail': xr_tail,
+        'xl_outer': xl_outer,
+        'xr_outer': xr_outer,
     }
 
 
-def process_key(key_num, key_data):
+def process_key(key_num, key_data, prior=None, stats=None):
     """Process a single key: optimize angle and calculate parameters"""
     # Get point sets
     left_points = [[p['X'], p['Y']] for p in key_data.get('1', [])]
@@ -316,16 +428,328 @@ def process_key(key_num, key_data):
     ]
 
     # Find optimal angle
-    best_angle = optimize_angle(left_points, right_points, center)
+    best_angle = optimize_angle(left_points, right_points, center, prior, stats)
 
     # Calculate final parameters
     params = calculate_key_params(
         left_points, right_points, front_points, center, best_angle, key_num
     )
+    params['center'] = center
+    params['raw_angle'] = best_angle
 
     return params
 
 
+def load_key_priors(section, exclude_piano=None):
+    """Angle/width priors per key for a section from every previously solved job
+
+    Returns {key_num: {'angle': (median, spread), 'width': (median, spread), 'jobs': n}}
+    using the solver's angle sign and a robust spread (1.4826 x MAD).
+    """
+    try:
+        with open(mirror_path(PRIORS_FILE), 'r') as f:
+            jobs = json.load(f).get(section, {})
+    except (OSError, ValueError):
+        return {}
+
+    samples = {}
+    for piano_id, keys in jobs.items():
+        if piano_id == exclude_piano:
+            continue
+        for key, (angle, width) in keys.items():
+            samples.setdefault(int(key), []).append((-angle, width))  # stored in Fusion sign
+
+    def spread(values, center):
+        return 1.4826 * median([abs(v - center) for v in values])
+
+    priors = {}
+    for key_num, values in samples.items():
+        angles = [a for a, _ in values]
+        widths = [w for _, w in values]
+        angle_med = median(angles)
+        width_med = median(widths)
+        priors[key_num] = {
+            'angle': (angle_med, spread(angles, angle_med)),
+            'width': (width_med, spread(widths, width_med)),
+            'jobs': len(values),
+        }
+    return priors
+
+
+def update_key_priors(section, piano_id, key_params):
+    """Record this job's solved angle and width per key in the priors store"""
+    try:
+        with open(PRIORS_FILE, 'r') as f:
+            store = json.load(f)
+    except (OSError, ValueError):
+        store = {}
+
+    store.setdefault(section, {})[piano_id] = {
+        str(key_num): [round(params['Angle'], 4), round(params['Width'], 6)]
+        for key_num, params in sorted(key_params.items())
+    }
+    tmp_path = PRIORS_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(store, f, indent=1)
+    os.replace(tmp_path, PRIORS_FILE)
+
+
+def prior_window(prior):
+    """Angle search window (angle, half_width) for a key prior, None if too few jobs"""
+    if not prior or prior['jobs'] < CONFIG['prior_min_jobs']:
+        return None
+    angle, spread = prior['angle']
+    return angle, max(CONFIG['prior_min_window'], CONFIG['prior_window_sigma'] * spread)
+
+
+def filter_outliers(values, threshold):
+    """Drop values further than threshold from the median (needs 3+ values, keeps at least 2)"""
+    if len(values) < 3:
+        return values
+    med = median(values)
+    good = [v for v in values if abs(v - med) <= threshold]
+    return good if len(good) >= 2 else values
+
+
+def check_placement(probe_data):
+    """Check key placement against the Mach4 validation thresholds
+
+    Runs on the parsed CSV before any Fusion work. Returns (errors, checked_keys).
+    """
+    errors = []
+
+    z_points = [(k, p['Z']) for k in sorted(probe_data) for p in probe_data[k]['5']]
+    if z_points:
+        avg_z = sum(z for _, z in z_points) / len(z_points)
+        for key_num, z in z_points:
+            dev = abs(z - avg_z)
+            if dev > CONFIG['placement_z_tolerance']:
+                errors.append(f"Z SEATING  Key {key_num:<3d}  measured={z:.4f}\"  avg={avg_z:.4f}\"  "
+                              f"deviation={dev:.4f}\" (limit +/-{CONFIG['placement_z_tolerance']:.3f}\")")
+
+    y_points = [(k, p['Y']) for k in sorted(probe_data) for p in probe_data[k]['3']]
+    if y_points:
+        median_y = median([y for _, y in y_points])
+        for key_num, y in y_points:
+            dev = abs(y - median_y)
+            if dev > CONFIG['placement_y_tolerance']:
+                errors.append(f"Y POSITION Key {key_num:<3d}  measured={y:.4f}\"  median={median_y:.4f}\"  "
+                              f"deviation={dev:.4f}\" (limit +/-{CONFIG['placement_y_tolerance']:.3f}\")")
+
+    def avg(values):
+        return sum(values) / len(values) if values else 0
+
+    checked_keys = 0
+    split_y = CONFIG['placement_step_split_y']
+    for key_num in sorted(probe_data):
+        left = probe_data[key_num]['1']
+        right = probe_data[key_num]['2']
+        if not (left and right):
+            continue
+        checked_keys += 1
+
+        lf = filter_outliers([p['X'] for p in left if p['Y'] < split_y], CONFIG['placement_outlier_x'])
+        lb = [p['X'] for p in left if p['Y'] >= split_y]
+        rf = filter_outliers([p['X'] for p in right if p['Y'] < split_y], CONFIG['placement_outlier_x'])
+        rb = [p['X'] for p in right if p['Y'] >= split_y]
+
+        shoulders = key_shoulders(key_num)
+        for side, step, expected in (
+            ('LEFT', avg(lb) - avg(lf), shoulders in ('left', 'both')),
+            ('RIGHT', avg(rf) - avg(rb), shoulders in ('right', 'both')),
+        ):
+            if expected and step < CONFIG['placement_shoulder_min']:
+                errors.append(f"SHOULDER   Key {key_num:<3d}  {side} expected but not found (step={step:.4f}\")")
+            elif expected and step > CONFIG['placement_shoulder_max']:
+                errors.append(f"SHOULDER   Key {key_num:<3d}  {side} width out of range (step={step:.4f}\")")
+            elif not expected and step > CONFIG['placement_shoulder_min']:
+                errors.append(f"SHOULDER   Key {key_num:<3d}  {side} shoulder unexpected (step={step:.4f}\")")
+
+    return errors, checked_keys
+
+
+def write_placement_check(piano_folder, piano_id, status, errors, checked_keys, elapsed_ms):
+    """Write the placement check result as key=value lines for Mach4 to read"""
+    result_path = os.path.join(piano_folder, f"{piano_id}_PlacementCheck.txt")
+    with open(result_path, 'w') as f:
+        f.write(f"status={status}\n")
+        f.write(f"piano_id={piano_id}\n")
+        f.write(f"date={time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"checked_keys={checked_keys}\n")
+        f.write(f"elapsed_ms={elapsed_ms:.2f}\n")
+        f.write(f"errors={len(errors)}\n")
+        for i, err in enumerate(errors, 1):
+            f.write(f"error{i}={err}\n")
+    return result_path
+
+
+def write_solver_sidecar(piano_folder, piano_id, section, csv_path, key_params, shoulder_length, key_height):
+    """Write the exact solver output for this job so the plotting scripts can skip re-solving"""
+    stat = os.stat(csv_path)
+    sidecar = {
+        'format': 'BLPSolver',
+        'version': SOLVER_SIDECAR_VERSION,
+        'piano_id': piano_id,
+        'section': section,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'csv_name': os.path.basename(csv_path),
+        'csv_size': stat.st_size,
+        'csv_mtime': stat.st_mtime,
+        'config': CONFIG,
+        'shoulder_length': shoulder_length,
+        'key_height': key_height,
+        'keys': {str(key_num): params for key_num, params in sorted(key_params.items())},
+    }
+    sidecar_path = os.path.join(piano_folder, f"{piano_id}_Solver.json")
+    tmp_path = sidecar_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(sidecar, f, indent=1)
+    os.replace(tmp_path, sidecar_path)
+    return sidecar_path
+
+
+def placement_gate(probe_data, piano_folder, piano_id, override=False):
+    """Run the placement check and decide whether the job may continue
+
+    Errors reject the job in 'reject' mode unless the operator already chose to
+    send anyway in Mach4 (validation_override in the trigger).
+    """
+    start = time.perf_counter()
+    errors, checked_keys = check_placement(probe_data)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if not errors:
+        status = 'PASS'
+    elif CONFIG['placement_mode'] == 'reject' and not override:
+        status = 'REJECTED'
+    else:
+        status = 'FLAGGED'
+
+    result_path = write_placement_check(piano_folder, piano_id, status, errors, checked_keys, elapsed_ms)
+    log(f"Placement check: {status} - {len(errors)} error(s) across {checked_keys} keys "
+        f"in {elapsed_ms:.1f}ms -> {result_path}")
+    for err in errors:
+        log(f"  PLACEMENT {err}")
+    if status == 'FLAGGED' and override:
+        log("  Operator override in trigger - continuing")
+
+    return status != 'REJECTED'
+
+
+def remove_section_programs(piano_folder, section):
+    """Remove the section's shaping program (files ending in _Upper.tap or _Lower.tap)
+
+    Includes the .tap.orig kept by compaction and the .tap.rfh Run From Here index.
+    """
+    if not os.path.exists(piano_folder):
+        return
+    suffix = f"_{section.lower()}.tap"
+    for file in os.listdir(piano_folder):
+        if file.lower().endswith((suffix, suffix + '.orig', suffix + '.rfh')):
+            os.remove(os.path.join(piano_folder, file))
+            log(f"Removed old file: {file}")
+
+
+def compact_published_program(piano_folder, piano_id, tap_path):
+    """Compact the exported program in place, keeping the original as {piano_id}.tap.orig
+
+    The compacted program only replaces the export when CompactGCode.verify passes -
+    the report ({piano_id}_CompactReport.txt) records the result either way.
+    """
+    start = time.perf_counter()
+    orig_path = tap_path + '.orig'
+    compact_path = tap_path + '.compact'
+    tolerance = CONFIG['compact_tolerance']
+    compactor, verification = CompactGCode.compact_file(tap_path, compact_path, tolerance,
+                                                        strip_comments=CONFIG['compact_strip_comments'])
+    report_path = os.path.join(piano_folder, f"{piano_id}_CompactReport.txt")
+
+    if verification['failure']:
+        CompactGCode.write_report(report_path, tap_path, compact_path, compactor, verification, tolerance)
+        os.remove(compact_path)
+        log(f"WARNING: Compaction failed verification ({verification['failure']}) - keeping the exported program",
+            piano_id)
+        return False
+    shutil.copyfile(tap_path, orig_path)
+    os.replace(compact_path, tap_path)
+    CompactGCode.write_report(report_path, orig_path, tap_path, compactor, verification, tolerance)
+    log(f"Compacted {compactor.lines_in} -> {compactor.lines_out} lines ({compactor.merged} moves merged, "
+        f"max deviation {verification['max_deviation']:.5f}) in {time.perf_counter() - start:.1f}s -> {report_path}",
+        piano_id)
+    return True
+
+
+def run_bootstrap(csv_path, piano_id):
+    """Bootstrap confidence intervals of the solved keys ({piano_id}_Bootstrap.csv) - runs on its own thread
+
+    Scripts/KeytopBootstrap.py needs NumPy, which Fusion's Python lacks, so it runs under
+    CONFIG['bootstrap_python'] and reads the solver sidecar written for this CSV. Its flags
+    are logged and advisory; a missing script or interpreter only skips the intervals.
+    """
+    script = next((os.path.join(scripts_dir, 'KeytopBootstrap.py') for scripts_dir in SCRIPTS_DIRS
+                   if os.path.exists(os.path.join(scripts_dir, 'KeytopBootstrap.py'))), None)
+    if script is None:
+        log("Scripts/KeytopBootstrap.py not found - skipping bootstrap confidence intervals", piano_id)
+        return
+    command = [CONFIG['bootstrap_python'], script, csv_path,
+               '--samples', str(CONFIG['bootstrap_samples']),
+               '--ci', str(CONFIG['bootstrap_ci']),
+               '--max-ci-in', str(CONFIG['bootstrap_max_ci_in']),
+               '--max-ci-step', str(CONFIG['bootstrap_max_ci_step']),
+               '--max-ci-deg', str(CONFIG['bootstrap_max_ci_deg'])]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=CONFIG['bootstrap_timeout'],
+                                creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    except (OSError, subprocess.TimeoutExpired) as e:
+        log(f"Warning: bootstrap not run ({CONFIG['bootstrap_python']}): {e}", piano_id)
+        return
+    for line in result.stdout.splitlines():
+        log(line, piano_id)
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()
+        log(f"Warning: bootstrap failed: {error[-1] if error else f'exit code {result.returncode}'}", piano_id)
+
+
+def finish_published_program(piano_folder, piano_id, staged_path):
+    """Compact and index a staged program, then publish it to the piano folder - runs on its own thread
+
+    FinalKeytopShaping loads {piano_id}.tap as soon as it appears, so the program is
+    compacted and indexed under PUBLISH_STAGING_DIR and only moved into place (index
+    first, program last) once both are final. The SUCCESS marker follows the move.
+    """
+    tap_path = os.path.join(piano_folder, os.path.basename(staged_path))
+    try:
+        if CONFIG['compact_gcode']:
+            if CompactGCode is None:
+                log("WARNING: Scripts/CompactGCode.py not found - keeping the exported program", piano_id)
+            else:
+                try:
+                    compact_published_program(piano_folder, piano_id, staged_path)
+                except Exception as e:
+                    log(f"WARNING: Compaction error, keeping the exported program: {e}", piano_id)
+
+        if CONFIG['run_from_here_index'] and RunFromHereIndex is not None:
+            try:
+                _, header = RunFromHereIndex.write_index(staged_path, CONFIG['run_from_here_interval'])
+                log(f"Run From Here index: {header['lines']} lines -> {tap_path}{RunFromHereIndex.INDEX_EXTENSION}",
+                    piano_id)
+            except Exception as e:
+                log(f"WARNING: Run From Here index error (RunFromHere scans the file instead): {e}", piano_id)
+
+        # os.replace keeps the mtime the index was written for
+        for extension in ('.orig', '.rfh', ''):
+            if os.path.exists(staged_path + extension):
+                os.replace(staged_path + extension, tap_path + extension)
+        shutil.rmtree(os.path.dirname(staged_path), ignore_errors=True)
+    except Exception as e:
+        log(f"ERROR: Could not publish {os.path.basename(tap_path)}: {e}", piano_id)
+        log("=== PROCESSING COMPLETE: FAILED ===", piano_id)
+        return
+    log(f"File published: {tap_path}", piano_id)
+    log("=== PROCESSING COMPLETE: SUCCESS ===", piano_id)
+    log(f"Output file: {tap_path}", piano_id)
+
+
 class ProbeDataHandler(adsk.core.CustomEventHandler):
     def __init__(self):
         super().__init__()
@@ -372,8 +796,21 @@ class ProbeDataHandler(adsk.core.CustomEventHandler):
                 log("ERROR: No input data provided")
                 csv_path = ''
 
+            # Placement check - fail fast before any Fusion work starts
+            placement_ok = True
+            if csv_path and os.path.exists(csv_path):
+                update_progress("Placement check")
+                piano_folder = get_piano_folder(piano_id)
+                os.makedirs(piano_folder, exist_ok=True)
+                placement_ok = placement_gate(parse_csv(csv_path), piano_folder, piano_id,
+                                              input_data.get('validation_override', False))
+
             doc = app.activeDocument
-            if not doc:
+            if not placement_ok:
+                log("ERROR: Placement check rejected - re-seat keys and re-probe")
+                # The previous program was cut for the old placement - FinalKeytopShaping must not find it
+                remove_section_programs(get_piano_folder(piano_id), section)
+            elif not doc:
                 log("ERROR: No active document")
             else:
                 # Get design from document's products
@@ -389,14 +826,7 @@ class ProbeDataHandler(adsk.core.CustomEventHandler):
                     piano_folder = get_piano_folder(piano_id)
                     os.makedirs(piano_folder, exist_ok=True)
 
-                    # Remove old shaping files for this section (files ending in _Upper.tap or _Lower.tap)
-                    if os.path.exists(piano_folder):
-                        for file in os.listdir(piano_folder):
-                            file_lower = file.lower()
-                            if (section == 'Upper' and file_lower.endswith('_upper.tap')) or \
-                               (section == 'Lower' and file_lower.endswith('_lower.tap')):
-                                os.remove(os.path.join(piano_folder, file))
-                                log(f"Removed old file: {file}")
+                    remove_section_programs(piano_folder, section)
 
                     # Parse CSV and calculate parameters
                     if csv_path and os.path.exists(csv_path):
@@ -415,11 +845,46 @@ class ProbeDataHandler(adsk.core.CustomEventHandler):
                         log(f"Processing {len(white_keys)} white keys in {section} section")
                         key_params = {}
 
+                        # Warm-start each key's angle search from previous jobs in this section
+                        priors = load_key_priors(section, exclude_piano=piano_id)
+                        search_stats = {'evaluations': 0, 'warm': 0, 'cold': 0, 'fallbacks': 0}
+                        full_range = 2 * int(CONFIG['max_rotation'] / CONFIG['angle_step']) + 1
+
                         for key_num in white_keys:
-                            params = process_key(key_num, probe_data[key_num])
+                            prior = priors.get(key_num)
+                            fallbacks = search_stats['fallbacks']
+                            params = process_key(key_num, probe_data[key_num], prior_window(prior), search_stats)
                             if params:
                                 key_params[key_num] = params
+                                if search_stats['fallbacks'] > fallbacks:
+                                    log(f"  PRIOR Key {key_num}: angle {params['Angle']:.2f} outside prior "
+                                        f"{-prior['angle'][0]:.2f} +/- {prior['angle'][1]:.2f} - window widened")
+                                if prior and prior['jobs'] >= CONFIG['prior_min_jobs']:
+                                    width_med, width_spread = prior['width']
+                                    if abs(params['Width'] - width_med) > CONFIG['prior_window_sigma'] * max(width_spread, 0.001):
+                                        log(f"  PRIOR Key {key_num}: width {params['Width']:.4f} outside prior "
+                                            f"{width_med:.4f} +/- {width_spread:.4f}")
                         log(f"Calculated parameters for {len(key_params)} keys")
+                        log(f"Angle search: {search_stats['evaluations']} metric evaluations "
+                            f"(full search {full_range * (search_stats['warm'] + search_stats['cold'])}), "
+                            f"{search_stats['warm']} warm / {search_stats['cold']} cold keys, "
+                            f"{search_stats['fallbacks']} fallback(s)")
+
+                        try:
+                            update_key_priors(section, piano_id, key_params)
+                        except Exception as e:
+                            log(f"Warning: could not update key priors: {e}")
+
+                        try:
+                            sidecar_path = write_solver_sidecar(piano_folder, piano_id, section, csv_path,
+                                                                key_params, shoulder_length, key_height)
+                            log(f"Solver sidecar: {sidecar_path}")
+                        except Exception as e:
+                            log(f"Warning: could not write solver sidecar: {e}")
+
+                        # Bootstrap confidence intervals (advisory only - never blocks the job)
+                        if CONFIG['bootstrap_python']:
+                            threading.Thread(target=run_bootstrap, args=(csv_path, piano_id), daemon=True).start()
 
                         # Switch to Design workspace for parameter updates
                         update_progress("Switching to Design workspace")
@@ -476,7 +941,8 @@ class ProbeDataHandler(adsk.core.CustomEventHandler):
                         # Add key parameters
                         for key_num, params in key_params.items():
                             prefix = f'Key{key_num}'
-                            for suffix, value in params.items():
+                            for suffix in FUSION_KEY_PARAMS:
+                                value = params[suffix]
                                 if value:  # Skip if value is None/0
                                     param_name = f'{prefix}{suffix}'
                                     param = user_params.itemByName(param_name)
@@ -609,17 +1075,24 @@ class ProbeDataHandler(adsk.core.CustomEventHandler):
                                 expected_filename = f"{section} Shaping.tap"
                             source_file = os.path.join(downloads_dir, expected_filename)
                             dest_name = f"{piano_id}.tap"
-                            dest_file = os.path.join(piano_folder, dest_name)
 
                             log(f"Looking for exported file: {source_file}")
 
                             if os.path.exists(source_file):
-                                log(f"Moving to {dest_file}")
-                                if os.path.exists(dest_file):
-                                    os.remove(dest_file)
-                                shutil.move(source_file, dest_file)
+                                # Staged until compacted and indexed - see finish_published_program
+                                staged_file = os.path.join(piano_folder, PUBLISH_STAGING_DIR, dest_name)
+                                log(f"Moving to {staged_file}")
+                                os.makedirs(os.path.dirname(staged_file), exist_ok=True)
+                                if os.path.exists(staged_file):
+                                    os.remove(staged_file)
+                                shutil.move(source_file, staged_file)
                                 log(f"File moved successfully")
                                 success = True
+
+                                # Compaction and indexing take seconds on a large program - keep them off the UI thread
+                                update_progress("Compacting and indexing G-code (background)", dest_name)
+                                threading.Thread(target=finish_published_program,
+                                                 args=(piano_folder, piano_id, staged_file), daemon=True).start()
                             else:
                                 log(f"ERROR: Exported file not found: {source_file}")
                         else:
@@ -629,9 +1102,13 @@ class ProbeDataHandler(adsk.core.CustomEventHandler):
 
             # Log final status with clear marker for FinalKeytopShaping to parse
             if piano_id != 'Unknown':
+                if mirror:
+                    mirror.flush()
+                    stats = mirror.stats()
+                    log(f"Logs mirror (since add-in start): {stats['hits']} hits, {stats['misses']} misses, "
+                        f"{stats['bytes_saved'] / 1e6:.1f} MB saved, {stats['cached_bytes'] / 1e6:.1f} MB cached")
                 if success:
-                    log(f"=== PROCESSING COMPLETE: SUCCESS ===")
-                    log(f"Output file: {dest_file if success else 'N/A'}")
+                    log("Publishing in the background - the SUCCESS marker follows once the program is in place")
                 else:
                     log(f"=== PROCESSING COMPLETE: FAILED ===")
 
@@ -768,6 +1245,15 @@ class WatchThread(threading.Thread):
                         # Delete trigger
                         os.remove(trigger_path)
 
+                        # Pull the piano folder into the local mirror alongside processing - reads
+                        # that come first copy their file themselves
+                        try:
+                            piano_id = json.loads(data).get('piano_id', '')
+                            if mirror and piano_id:
+                                threading.Thread(target=prefetch_piano_folder, args=(piano_id,), daemon=True).start()
+                        except Exception:
+                            pass
+
                         # Fire event
                         app.fireCustomEvent(custom_event_id, data)
 
@@ -818,6 +1304,8 @@ def stop(context):
             app.unregisterCustomEvent(custom_event_id)
 
         _handlers.clear()
+        if mirror:
+            mirror.flush()
 
         # Remove heartbeat file on clean shutdown
         try:
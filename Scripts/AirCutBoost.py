@@ -0,0 +1,241 @@
+"""
+Air Cut Boost - Speed up feed moves that cannot touch a key, using the probed key height and solved key outlines
+Fusion's stock sits above the real keytops, so ramps and passes above the probed height cut nothing
+A G1 move is air when its lowest point clears the top of every key outline within tool radius + margin of it
+Air moves get a higher feed (or become G0 well above the keys); the report compares estimated cycle times
+"""
+
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+
+import CycleTime
+import KeytopSolver
+import MachineConfig
+from GCodeReader import Toolpath
+from LogsMirror import mirror_path
+from NormalizeGCode import COMMENT_RE, WORD_RE, format_number
+
+AIR_FEED = 200.0  # Feed for air moves (ipm) - Mach4 clamps it to the axis limits
+SAFETY_MARGIN = 0.02  # Clearance kept above the key tops and around the key outlines
+SEATING_TOLERANCE = 0.025  # ProbeKeys placement check Z tolerance - added above every key's top
+RAPID_CLEARANCE = 0.1  # Air moves this far above the margin become G0
+DEFAULT_RADIUS = 0.5  # Tool radius when the program header does not list the tool
+PLAIN_WORDS = set('GXYZF')
+
+
+def key_tops(probe_data, key_params, key_height=None):
+    """Top Z of every solved key, plus the top assumed away from the keys
+
+    A probed top is one point at the key's front edge - the key can still sit tilted or
+    lifted behind it - so every key gets the placement check tolerance above the higher
+    of its own top probe and the key height (the probed average).
+    """
+    probed = {key_num: max(p['Z'] for p in data['5']) for key_num, data in probe_data.items() if data.get('5')}
+    if key_height is None:
+        if not probed:
+            raise ValueError("No key top probes - pass the key height (avg_z)")
+        key_height = KeytopSolver.median([p['Z'] for data in probe_data.values() for p in data.get('5', [])])
+    tops = {key_num: max(probed.get(key_num, key_height), key_height) + SEATING_TOLERANCE for key_num in key_params}
+    unprobed = max([key_height + SEATING_TOLERANCE] + list(tops.values()))
+    return tops, unprobed
+
+
+def outline_hits(x0, y0, x1, y1, params, clearance):
+    """Moves (segment arrays) passing within clearance of a key outline
+
+    The outline is the solver's key frame (rotated by the fitted angle about the key
+    center): between the outer walls, from the front face back. Segments are clipped
+    against it Liang-Barsky style.
+    """
+    angle = math.radians(params['raw_angle'])
+    cx, cy = params['center']
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+
+    def to_key(x, y):
+        dx, dy = x - cx, y - cy
+        return dx * cos_a - dy * sin_a + cx, dx * sin_a + dy * cos_a + cy
+
+    ax, ay = to_key(x0, y0)
+    bx, by = to_key(x1, y1)
+    dx, dy = bx - ax, by - ay
+    low, high = np.zeros(len(ax)), np.ones(len(ax))
+    inside = np.ones(len(ax), dtype=bool)
+    # p * t <= q for each side: left wall, right wall, front face
+    for p, q in ((-dx, ax - (params['xl_outer'] - clearance)),
+                 (dx, (params['xr_outer'] + clearance) - ax),
+                 (-dy, ay - (params['y_front'] - clearance))):
+        parallel = p == 0
+        inside &= ~(parallel & (q < 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = q / p
+        low = np.where(~parallel & (p < 0), np.maximum(low, t), low)
+        high = np.where(~parallel & (p > 0), np.minimum(high, t), high)
+    return inside & (low <= high)
+
+
+def classify(toolpath, key_params, tops, unprobed, margin=SAFETY_MARGIN, rapid_clearance=RAPID_CLEARANCE):
+    """(air, rapid) masks over the toolpath moves
+
+    air: G1 moves that clear the material by the margin. rapid: the air moves that also
+    clear it by the rapid clearance.
+    """
+    n = len(toolpath)
+    air = np.zeros(n, dtype=bool)
+    rapid = np.zeros(n, dtype=bool)
+    if n < 2:
+        return air, rapid
+
+    x0, y0, z0 = toolpath.x[:-1], toolpath.y[:-1], toolpath.z[:-1]
+    x1, y1, z1 = toolpath.x[1:], toolpath.y[1:], toolpath.z[1:]
+    z_low = np.minimum(z0, z1)
+    # Only moves above the lowest key top can be air; NaN (unknown start) never is
+    candidate = (toolpath.motion[1:] == 1) & ~toolpath.machine[1:] & ~toolpath.machine[:-1]
+    candidate &= z_low > min(tops.values(), default=unprobed) + margin
+    rows = np.flatnonzero(candidate)
+    if len(rows) == 0:
+        return air, rapid
+
+    radius = np.array([toolpath.tools[t]['diameter'] / 2 if t in toolpath.tools else DEFAULT_RADIUS
+                       for t in range(int(toolpath.tool.max()) + 1)])[toolpath.tool[rows + 1]]
+    clearance = radius + margin
+    top = np.full(len(rows), -np.inf)
+    touched = np.zeros(len(rows), dtype=bool)
+    for key_num, params in key_params.items():
+        hit = outline_hits(x0[rows], y0[rows], x1[rows], y1[rows], params, clearance)
+        top = np.where(hit, np.maximum(top, tops[key_num]), top)
+        touched |= hit
+    # Away from every outline there may still be keys the solver did not see
+    top = np.where(touched, top, unprobed)
+
+    air[rows + 1] = z_low[rows] > top + margin
+    rapid[rows + 1] = z_low[rows] > top + margin + rapid_clearance
+    return air, rapid
+
+
+def rewrite(lines, toolpath, air, rapid, air_feed=AIR_FEED, use_rapids=True):
+    """Program lines with the air moves sped up, restoring motion and feed on the lines after them"""
+    air_lines = set(toolpath.line[air & ~(rapid & use_rapids)].tolist())
+    rapid_lines = set(toolpath.line[rapid].tolist()) if use_rapids else set()
+    air_feed_text = format_number(air_feed)
+
+    program_motion = written_motion = None
+    program_feed = written_feed = None
+    boosted = 0
+    output = []
+    for number, line in enumerate(lines, 1):
+        code = COMMENT_RE.sub(' ', line).upper()
+        words = WORD_RE.findall(code)
+        if not words:
+            output.append(line)
+            continue
+        g_codes = [float(value) for letter, value in words if letter == 'G']
+        for g in g_codes:
+            if g in (0, 1, 2, 3):
+                program_motion = int(g)
+            elif g == 80 or 73 <= g <= 89:
+                program_motion = None
+        for letter, value in words:
+            if letter == 'F':
+                program_feed = format_number(float(value))
+
+        plain = all(letter in PLAIN_WORDS for letter, _ in words) and all(g in (0, 1) for g in g_codes)
+        if plain and (number in air_lines or number in rapid_lines):
+            axes = [f"{letter}{value}" for letter, value in words if letter in 'XYZ']
+            comments = COMMENT_RE.findall(line)
+            if number in rapid_lines:
+                new = ['G0'] + axes
+                written_motion = 0
+            else:
+                new = (['G1'] if written_motion != 1 else []) + axes
+                if written_feed != air_feed_text:
+                    new.append(f"F{air_feed_text}")
+                    written_feed = air_feed_text
+                written_motion = 1
+            output.append(" ".join(new + comments))
+            boosted += 1
+            continue
+
+        # Lines after a rewritten move get back the modal motion and feed the program expects
+        has_axis = any(letter in 'XYZ' for letter, _ in words)
+        prefix, suffix = [], []
+        if has_axis and program_motion is not None and written_motion != program_motion and \
+                not any(g in (0, 1, 2, 3) for g in g_codes):
+            prefix.append(f"G{program_motion}")
+        if has_axis and program_motion in (1, 2, 3) and program_feed is not None and \
+                written_feed != program_feed and 'F' not in [letter for letter, _ in words]:
+            suffix.append(f"F{program_feed}")
+        if prefix or suffix:
+            body, comment = line, ''
+            split = line.find('(') if '(' in line else line.find(';')
+            if split >= 0:
+                body, comment = line[:split].rstrip(), ' ' + line[split:]
+            line = " ".join(prefix + [body.strip()] + suffix) + comment
+        output.append(line)
+        if any(g in (0, 1, 2, 3) or g == 80 or 73 <= g <= 89 for g in g_codes) or prefix:
+            written_motion = program_motion
+        if 'F' in [letter for letter, _ in words] or suffix:
+            written_feed = program_feed
+    return output, boosted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speed up feed moves above the probed keys")
+    parser.add_argument('tap', help="G-code (.tap) file")
+    parser.add_argument('--csv', default=None, help="Probe CSV (default: <name>.csv next to the tap)")
+    parser.add_argument('--key-height', type=float, default=None,
+                        help="Probed key height (avg_z from the trigger) for keys without a top probe")
+    parser.add_argument('--output', default=None, help="Output file (default: <name>_air.tap)")
+    parser.add_argument('--air-feed', type=float, default=AIR_FEED, help="Feed for air moves (ipm)")
+    parser.add_argument('--margin', type=float, default=SAFETY_MARGIN, help="Clearance kept from the keys")
+    parser.add_argument('--rapid-clearance', type=float, default=RAPID_CLEARANCE,
+                        help="Extra clearance above which air moves become G0")
+    parser.add_argument('--no-rapids', action='store_true', help="Only raise the feed, never write G0")
+    parser.add_argument('--profile', default=MachineConfig.PROFILE_DIR, help="Mach4 profile folder (cycle times)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    csv_path = mirror_path(args.csv or os.path.splitext(args.tap)[0] + ".csv")
+    if not os.path.exists(csv_path):
+        parser.exit(1, f"No probe CSV: {csv_path}\n")
+    probe_data = KeytopSolver.parse_csv(csv_path)
+    key_params, _, key_height, _ = KeytopSolver.load_or_solve(csv_path, probe_data)
+    try:
+        tops, unprobed = key_tops(probe_data, key_params, args.key_height)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+
+    tap_path = mirror_path(args.tap)
+    toolpath = Toolpath.open(tap_path)
+    air, rapid = classify(toolpath, key_params, tops, unprobed, args.margin, args.rapid_clearance)
+    with open(tap_path, 'r') as f:
+        lines = f.read().splitlines()
+    output_lines, boosted = rewrite(lines, toolpath, air, rapid, args.air_feed, not args.no_rapids)
+
+    output = args.output or os.path.splitext(args.tap)[0] + '_air.tap'
+    tmp_path = output + '.part'
+    with open(tmp_path, 'w') as f:
+        f.write("\n".join(output_lines) + "\n")
+    os.replace(tmp_path, output)
+
+    limits = MachineConfig.axis_limits(os.path.join(args.profile, "Machine.ini"))
+    before, _, _ = CycleTime.estimate(toolpath, limits)
+    after, _, _ = CycleTime.estimate(Toolpath(output), limits)
+    print(f"{os.path.basename(args.tap)}: key tops {min(tops.values()):.4f} to {max(tops.values()):.4f} "
+          f"({unprobed:.4f} away from the keys), margin {args.margin}")
+    print(f"  {int(air.sum())} of {int(np.count_nonzero(toolpath.motion == 1))} feed moves are air, "
+          f"{boosted} lines rewritten ({int(rapid.sum()) if not args.no_rapids else 0} as G0)")
+    for tool in toolpath.tool_list():
+        mask = (toolpath.tool == tool) & air
+        if mask.any():
+            print(f"    T{tool}: {int(mask.sum())} air moves, {before[mask].sum():.0f}s at cutting feed")
+    print(f"  Estimated motion time {CycleTime.format_duration(before.sum())} -> "
+          f"{CycleTime.format_duration(after.sum())} (saves {before.sum() - after.sum():.0f}s)")
+    print(f"  -> {output} ({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""
+Apply Surface Map - Streaming Python version of ApplySurfaceMap in ScreenLoad.lua
+Same SurfaceMap.txt, refZ at the work origin and G90/G91 handling; Z is interpolated in NumPy batches
+Long feed moves can be subdivided (max length and/or chordal tolerance) so Z follows the surface
+With subdivision off the output is byte-for-byte what the Lua function writes to TempSurfaceMapped.tap
+"""
+
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+
+from NormalizeGCode import ARC_TOLERANCE, normalize_lines
+from SurfaceMap import SURFACE_MAPS_DIR, load_map
+
+MAP_PATH = os.path.join(SURFACE_MAPS_DIR, "SurfaceMap.txt")
+OUTPUT_PATH = os.path.join(os.path.dirname(SURFACE_MAPS_DIR), "TempSurfaceMapped.tap")
+BATCH_LINES = 8192
+
+# Lua patterns from ApplySurfaceMap, translated one for one
+COORD_RE = re.compile(r'[XYZ]-?\d', re.ASCII)
+COMMENT_LINE_RE = re.compile(r'\s*[(;]', re.ASCII)
+COMMENT_RE = re.compile(r'[;(]')
+X_RE = re.compile(r'[Xx](-?\d*\.?\d+)', re.ASCII)
+Y_RE = re.compile(r'[Yy](-?\d*\.?\d+)', re.ASCII)
+Z_RE = re.compile(r'[Zz](-?\d*\.?\d+)', re.ASCII)
+Z_WORD_RE = re.compile(r'([Zz])-?\d*\.?\d+', re.ASCII)
+ARC_RE = re.compile(r'G[23](?:\D|$)', re.ASCII)
+CYCLE_RE = re.compile(r'G8[1-9]', re.ASCII)
+OFFSET_RE = re.compile(r'G5[4-9](?:\.\d)?(?!\d)', re.ASCII)
+
+# Subdivision only touches plain feed moves, so no other word changes when it takes effect
+MOTION_RE = re.compile(r'G0*([0-3])(?![\d.])', re.ASCII)
+PLAIN_MOVE_RE = re.compile(r'\s*(?:[GNXYZF][-+]?[\d.]+\s*)+$', re.ASCII)
+F_RE = re.compile(r'[Ff][-+]?[\d.]+', re.ASCII)
+
+
+def check_program(path, normalized=False):
+    """Raise ValueError for programs ApplySurfaceMap cannot compensate (arcs, canned cycles, offset changes)
+
+    With normalized=True arcs and cycles are allowed - they are expanded by NormalizeGCode first.
+    """
+    arcs = cycles = 0
+    offsets = set()
+    with open(path, 'r') as f:
+        for line in f:
+            upper = line.rstrip('\n').upper()
+            if ARC_RE.search(upper):
+                arcs += 1
+            if CYCLE_RE.search(upper):
+                cycles += 1
+            offsets.update(OFFSET_RE.findall(upper))
+
+    issues = []
+    if arcs and not normalized:
+        issues.append(f"{arcs} arc moves (G2/G3)")
+    if cycles and not normalized:
+        issues.append(f"{cycles} canned cycles (G8x)")
+    if len(offsets) > 1:
+        issues.append(f"work offset changes ({', '.join(sorted(offsets))})")
+    if issues:
+        raise ValueError(f"Cannot apply surface map to {path}: " + "; ".join(issues))
+
+
+def split_points(surface_map, x0, y0, x1, y1, max_length=None, tolerance=None):
+    """Interior points for XY segments in machine coordinates
+
+    Returns (segment, t): segment index and 0 < t < 1 of every added point, in order.
+    max_length splits into equal pieces no longer than max_length. tolerance first
+    splits at every grid line crossed (where the bilinear surface has a kink), then
+    splits each piece until its chord is within tolerance of the surface twist.
+    """
+    count = len(x0)
+    dx, dy = x1 - x0, y1 - y0
+    length = np.hypot(dx, dy)
+    segments = [np.arange(count), np.arange(count)]
+    params = [np.zeros(count), np.ones(count)]
+
+    if tolerance:
+        grids = ((surface_map.x_min, surface_map.x_max, surface_map.x_count, x0, dx),
+                 (surface_map.y_min, surface_map.y_max, surface_map.y_count, y0, dy))
+        for low, high, nodes, start, delta in grids:
+            step = (high - low) / (nodes - 1)
+            g0 = (start - low) / step
+            g1 = (start + delta - low) / step
+            first = np.maximum(np.floor(np.minimum(g0, g1)) + 1, 0)
+            last = np.minimum(np.ceil(np.maximum(g0, g1)) - 1, nodes - 1)
+            crossings = np.maximum(last - first + 1, 0).astype(np.int64)
+            segment = np.repeat(np.arange(count), crossings)
+            offset = np.arange(len(segment)) - np.repeat(np.cumsum(crossings) - crossings, crossings)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = (first[segment] + offset - g0[segment]) / (g1 - g0)[segment]
+            inside = (t > 1e-9) & (t < 1 - 1e-9)
+            segments.append(segment[inside])
+            params.append(t[inside])
+
+    segment = np.concatenate(segments)
+    t = np.concatenate(params)
+    order = np.lexsort((t, segment))
+    segment, t = segment[order], t[order]
+    keep = np.r_[True, (segment[1:] != segment[:-1]) | (t[1:] - t[:-1] > 1e-9)]
+    segment, t = segment[keep], t[keep]
+
+    # Pieces between consecutive breakpoints of the same segment
+    joined = segment[1:] == segment[:-1]
+    piece_segment = segment[:-1][joined]
+    t_start, t_end = t[:-1][joined], t[1:][joined]
+    piece_length = length[piece_segment] * (t_end - t_start)
+    pieces = np.ones(len(piece_segment))
+    if max_length:
+        pieces = np.maximum(pieces, np.ceil(piece_length / max_length))
+    if tolerance:
+        middle = (t_start + t_end) / 2
+        twist = surface_map.twist(x0[piece_segment] + dx[piece_segment] * middle,
+                                  y0[piece_segment] + dy[piece_segment] * middle)
+        # Along a line through a cell Z is quadratic with Z'' = 2 * twist * ux * uy; chord error = Z'' h^2 / 8
+        ux = dx[piece_segment] / length[piece_segment]
+        uy = dy[piece_segment] / length[piece_segment]
+        curvature = np.abs(2 * twist * ux * uy)
+        pieces = np.maximum(pieces, np.ceil(piece_length * np.sqrt(curvature / (8 * tolerance))))
+    pieces = pieces.astype(np.int64)
+
+    # Points j/pieces along every piece (j = 1..pieces), minus each segment's own end point
+    point_piece = np.repeat(np.arange(len(pieces)), pieces)
+    j = np.arange(len(point_piece)) - np.repeat(np.cumsum(pieces) - pieces, pieces) + 1
+    point_t = t_start[point_piece] + (t_end - t_start)[point_piece] * j / pieces[point_piece]
+    interior = ~((j == pieces[point_piece]) & (t_end[point_piece] == 1))
+    return piece_segment[point_piece][interior], point_t[interior]
+
+
+class SurfaceCompensator:
+    """Line-by-line state of ApplySurfaceMap, applied to batches of lines"""
+
+    def __init__(self, surface_map, work_offset, max_length=None, tolerance=None):
+        self.map = surface_map
+        self.offset_x, self.offset_y = work_offset
+        self.max_length = max_length
+        self.tolerance = tolerance
+        self.subdivide = bool(max_length or tolerance)
+
+        # refZ at the work origin (X0Y0) so that point has zero compensation
+        self.ref_z = float(surface_map.interpolate(np.array([self.offset_x]), np.array([self.offset_y]))[0])
+
+        self.cur_x = self.cur_y = self.cur_z = 0.0  # Programmed position
+        self.cur_adjusted_z = 0.0  # Adjusted Z, for G91 deltas
+        self.absolute = True
+        self.motion = 0
+        self.moved = False  # cur_x/cur_y are a real position (not the 0,0 start)
+        self.lines = self.compensated = self.added = 0
+        self.max_correction = 0.0
+
+    def process(self, lines):
+        """Compensate a batch of lines, returns the output lines"""
+        # Pass 1: modal state and target positions, exactly as the Lua loop tracks them
+        moves = []  # (index, nx, ny, nz, absolute, split)
+        targets = []
+        starts = []
+        for i, line in enumerate(lines):
+            upper = line.upper()
+            # Substring checks like the Lua (G91.1 in the header also switches to incremental until the next G90)
+            if 'G90' in upper:
+                self.absolute = True
+            if 'G91' in upper:
+                self.absolute = False
+            if self.subdivide:
+                comment = COMMENT_RE.search(upper)
+                code = upper[:comment.start()] if comment else upper
+                for motion in MOTION_RE.findall(code):
+                    self.motion = int(motion)
+
+            if 'G28' in upper or 'G30' in upper or 'G53' in upper or not COORD_RE.search(upper) \
+                    or COMMENT_LINE_RE.match(upper):
+                continue
+
+            nx, ny, nz = X_RE.search(line), Y_RE.search(line), Z_RE.search(line)
+            nx, ny, nz = (nx and nx.group(1)), (ny and ny.group(1)), (nz and nz.group(1))
+            if self.absolute:
+                tx = float(nx) if nx else self.cur_x
+                ty = float(ny) if ny else self.cur_y
+                tz = float(nz) if nz else self.cur_z
+            else:
+                tx = self.cur_x + (float(nx) if nx else 0)
+                ty = self.cur_y + (float(ny) if ny else 0)
+                tz = self.cur_z + (float(nz) if nz else 0)
+
+            split = (self.subdivide and self.absolute and self.motion == 1 and self.moved
+                     and (tx, ty) != (self.cur_x, self.cur_y) and PLAIN_MOVE_RE.match(line) is not None)
+            moves.append((i, nx, ny, nz, self.absolute, split))
+            targets.append((tx, ty, tz))
+            starts.append((self.cur_x, self.cur_y, self.cur_z))
+            self.cur_x, self.cur_y, self.cur_z = tx, ty, tz
+            self.moved = True
+
+        output = list(lines)
+        self.lines += len(lines)
+        if not moves:
+            return output
+
+        # Batch interpolation of every target in machine coordinates
+        targets = np.array(targets)
+        surface = self.map.interpolate(targets[:, 0] + self.offset_x, targets[:, 1] + self.offset_y)
+        adjusted = targets[:, 2] + (surface - self.ref_z)
+        self.max_correction = max(self.max_correction, float(np.abs(surface - self.ref_z).max()))
+
+        inserts = {}
+        split = np.array([move[5] for move in moves])
+        if split.any():
+            starts = np.array(starts)[split]
+            ends = targets[split]
+            segment, t = split_points(self.map, starts[:, 0] + self.offset_x, starts[:, 1] + self.offset_y,
+                                      ends[:, 0] + self.offset_x, ends[:, 1] + self.offset_y,
+                                      self.max_length, self.tolerance)
+            px = starts[segment, 0] + (ends[segment, 0] - starts[segment, 0]) * t
+            py = starts[segment, 1] + (ends[segment, 1] - starts[segment, 1]) * t
+            pz = starts[segment, 2] + (ends[segment, 2] - starts[segment, 2]) * t
+            pz = pz + (self.map.interpolate(px + self.offset_x, py + self.offset_y) - self.ref_z)
+            move_index = np.flatnonzero(split)[segment]
+            for k, point in zip(move_index.tolist(), zip(px.tolist(), py.tolist(), pz.tolist())):
+                inserts.setdefault(k, []).append(point)
+            self.added += len(segment)
+
+        # Pass 2: rewrite the lines
+        for k, ((i, nx, ny, nz, absolute, _), adjusted_z) in enumerate(zip(moves, adjusted.tolist())):
+            output_z = adjusted_z if absolute else adjusted_z - self.cur_adjusted_z
+            self.cur_adjusted_z = adjusted_z
+            line = lines[i]
+            if nz:
+                line = Z_WORD_RE.sub(lambda m: m.group(1) + "%.4f" % output_z, line)
+            elif nx or ny:
+                comment = COMMENT_RE.search(line)
+                if comment:
+                    line = line[:comment.start()] + " Z%.4f " % output_z + line[comment.start():]
+                else:
+                    line = line + " Z%.4f" % output_z
+
+            if k in inserts:
+                feed = F_RE.search(line)
+                points = [f"X{x:.4f} Y{y:.4f} Z{z:.4f}" for x, y, z in inserts[k]]
+                points[0] = "G1 " + points[0] + (" " + feed.group(0) if feed else "")
+                line = "\n".join(points) + "\n" + line
+            output[i] = line
+            self.compensated += 1
+        return output
+
+
+def apply_surface_map(gcode_path, output_path, work_offset, map_path=MAP_PATH, max_length=None, tolerance=None,
+                      normalize=False, arc_tolerance=ARC_TOLERANCE):
+    """Compensate a G-code file against a surface map, streaming it in batches
+
+    Lines are split and joined the way the Lua mapper in ScreenLoad.lua does it:
+    under Lua 5.1/5.2, gmatch("([^\n]*)\n?") yields one more empty line at the end
+    of any non-empty text, so table.concat ends the output with a newline. With
+    normalize, arcs and canned cycles are expanded to G1 moves on the way in.
+    Returns the compensator for its counts.
+    """
+    check_program(gcode_path, normalized=normalize)
+    compensator = SurfaceCompensator(load_map(map_path), work_offset, max_length, tolerance)
+
+    tmp_path = output_path + '.part'
+    with open(gcode_path, 'r') as src, open(tmp_path, 'w') as dst:
+        first = True
+        batch = []
+
+        def flush():
+            nonlocal first
+            text = "\n".join(compensator.process(batch))
+            dst.write(text if first else "\n" + text)
+            first = False
+            batch.clear()
+
+        lines = (line[:-1] if line.endswith('\n') else line for line in src)
+        if normalize:
+            lines = normalize_lines(lines, arc_tolerance)
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= BATCH_LINES:
+                flush()
+        if batch or not first:
+            batch.append("")  # The final empty gmatch line
+        if batch or first:
+            flush()
+    os.replace(tmp_path, output_path)
+    return compensator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply surface map Z compensation to a G-code file")
+    parser.add_argument('gcode', help="G-code file to compensate")
+    parser.add_argument('--offset', type=float, nargs=2, required=True, metavar=('X', 'Y'),
+                        help="Machine position of the work origin (active fixture offset X/Y)")
+    parser.add_argument('--map', default=MAP_PATH, help="Surface map (SurfaceMap.txt or SurfaceMap*.csv)")
+    parser.add_argument('--output', default=OUTPUT_PATH, help="Compensated output file")
+    parser.add_argument('--max-length', type=float, default=None, help="Split feed moves longer than this")
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help="Split feed moves until Z is within this of the surface")
+    parser.add_argument('--normalize', action='store_true', help="Expand arcs and canned cycles before mapping")
+    parser.add_argument('--arc-tolerance', type=float, default=ARC_TOLERANCE, help="Chord tolerance for arcs")
+    args = parser.parse_args()
+
+    start = time.time()
+    try:
+        result = apply_surface_map(args.gcode, args.output, args.offset, args.map, args.max_length, args.tolerance,
+                                   args.normalize, args.arc_tolerance)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    print(f"Surface map applied: {result.lines} lines, {result.compensated} compensated, "
+          f"{result.added} points added, max correction {result.max_correction:.4f} "
+          f"({time.time() - start:.2f}s) -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+"""
+Compact G-code - Merge collinear G1 moves and drop redundant words from exported shaping programs
+Runs of feed moves whose points all lie within a tolerance of one straight move become that move
+Repeated G0/G1 and F words and unchanged axis words are dropped, numbers are reformatted to a fixed precision
+verify() re-reads both programs and checks every original point against the compacted path
+The Fusion add-in (KeytopParametricUpdate) imports this module to compact each exported program before publishing it
+"""
+
+import argparse
+import math
+import os
+import re
+import time
+
+TOLERANCE = 0.0002  # Max distance of a dropped point from the merged move (program units)
+PRECISION = 4  # Decimals written for coordinates and feeds - the Fusion post's, arc lines are kept as written
+MAX_RUN = 500  # Most points merged into one move (bounds the collinearity check)
+
+WORD_RE = re.compile(r'([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+COMMENT_RE = re.compile(r'\([^)]*\)|;.*')
+TOOL_COMMENT_RE = re.compile(r'^\s*\(T\d+ D=')  # Tool table header - kept even when stripping comments
+AXES = 'XYZ'
+PLAIN_WORDS = set('GXYZF')
+SETUP_G = (10, 28, 30, 92)
+
+
+def format_number(value, precision=PRECISION):
+    """Fusion-style number: fixed decimals, trailing zeros dropped (1. and 0.)"""
+    text = f"{value:.{precision}f}".rstrip('0')
+    return '0.' if text == '-0.' else text
+
+
+def segment_distance(point, start, end):
+    """Distance from a point to the segment start-end (NaN if any coordinate is unknown)"""
+    return max_segment_distance([point], start, end)
+
+
+def max_segment_distance(points, start, end):
+    """Largest distance from any of the points to the segment start-end"""
+    sx, sy, sz = start
+    dx, dy, dz = end[0] - sx, end[1] - sy, end[2] - sz
+    length2 = dx * dx + dy * dy + dz * dz
+    worst = 0.0
+    for px, py, pz in points:
+        px, py, pz = px - sx, py - sy, pz - sz
+        t = 0.0 if length2 == 0 else max(0.0, min(1.0, (px * dx + py * dy + pz * dz) / length2))
+        ex, ey, ez = px - t * dx, py - t * dy, pz - t * dz
+        distance2 = ex * ex + ey * ey + ez * ez
+        if not distance2 <= worst:
+            if distance2 != distance2:
+                return math.nan
+            worst = distance2
+    return math.sqrt(worst)
+
+
+class ProgramState:
+    """Modal state of a program: absolute/incremental, motion mode, feed and position"""
+
+    def __init__(self):
+        self.absolute = True
+        self.motion = None
+        self.feed = None
+        self.position = [math.nan] * 3
+
+    def update(self, g_codes, values):
+        """Apply one line's words; returns True if the line moved to a known work position"""
+        machine = False
+        for g in g_codes:
+            if g == 90:
+                self.absolute = True
+            elif g == 91:
+                self.absolute = False
+            elif g in (0, 1, 2, 3):
+                self.motion = int(g)
+            elif g == 80 or 73 <= g <= 89:
+                self.motion = None  # Canned cycles leave Z at R or the initial level
+                self.position[2] = math.nan
+            elif g == 53 or g in SETUP_G:
+                machine = True
+        if 'F' in values:
+            self.feed = values['F']
+        has_axis = any(axis in values for axis in AXES)
+        if not has_axis:
+            return False
+        if machine or not self.absolute:
+            # Machine/reference moves and incremental moves leave the work position untracked
+            self.position = [math.nan if axis in values or not self.absolute else p
+                             for axis, p in zip(AXES, self.position)]
+            return False
+        self.position = [values.get(axis, p) for axis, p in zip(AXES, self.position)]
+        return self.motion is not None
+
+
+def parse_line(line):
+    """(code without comments, G numbers, other word values) of one line"""
+    code = COMMENT_RE.sub(' ', line).upper()
+    words = WORD_RE.findall(code)
+    g_codes = [float(value) for letter, value in words if letter == 'G']
+    values = {letter: float(value) for letter, value in words if letter != 'G'}
+    return code, words, g_codes, values
+
+
+def is_plain_move(code, words, g_codes, state):
+    """A G0/G1 (or modal) move of X/Y/Z/F words only, in absolute mode"""
+    if not words or any(letter not in PLAIN_WORDS for letter, _ in words) or not state.absolute:
+        return False
+    if len(g_codes) > 1 or any(g not in (0, 1) for g in g_codes):
+        return False
+    if len([letter for letter, _ in words if letter != 'G']) != len({letter for letter, _ in words if letter != 'G'}):
+        return False  # Repeated axis word - leave it to the controller
+    return bool(g_codes) or state.motion in (0, 1)
+
+
+class Compactor:
+    """Streams a program, merging collinear feed moves and dropping words the modal state already has"""
+
+    def __init__(self, tolerance=TOLERANCE, precision=PRECISION, strip_comments=False):
+        self.tolerance = tolerance
+        self.precision = precision
+        self.strip_comments = strip_comments
+        self.state = ProgramState()  # State of the input
+        self.written = {'motion': None, 'feed': None, 'position': [None] * 3}  # As far as the output has set it
+        self.run = []  # Pending feed-move points after the last written position
+        self.run_start = None
+        self.lines_in = self.lines_out = self.merged = 0
+
+    def text(self, value):
+        return format_number(value, self.precision)
+
+    def move_line(self, motion, feed, point):
+        """Shortest line reaching a point from the written state (None if it changes nothing)"""
+        words = []
+        if motion != self.written['motion']:
+            words.append(f"G{motion}")
+        for index, axis in enumerate(AXES):
+            if math.isnan(point[index]):
+                continue
+            value = self.text(point[index])
+            if value != self.written['position'][index]:
+                words.append(f"{axis}{value}")
+        moved = any(word[0] in AXES for word in words)
+        if feed is not None and motion != 0 and self.text(feed) != self.written['feed'] and moved:
+            words.append(f"F{self.text(feed)}")
+        if not moved:
+            return None
+        self.written['motion'] = motion
+        if motion != 0 and feed is not None:
+            self.written['feed'] = self.text(feed)
+        for index in range(3):
+            if not math.isnan(point[index]):
+                self.written['position'][index] = self.text(point[index])
+        return " ".join(words)
+
+    def flush(self):
+        """Write the pending run as one move"""
+        if not self.run:
+            return []
+        point, feed = self.run[-1]
+        self.merged += len(self.run) - 1
+        self.run = []
+        line = self.move_line(1, feed, point)
+        return [line] if line else []
+
+    def can_extend(self, point, feed):
+        """True if the pending run plus a point is still one straight move within tolerance"""
+        if not self.run or len(self.run) >= MAX_RUN or feed != self.run[-1][1]:
+            return False
+        if any(math.isnan(c) for c in point) or any(math.isnan(c) for c in self.run_start):
+            return False
+        return max_segment_distance([p for p, _ in self.run], self.run_start, point) <= self.tolerance
+
+    def passthrough(self, line, code, g_codes, values):
+        """Write a line unchanged (comments optionally stripped) and record what it sets"""
+        output = []
+        if 'F' not in values and any(axis in values for axis in AXES) and self.state.feed is not None \
+                and self.text(self.state.feed) != self.written['feed']:
+            # An F word dropped from an earlier line is still due before this move
+            self.written['feed'] = self.text(self.state.feed)
+            output.append(f"F{self.written['feed']}")
+        self.state.update(g_codes, values)
+        if 'M' in values or 'T' in values:
+            # Macros (M6 tool change, probing) run their own moves - write every word again afterwards
+            self.written = {'motion': None, 'feed': None, 'position': [None] * 3}
+        if any(g in (0, 1, 2, 3) or g == 80 or 73 <= g <= 89 for g in g_codes):
+            self.written['motion'] = self.state.motion
+        if 'F' in values:
+            self.written['feed'] = self.text(values['F'])
+        for index, axis in enumerate(AXES):
+            if axis in values or math.isnan(self.state.position[index]):
+                p = self.state.position[index]
+                self.written['position'][index] = None if math.isnan(p) else self.text(p)
+        if self.strip_comments and not TOOL_COMMENT_RE.match(line):
+            line = " ".join(code.split())
+            if not line:
+                return output
+        return output + [line]
+
+    def process(self, line):
+        """Output lines for one input line"""
+        self.lines_in += 1
+        code, words, g_codes, values = parse_line(line)
+        if not words:
+            if self.strip_comments and not TOOL_COMMENT_RE.match(line):
+                return []
+            return self.flush() + [line]
+
+        if not is_plain_move(code, words, g_codes, self.state):
+            return self.flush() + self.passthrough(line, code, g_codes, values)
+
+        start = list(self.state.position)
+        self.state.update(g_codes, values)
+        point, motion, feed = list(self.state.position), self.state.motion, self.state.feed
+        if not any(axis in values for axis in AXES):
+            return self.flush()  # F (or G0/G1) only - written with the next move that needs it
+
+        if motion == 1:
+            if self.can_extend(point, feed):
+                self.run.append((point, feed))
+                return []
+            output = self.flush()
+            self.run_start = start
+            self.run = [(point, feed)]
+            return output
+        output = self.flush()
+        line = self.move_line(motion, feed, point)
+        return output + ([line] if line else [])
+
+    def finish(self):
+        return self.flush()
+
+
+def compact_lines(lines, compactor):
+    """Stream output lines for an iterable of input lines (without newlines)"""
+    for line in lines:
+        for out in compactor.process(line):
+            compactor.lines_out += 1
+            yield out
+    for out in compactor.finish():
+        compactor.lines_out += 1
+        yield out
+
+
+def program_points(lines):
+    """Points a program moves through: [(line number, motion, feed, (x, y, z))]
+
+    Machine/reference moves appear as motion None with the untracked axes NaN.
+    """
+    state = ProgramState()
+    points = []
+    for number, line in enumerate(lines, 1):
+        _, words, g_codes, values = parse_line(line)
+        if not words:
+            continue
+        if state.update(g_codes, values):
+            points.append((number, state.motion, state.feed if state.motion != 0 else None, tuple(state.position)))
+        elif any(axis in values for axis in AXES):
+            points.append((number, None, None, tuple(state.position)))
+    return points
+
+
+def same_point(a, b, epsilon):
+    return all((math.isnan(p) and math.isnan(q)) or abs(p - q) <= epsilon for p, q in zip(a, b))
+
+
+def verify(original_lines, compacted_lines, tolerance=TOLERANCE, precision=PRECISION):
+    """Check that the compacted program follows the original within tolerance
+
+    Every compacted point must be an original point (within the rounding of the output
+    precision), in order, with the same motion mode and feed. The original points skipped
+    between two compacted points must be feed moves within tolerance of the compacted move,
+    plus the rounding of its end points when the output has fewer decimals than the original.
+    Returns a dict: original/compacted points, max deviation, max rounding and the first failure.
+    """
+    original = program_points(original_lines)
+    compacted = program_points(compacted_lines)
+    epsilon = 0.5 * 10 ** -precision + 1e-9
+    limit = tolerance + epsilon * math.sqrt(3)
+    result = {'original_points': len(original), 'compacted_points': len(compacted),
+              'max_deviation': 0.0, 'max_rounding': 0.0, 'failure': None}
+
+    i = 0
+    previous = None
+    for number, motion, feed, point in compacted:
+        skipped = []
+        while i < len(original):
+            o_number, o_motion, o_feed, o_point = original[i]
+            feed_match = (feed is None and o_feed is None) or \
+                (feed is not None and o_feed is not None and abs(feed - o_feed) <= epsilon)
+            if o_motion == motion and feed_match and same_point(o_point, point, epsilon):
+                break
+            skipped.append(original[i])
+            i += 1
+        if i == len(original):
+            result['failure'] = f"compacted line {number}: no matching original move"
+            return result
+        o_point = original[i][3]
+        rounding = max((abs(p - q) for p, q in zip(o_point, point) if not math.isnan(p)), default=0.0)
+        result['max_rounding'] = max(result['max_rounding'], rounding)
+        for s_number, s_motion, s_feed, s_point in skipped:
+            if previous is not None and same_point(s_point, previous, 2 * epsilon):
+                continue  # Zero-length move once rounded
+            if motion != 1 or s_motion != 1 or previous is None or abs(s_feed - feed) > epsilon:
+                result['failure'] = f"original line {s_number}: move missing from the compacted program"
+                return result
+            deviation = segment_distance(s_point, previous, point)
+            if not deviation <= limit:
+                result['failure'] = f"original line {s_number}: {deviation:.5f} from the compacted path"
+                return result
+            result['max_deviation'] = max(result['max_deviation'], deviation)
+        previous = point
+        i += 1
+
+    for s_number, s_motion, _, s_point in original[i:]:
+        if previous is None or not same_point(s_point, previous, 2 * epsilon):
+            result['failure'] = f"original line {s_number}: move missing from the compacted program"
+            return result
+    return result
+
+
+def compact_file(in_path, out_path, tolerance=TOLERANCE, precision=PRECISION, strip_comments=False):
+    """Write a compacted copy of a program and verify it, returns (compactor, verification)"""
+    with open(in_path, 'r') as f:
+        original = f.read().splitlines()
+    compactor = Compactor(tolerance, precision, strip_comments)
+    compacted = list(compact_lines(original, compactor))
+    verification = verify(original, compacted, tolerance, precision)
+    tmp_path = out_path + '.part'
+    with open(tmp_path, 'w') as f:
+        f.write("\n".join(compacted) + "\n")
+    os.replace(tmp_path, out_path)
+    return compactor, verification
+
+
+def write_report(path, in_path, out_path, compactor, verification, tolerance):
+    """Verification report next to the program"""
+    in_size, out_size = os.path.getsize(in_path), os.path.getsize(out_path)
+    with open(path, 'w') as f:
+        f.write("===== G-code Compaction Report =====\n")
+        f.write(f"Original:  {os.path.basename(in_path)}  {compactor.lines_in} lines, {in_size} bytes\n")
+        f.write(f"Compacted: {os.path.basename(out_path)}  {compactor.lines_out} lines, {out_size} bytes "
+                f"({100 * (1 - out_size / max(in_size, 1)):.1f}% smaller)\n")
+        f.write(f"Date:      {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        f.write(f"Tolerance: {tolerance:.5f}\"  Merged moves: {compactor.merged}\n")
+        f.write(f"Points checked: {verification['original_points']} original, "
+                f"{verification['compacted_points']} compacted\n")
+        f.write(f"Max deviation: {verification['max_deviation']:.6f}\"  "
+                f"Max rounding: {verification['max_rounding']:.6f}\"\n\n")
+        if verification['failure']:
+            f.write(f"RESULT: FAIL -- {verification['failure']}\n")
+        else:
+            f.write("RESULT: PASS -- Compacted path is within tolerance of the original.\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge collinear moves and drop redundant words from a program")
+    parser.add_argument('gcode', help="G-code file to compact")
+    parser.add_argument('--output', default=None, help="Output file (default: <name>_compact.tap)")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Max deviation of merged points")
+    parser.add_argument('--precision', type=int, default=PRECISION, help="Decimals written (not below the post's)")
+    parser.add_argument('--strip-comments', action='store_true', help="Drop comments (tool table header is kept)")
+    parser.add_argument('--report', action='store_true', help="Write <output>_CompactReport.txt")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.gcode)[0] + '_compact.tap'
+    start = time.time()
+    compactor, verification = compact_file(args.gcode, output, args.tolerance, args.precision, args.strip_comments)
+    print(f"{compactor.lines_in} -> {compactor.lines_out} lines, {compactor.merged} moves merged, "
+          f"{os.path.getsize(args.gcode)} -> {os.path.getsize(output)} bytes ({time.time() - start:.2f}s) -> {output}")
+    print(f"Max deviation {verification['max_deviation']:.6f}, max rounding {verification['max_rounding']:.6f}: "
+          f"{'FAIL - ' + verification['failure'] if verification['failure'] else 'PASS'}")
+    if args.report:
+        report_path = os.path.splitext(output)[0] + '_CompactReport.txt'
+        write_report(report_path, args.gcode, output, compactor, verification, args.tolerance)
+        print(f"Report: {report_path}")
+    if verification['failure']:
+        parser.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+Cycle Time - Acceleration-aware run time estimate for a shaping program
+Each move gets a trapezoidal velocity profile limited by the per-axis velocity/acceleration in Machine.ini
+Corner speeds use a junction-deviation limit; the machine stops at tool changes, G53 moves and rapid/feed switches
+Reports the total, the time per tool and the time per key region (key outlines from the solved probe CSV)
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+import KeytopSolver
+import MachineConfig
+from GCodeReader import Toolpath, FLAG_TOOL_CHANGE
+from LogsMirror import mirror_path
+
+TOOL_CHANGE_SECONDS = 45.0  # M6 macro: retract, pocket drop-off, air blow-off, pick-up, sensor checks
+JUNCTION_DEVIATION = 0.002  # Corner rounding allowed by the planner (units) - sets the corner speed limit
+MIN_LENGTH = 1e-7  # Shorter moves are ignored (same point repeated)
+
+
+def retract_positions(toolpath, fixtures, tools):
+    """Work positions (N, 3) with each G53 move as a retract to machine Z0
+
+    Gaps are filled as in filled_positions. A G53 move
+    leaves the work Z column unchanged, so the rows after it keep the retract height
+    until the program moves Z again. The retract height is -(fixture Z + tool length);
+    without the tables the highest Z in the program is used.
+    """
+    positions = filled_positions(toolpath)
+    machine_rows = np.flatnonzero(toolpath.machine)
+    if len(machine_rows) == 0:
+        return positions
+    work_z = positions[~toolpath.machine, 2]
+    fallback = float(work_z.max()) if len(work_z) else 0.0
+    retract = np.full(len(machine_rows), fallback)
+    for k, row in enumerate(machine_rows):
+        fixture = fixtures.get(MachineConfig.fixture_number(toolpath.offset[row])) if toolpath.offset[row] else None
+        tool = tools.get(int(toolpath.tool[row]))
+        if fixture and tool:
+            retract[k] = -(fixture[2] + tool['length'])
+
+    retracted, group = retracted_rows(toolpath, positions[:, 2])
+    positions[retracted, 2] = retract[group[retracted]]
+    return positions
+
+
+def filled_positions(toolpath):
+    """Work positions (N, 3), each gap filled with the last known value (the first known value at the start)"""
+    positions = np.column_stack([toolpath.x, toolpath.y, toolpath.z]).astype(np.float64)
+    for axis in range(3):
+        column = positions[:, axis]
+        known = np.flatnonzero(~np.isnan(column))
+        if len(known):
+            column[:known[0]] = column[known[0]]
+            index = np.maximum.accumulate(np.where(np.isnan(column), 0, np.arange(len(column))))
+            positions[:, axis] = column[index]
+        else:
+            positions[:, axis] = 0.0
+    return positions
+
+
+def retracted_rows(toolpath, z):
+    """(mask of the rows still at a G53 move's Z, index among the G53 moves of the last one at or before each row)
+
+    z is the work Z column with its gaps filled. A row is retracted from its G53 move
+    until the program moves Z to a different value.
+    """
+    machine_rows = np.flatnonzero(toolpath.machine)
+    group = np.cumsum(toolpath.machine) - 1  # Index of the last G53 move at or before each row
+    after = group >= 0
+    if len(machine_rows) == 0:
+        return after, group
+    stale = np.where(after, z[machine_rows[np.maximum(group, 0)]], np.nan)
+    rows = np.arange(len(z))
+    last_change = np.maximum.accumulate(np.where(z != stale, rows, -1))
+    retracted = after & (last_change < machine_rows[np.maximum(group, 0)] + 1)
+    retracted[machine_rows] = True
+    return retracted, group
+
+
+def forward_limit(squared, gain):
+    """Max squared speed at each node reachable from the earlier nodes' limits
+
+    w[k] = min over m <= k of squared[m] + (gain[m] + ... + gain[k-1]), as a running minimum.
+    """
+    reach = np.concatenate([[0.0], np.cumsum(gain)])
+    return reach + np.minimum.accumulate(squared - reach)
+
+
+def segment_times(length, v_entry, v_exit, v_max, accel):
+    """Trapezoidal (or triangular, if the cruise speed is never reached) move times"""
+    accelerate = (v_max ** 2 - v_entry ** 2) / (2 * accel)
+    decelerate = (v_max ** 2 - v_exit ** 2) / (2 * accel)
+    cruise = length - accelerate - decelerate
+    trapezoid = (v_max - v_entry) / accel + (v_max - v_exit) / accel + np.maximum(cruise, 0) / v_max
+    v_peak = np.sqrt(np.maximum((2 * accel * length + v_entry ** 2 + v_exit ** 2) / 2, 0))
+    triangle = (2 * v_peak - v_entry - v_exit) / accel
+    return np.where(cruise >= 0, trapezoid, triangle)
+
+
+def estimate(toolpath, limits, fixtures=None, tools=None, junction_deviation=JUNCTION_DEVIATION):
+    """Per-move times (seconds) for a toolpath, plus the per-move lengths and feed-rate-only times
+
+    Arcs are timed as their chords - normalize the program first (NormalizeGCode) for arc-heavy files.
+    """
+    positions = retract_positions(toolpath, fixtures or {}, tools or {})
+    velocity = np.array([limits[axis]['velocity'] for axis in MachineConfig.AXES])
+    accel_limit = np.array([limits[axis]['accel'] for axis in MachineConfig.AXES])
+
+    n = len(positions)
+    times = np.zeros(n)
+    lengths = np.zeros(n)
+    nominal = np.zeros(n)
+    if n < 2:
+        return times, lengths, nominal
+
+    delta = np.diff(positions, axis=0)  # Move k + 1 goes from row k to row k + 1
+    length = np.linalg.norm(delta, axis=1)
+    rapid = (toolpath.motion[1:] == 0) | toolpath.machine[1:]
+    stop = ((toolpath.flags & FLAG_TOOL_CHANGE) != 0) | toolpath.machine
+    stop[1:] |= rapid != np.r_[True, rapid[:-1]]
+
+    moving = np.flatnonzero(length > MIN_LENGTH)
+    if len(moving) == 0:
+        return times, lengths, nominal
+    # A stop on a skipped (zero-length) row still stops the next real move
+    stops = np.cumsum(stop)
+    stop_before = np.diff(np.concatenate([[0], stops[moving + 1]])) > 0
+
+    length = length[moving]
+    unit = delta[moving] / length[:, None]
+    with np.errstate(divide='ignore'):
+        axis_speed = np.min(velocity / np.abs(unit), axis=1)
+        accel = np.min(accel_limit / np.abs(unit), axis=1)
+    feed = toolpath.f[moving + 1] / 60
+    feed = np.where(np.isnan(feed) | (feed <= 0), axis_speed, feed)
+    v_max = np.where(rapid[moving], axis_speed, np.minimum(feed, axis_speed))
+
+    # Junction speed: the circular arc of the allowed deviation tangent to both moves
+    cos_theta = np.clip(-np.sum(unit[:-1] * unit[1:], axis=1), -1, 1)
+    sin_half = np.sqrt(0.5 * (1 - cos_theta))
+    corner_accel = np.minimum(accel[:-1], accel[1:])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        junction = corner_accel * junction_deviation * sin_half / (1 - sin_half)
+    junction = np.where(sin_half >= 1, np.inf, junction)
+    junction = np.minimum(junction, np.minimum(v_max[:-1], v_max[1:]) ** 2)
+    junction[stop_before[1:]] = 0.0
+    node_limit = np.concatenate([[0.0], junction, [0.0]])
+
+    # Forward (acceleration) and backward (deceleration) passes over squared node speeds
+    gain = 2 * accel * length
+    forward = forward_limit(node_limit, gain)
+    backward = forward_limit(node_limit[::-1], gain[::-1])[::-1]
+    speed = np.sqrt(np.maximum(np.minimum(forward, backward), 0))
+
+    times[moving + 1] = segment_times(length, speed[:-1], speed[1:], v_max, accel)
+    lengths[moving + 1] = length
+    nominal[moving + 1] = length / v_max
+    return times, lengths, nominal
+
+
+def key_regions(toolpath, key_params):
+    """Key number of each move's region, by the X midpoint of the move (0 outside the keys)
+
+    Key regions split at the midpoints between neighbouring key centers, and extend half a
+    key width past the end keys.
+    """
+    keys = sorted(key_params, key=lambda key_num: key_params[key_num]['X'])
+    centers = np.array([key_params[key_num]['X'] for key_num in keys])
+    x = np.nan_to_num(toolpath.x, nan=np.nan_to_num(np.nanmedian(toolpath.x)))
+    middle = np.r_[x[0], (x[1:] + x[:-1]) / 2]
+    index = np.clip(np.searchsorted((centers[1:] + centers[:-1]) / 2, middle), 0, len(keys) - 1)
+    widths = np.array([key_params[key_num]['Width'] for key_num in keys])
+    inside = np.abs(middle - centers[index]) <= np.maximum(widths[index] / 2, np.r_[np.diff(centers), 0][index])
+    inside &= ~toolpath.machine
+    return np.where(inside, np.array(keys)[index], 0)
+
+
+def format_duration(seconds):
+    """h:mm:ss"""
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the run time of a shaping program")
+    parser.add_argument('tap', help="G-code (.tap) file")
+    parser.add_argument('--profile', default=MachineConfig.PROFILE_DIR, help="Mach4 profile folder")
+    parser.add_argument('--csv', default=None, help="Probe CSV for per-key times (default: <name>.csv next to the tap)")
+    parser.add_argument('--tool-change', type=float, default=TOOL_CHANGE_SECONDS, help="Seconds per tool change")
+    parser.add_argument('--junction-deviation', type=float, default=JUNCTION_DEVIATION,
+                        help="Corner deviation for the junction speed limit")
+    parser.add_argument('--keys', action='store_true', help="List the time for every key region")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    toolpath = Toolpath.open(mirror_path(args.tap))
+    limits = MachineConfig.axis_limits(os.path.join(args.profile, "Machine.ini"))
+    try:
+        fixtures = MachineConfig.fixture_offsets(os.path.join(args.profile, "FixtureTables", "fixturetable.tls"))
+        tools = MachineConfig.tool_table(os.path.join(args.profile, "ToolTables", "tooltable.tls"))
+    except OSError:
+        print("No fixture/tool tables - G53 retracts go to the highest program Z")
+        fixtures, tools = {}, {}
+
+    times, lengths, nominal = estimate(toolpath, limits, fixtures, tools, args.junction_deviation)
+    changes = int(np.count_nonzero(toolpath.flags & FLAG_TOOL_CHANGE))
+    cutting = (toolpath.motion != 0) & ~toolpath.machine
+    total = times.sum() + changes * args.tool_change
+
+    print(f"{os.path.basename(args.tap)}: {len(toolpath)} moves, {changes} tool changes")
+    print(f"  Estimated: {format_duration(total)}  (motion {format_duration(times.sum())}, "
+          f"tool changes {format_duration(changes * args.tool_change)})")
+    print(f"  Feed-rate only: {format_duration(nominal.sum())}  "
+          f"(acceleration adds {times.sum() - nominal.sum():.0f}s)")
+    print(f"  Cutting {lengths[cutting].sum():.1f} in, {format_duration(times[cutting].sum())}; "
+          f"rapids {lengths[~cutting].sum():.1f} in, {format_duration(times[~cutting].sum())}")
+
+    print("  Per tool:")
+    change_rows = (toolpath.flags & FLAG_TOOL_CHANGE) != 0
+    for tool in toolpath.tool_list():
+        mask = toolpath.tool == tool
+        tool_changes = int(np.count_nonzero(change_rows & mask))
+        info = toolpath.tools.get(tool)
+        print(f"    T{tool}: {format_duration(times[mask].sum() + tool_changes * args.tool_change)}  "
+              f"cutting {format_duration(times[mask & cutting].sum())}, {tool_changes} change(s)"
+              + (f"  {info['description']}" if info else ""))
+
+    csv_path = args.csv or os.path.splitext(args.tap)[0] + ".csv"
+    if os.path.exists(mirror_path(csv_path)):
+        key_params, _, _, source = KeytopSolver.load_or_solve(mirror_path(csv_path))
+        regions = key_regions(toolpath, key_params)
+        key_times = np.bincount(regions, weights=times, minlength=max(key_params) + 1)
+        in_keys = [key_num for key_num in sorted(key_params) if key_times[key_num] > 0]
+        print(f"  Per key ({source} key outlines): {format_duration(key_times[1:].sum())} over "
+              f"{len(in_keys)} keys, {format_duration(key_times[0])} outside the keys")
+        if in_keys:
+            slowest = max(in_keys, key=lambda key_num: key_times[key_num])
+            print(f"    Mean {key_times[in_keys].mean():.0f}s per key, slowest key {slowest} "
+                  f"({key_times[slowest]:.0f}s)")
+        if args.keys:
+            for key_num in in_keys:
+                print(f"    Key {key_num}: {key_times[key_num]:.1f}s")
+    print(f"  ({(time.perf_counter() - start) * 1000:.0f}ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""
+Envelope Check - Pre-flight check of a program in machine coordinates before cycle start
+Every move is converted with its work offset (fixture table) and G43 tool length (tool table), G53 moves as written
+Moves are checked against the Machine.ini soft limits and the keep-out boxes in one vectorized pass per box
+Also checks each tool's lowest cut against the ZMIN in the program header, the tool table and the G43 H words
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import CycleTime
+import MachineConfig
+from GCodeReader import Toolpath
+from LogsMirror import mirror_path
+from NormalizeGCode import COMMENT_RE, WORD_RE
+
+KEEP_OUT_FILE = "KeepOut.json"  # In the profile folder: [{"name", "min": [x, y, z], "max": [x, y, z]}]
+# Keep-out boxes are in machine coordinates of the tool tip (machine Z without the tool length),
+# so one box holds for every tool: work Z 0 in G55 is machine tip Z = the fixture Z offset
+ZMIN_TOLERANCE = 0.0005  # Cuts this far below the header ZMIN are flagged (the post rounds ZMIN)
+DIAMETER_TOLERANCE = 0.002  # Header vs tool table diameter
+LIMIT_EPSILON = 1e-6  # Rounding allowed at the soft limits (G53 Z0 sits on the Z max)
+SHOW_LINES = 20  # Line numbers printed per check (the report lists them all)
+
+
+def line_words(line):
+    """{letter: value} of one line (last value wins)"""
+    return {letter: float(value) for letter, value in WORD_RE.findall(COMMENT_RE.sub(' ', line).upper())}
+
+
+def tool_lengths(toolpath, tools):
+    """Tool table length of the tool each move runs with (0 before the first M6, NaN if not in the table)"""
+    length_table = np.full(int(toolpath.tool.max(initial=0)) + 1, np.nan)
+    for tool, info in tools.items():
+        if tool < len(length_table):
+            length_table[tool] = info['length']
+    length_table[0] = 0.0  # Before the first M6
+    return length_table[toolpath.tool]
+
+
+def tool_radii(toolpath, tools):
+    """Radius of the tool each move runs with - the tool table diameter, the header's where the table has none"""
+    radius_table = np.zeros(int(toolpath.tool.max(initial=0)) + 1)
+    for tool in range(len(radius_table)):
+        diameter = tools[tool]['diameter'] if tool in tools else 0.0
+        radius_table[tool] = (diameter or toolpath.tools.get(tool, {}).get('diameter', 0.0)) / 2
+    return radius_table[toolpath.tool]
+
+
+def machine_positions(toolpath, lines, fixtures, tools):
+    """Machine position (N, 3) after every move
+
+    Work moves add the fixture offset of their G54-G59 and the active tool's length
+    (the programs always G43 with the loaded tool - see tool_checks). G53 moves take the
+    axes they name as written, and the rows after a G53 Z move stay at its machine Z
+    until the program moves Z again (CycleTime.retracted_rows).
+    """
+    work = CycleTime.filled_positions(toolpath)
+    fixture_table = np.full((7, 3), np.nan)  # Row 0: no work offset yet
+    for number in range(1, 7):
+        if number in fixtures:
+            fixture_table[number] = fixtures[number]
+    fixture_index = np.clip(toolpath.offset.astype(np.int64) - 53, 0, 6)
+
+    positions = work + fixture_table[fixture_index]
+    positions[:, 2] += tool_lengths(toolpath, tools)
+    machine_rows = np.flatnonzero(toolpath.machine)
+    if len(machine_rows) == 0:
+        return positions
+    previous = np.vstack([positions[:1], positions])
+    machine_z = np.empty(len(machine_rows))
+    for k, row in enumerate(machine_rows):
+        words = line_words(lines[toolpath.line[row] - 1])
+        for axis, letter in enumerate(MachineConfig.AXES):
+            positions[row, axis] = words.get(letter, previous[row, axis])
+        machine_z[k] = positions[row, 2]
+    retracted, group = CycleTime.retracted_rows(toolpath, work[:, 2])
+    positions[retracted, 2] = machine_z[group[retracted]]
+    return positions
+
+
+def arc_bounds(toolpath, lines, positions):
+    """(rows, low, high) of the G2/G3 moves: the box around each arc's full circle in its plane
+
+    The plane is the modal G17/G18/G19 of the line. Centers are taken as incremental
+    (G91.1, the post's and Mach4's default) unless the program sets G90.1; R-format arcs
+    get their diameter around the chord.
+    """
+    rows = np.flatnonzero(np.isin(toolpath.motion, (2, 3)) & ~toolpath.machine)
+    low, high = np.empty((len(rows), 3)), np.empty((len(rows), 3))
+    plane_changes, planes = [-1], [17]
+    absolute = False
+    for index, line in enumerate(lines):
+        code = line.upper()
+        if 'G1' in code or 'G90.1' in code:
+            for letter, value in WORD_RE.findall(COMMENT_RE.sub(' ', code)):
+                if letter == 'G' and float(value) in (17, 18, 19):
+                    plane_changes.append(index)
+                    planes.append(int(float(value)))
+                elif letter == 'G' and float(value) == 90.1:
+                    absolute = True
+    plane_axes = {17: (0, 1), 18: (0, 2), 19: (1, 2)}
+
+    for k, row in enumerate(rows):
+        index = toolpath.line[row] - 1
+        words = line_words(lines[index])
+        start, end = positions[max(row - 1, 0)], positions[row]
+        low[k], high[k] = np.fmin(start, end), np.fmax(start, end)
+        axes = plane_axes[planes[np.searchsorted(plane_changes, index, side='right') - 1]]
+        if 'R' in words:
+            low[k, list(axes)] -= 2 * abs(words['R'])
+            high[k, list(axes)] += 2 * abs(words['R'])
+            continue
+        offset = np.array([words.get(letter, 0.0) for letter in 'IJK'])
+        if absolute:
+            work_start = np.array([toolpath.x[row - 1], toolpath.y[row - 1], toolpath.z[row - 1]])
+            offset = np.where([letter in words for letter in 'IJK'], offset - work_start, 0.0)
+        center = start + offset
+        radius = float(np.linalg.norm(offset[list(axes)]))
+        for axis in axes:
+            low[k, axis] = min(low[k, axis], center[axis] - radius)
+            high[k, axis] = max(high[k, axis], center[axis] + radius)
+    return rows, low, high
+
+
+def move_bounds(positions, arcs):
+    """(low, high) corners of the box around every move (row k moves from row k - 1; row 0 is a point)"""
+    start = np.vstack([positions[:1], positions[:-1]])
+    low = np.fmin(start, positions)
+    high = np.fmax(start, positions)
+    rows, arc_low, arc_high = arcs
+    low[rows], high[rows] = arc_low, arc_high
+    return low, high
+
+
+def soft_limit_rows(low, high, limits):
+    """{axis: rows whose move leaves the soft limits}"""
+    outside = {}
+    for axis, letter in enumerate(MachineConfig.AXES):
+        if letter not in limits:
+            continue
+        limit = limits[letter]
+        rows = np.flatnonzero((low[:, axis] < limit['soft_min'] - LIMIT_EPSILON) |
+                              (high[:, axis] > limit['soft_max'] + LIMIT_EPSILON))
+        if len(rows):
+            outside[letter] = rows
+    return outside
+
+
+def box_hits(positions, arcs, lengths, radius, box):
+    """Rows whose move brings the tool into a keep-out box
+
+    positions are machine (gauge line) positions; each move's tool length is taken off
+    both its ends so the tip is tested in the tool-independent frame of KEEP_OUT_FILE.
+    The tool is a vertical cylinder from its tip up, so the box is grown by the tool
+    radius in X/Y and extended down to -inf: the tool hits it when the tip passes under
+    the box top within the grown outline. Lines are clipped against it Liang-Barsky
+    style; arcs are tested with their bounding box.
+    """
+    box_low = np.array(box['min'], dtype=np.float64)
+    box_high = np.array(box['max'], dtype=np.float64)
+    low = np.column_stack([box_low[0] - radius, box_low[1] - radius, np.full(len(radius), -np.inf)])
+    high = np.column_stack([box_high[0] + radius, box_high[1] + radius, np.full(len(radius), box_high[2])])
+
+    tip = np.array([0.0, 0.0, 1.0]) * np.nan_to_num(lengths)[:, None]
+    end = positions - tip
+    start = np.vstack([positions[:1], positions[:-1]]) - tip
+    delta = end - start
+    enter, leave = np.zeros(len(positions)), np.ones(len(positions))
+    inside = np.ones(len(positions), dtype=bool)
+    for axis in range(3):
+        p, s = delta[:, axis], start[:, axis]
+        parallel = p == 0
+        inside &= ~(parallel & ((s < low[:, axis]) | (s > high[:, axis])))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_low = (low[:, axis] - s) / p
+            t_high = (high[:, axis] - s) / p
+        enter = np.where(parallel, enter, np.maximum(enter, np.fmin(t_low, t_high)))
+        leave = np.where(parallel, leave, np.minimum(leave, np.fmax(t_low, t_high)))
+    hit = inside & (enter <= leave)
+
+    rows, arc_low, arc_high = arcs
+    arc_low, arc_high = arc_low - tip[rows], arc_high - tip[rows]
+    hit[rows] = np.all((arc_high >= low[rows]) & (arc_low <= high[rows]), axis=1)
+    return np.flatnonzero(hit)
+
+
+def zmin_rows(toolpath, tolerance=ZMIN_TOLERANCE):
+    """{tool: (lowest cut Z, header ZMIN, rows below ZMIN)} for the tools listed in the header"""
+    cutting = (toolpath.motion != 0) & ~toolpath.machine
+    result = {}
+    for tool in toolpath.tool_list():
+        mask = cutting & (toolpath.tool == tool)
+        if not mask.any() or tool not in toolpath.tools:
+            continue
+        zmin = toolpath.tools[tool]['zmin']
+        lowest = float(np.nanmin(toolpath.z[mask]))
+        result[tool] = (lowest, zmin, np.flatnonzero(mask & (toolpath.z < zmin - tolerance)))
+    return result
+
+
+def tool_checks(toolpath, lines, tools):
+    """Problems with the program's tools: list of (line number or None, message)"""
+    problems = []
+    for tool in toolpath.tool_list():
+        if tool not in tools:
+            problems.append((None, f"T{tool} is not in the tool table (no length for G43)"))
+            continue
+        if tool not in toolpath.tools:
+            problems.append((None, f"T{tool} is not in the program header (no ZMIN)"))
+            continue
+        header, table = toolpath.tools[tool]['diameter'], tools[tool]['diameter']
+        if table and abs(header - table) > DIAMETER_TOLERANCE:
+            problems.append((None, f"T{tool} is D={header:.4f} in the program, D={table:.4f} in the tool table"))
+    # G43 must use the loaded tool's offset
+    rows_by_line = {int(line): row for row, line in enumerate(toolpath.line)}
+    for index, line in enumerate(lines):
+        if 'G43' not in line.upper():
+            continue
+        words = line_words(line)
+        row = rows_by_line.get(index + 1)
+        if row is None or 'H' not in words:
+            continue
+        if int(words['H']) != int(toolpath.tool[row]):
+            problems.append((index + 1, f"G43 H{int(words['H'])} with T{int(toolpath.tool[row])} loaded"))
+    return problems
+
+
+def load_keep_out(path):
+    """Keep-out boxes from a JSON list (empty if the file does not exist)"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        boxes = json.load(f)
+    for box in boxes:
+        if len(box.get('min', ())) != 3 or len(box.get('max', ())) != 3:
+            raise ValueError(f"Keep-out box needs 3-axis min and max: {box}")
+        box.setdefault('name', 'box')
+    return boxes
+
+
+def format_lines(numbers, limit=SHOW_LINES):
+    """'12-15, 40, 52-60' for sorted line numbers, cut off after limit ranges"""
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    text = ", ".join(f"{a}" if a == b else f"{a}-{b}" for a, b in ranges[:limit or None])
+    return text + (f" ... ({len(ranges) - limit} more ranges)" if limit and len(ranges) > limit else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a program against the soft limits and keep-out boxes")
+    parser.add_argument('tap', help="G-code (.tap) file")
+    parser.add_argument('--profile', default=MachineConfig.PROFILE_DIR, help="Mach4 profile folder")
+    parser.add_argument('--keep-out', default=None, help=f"Keep-out boxes JSON (default: <profile>/{KEEP_OUT_FILE})")
+    parser.add_argument('--zmin-tolerance', type=float, default=ZMIN_TOLERANCE, help="Allowed cut below the header ZMIN")
+    parser.add_argument('--report', default=None, help="Write every offending line to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tap_path = mirror_path(args.tap)
+    try:
+        toolpath = Toolpath.open(tap_path)
+    except ValueError:
+        # GCodeReader only tracks absolute (G90) positions - e.g. the Lua mapper's G91 output
+        parser.exit(1, f"{os.path.basename(args.tap)}: not checked: incremental program (G91)\n")
+    with open(tap_path, 'r', errors='replace') as f:
+        lines = f.read().splitlines()
+    limits = MachineConfig.axis_limits(os.path.join(args.profile, "Machine.ini"))
+    fixtures = MachineConfig.fixture_offsets(os.path.join(args.profile, "FixtureTables", "fixturetable.tls"))
+    tools = MachineConfig.tool_table(os.path.join(args.profile, "ToolTables", "tooltable.tls"))
+    try:
+        boxes = load_keep_out(args.keep_out or os.path.join(args.profile, KEEP_OUT_FILE))
+    except (ValueError, json.JSONDecodeError) as e:
+        parser.exit(1, f"{e}\n")
+
+    positions = machine_positions(toolpath, lines, fixtures, tools)
+    arcs = arc_bounds(toolpath, lines, positions)
+    low, high = move_bounds(positions, arcs)
+    lengths = tool_lengths(toolpath, tools)
+    radius = tool_radii(toolpath, tools)
+
+    findings = []  # (check, line numbers)
+    unknown = np.flatnonzero(np.isnan(positions).any(axis=1) & ~toolpath.machine)
+    if len(unknown):
+        findings.append(("No work offset or tool length (machine position unknown)", toolpath.line[unknown]))
+    for axis, rows in soft_limit_rows(low, high, limits).items():
+        limit = limits[axis]
+        findings.append((f"{axis} soft limits {limit['soft_min']:.4f} to {limit['soft_max']:.4f}", toolpath.line[rows]))
+    for box in boxes:
+        rows = box_hits(positions, arcs, lengths, radius, box)
+        if len(rows):
+            findings.append((f"Keep-out '{box['name']}'", toolpath.line[rows]))
+    zmin = zmin_rows(toolpath, args.zmin_tolerance)
+    for tool, (lowest, header_zmin, rows) in zmin.items():
+        if len(rows):
+            findings.append((f"T{tool} below header ZMIN {header_zmin:.4f} (lowest {lowest:.4f})", toolpath.line[rows]))
+    problems = tool_checks(toolpath, lines, tools)
+    elapsed = time.perf_counter() - start
+
+    offsets = sorted(set(int(offset) for offset in toolpath.offset if offset))
+    print(f"{os.path.basename(args.tap)}: {len(toolpath)} moves, work offset(s) "
+          + ", ".join(f"G{g} X{fixtures[g - 53][0]:.4f} Y{fixtures[g - 53][1]:.4f} Z{fixtures[g - 53][2]:.4f}"
+                      if g - 53 in fixtures else f"G{g} (not in the fixture table)" for g in offsets))
+    known = ~np.isnan(positions).any(axis=1)
+    if known.any():
+        print("  Machine envelope: " + "  ".join(
+            f"{letter} {np.nanmin(low[known, axis]):.4f} to {np.nanmax(high[known, axis]):.4f}"
+            + (f" (limits {limits[letter]['soft_min']:.1f} to {limits[letter]['soft_max']:.1f})" if letter in limits else "")
+            for axis, letter in enumerate(MachineConfig.AXES)))
+    print(f"  Keep-out boxes: {len(boxes)}" + (f" ({', '.join(box['name'] for box in boxes)})" if boxes else ""))
+    for tool, (lowest, header_zmin, rows) in zmin.items():
+        print(f"  T{tool}: lowest cut {lowest:.4f}, header ZMIN {header_zmin:.4f}" + (" - BELOW" if len(rows) else ""))
+    for line_number, message in problems:
+        print(f"  {'Line ' + str(line_number) + ': ' if line_number else ''}{message}")
+    for check, numbers in findings:
+        numbers = np.unique(numbers)
+        print(f"  {check}: {len(numbers)} lines - {format_lines(numbers.tolist())}")
+
+    if args.report:
+        tmp_path = args.report + '.part'
+        with open(tmp_path, 'w') as f:
+            f.write(f"Envelope check: {tap_path}\n")
+            for line_number, message in problems:
+                f.write(f"{'Line ' + str(line_number) + ': ' if line_number else ''}{message}\n")
+            for check, numbers in findings:
+                numbers = np.unique(numbers)
+                f.write(f"\n{check}: {len(numbers)} lines\n{format_lines(numbers.tolist(), limit=0)}\n")
+            f.write(f"\nRESULT: {'FAIL' if findings or problems else 'PASS'}\n")
+        os.replace(tmp_path, args.report)
+
+    print(f"RESULT: {'FAIL' if findings or problems else 'PASS'} ({elapsed * 1000:.0f}ms)")
+    if findings or problems:
+        parser.exit(1)
+
+
+if __name__ == '__main__':
+    main()
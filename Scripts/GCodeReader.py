@@ -0,0 +1,401 @@
+"""
+G-code Reader - One-pass NumPy parser for the exported shaping programs (.tap)
+The file is memory-mapped and tokenized with array operations - no per-line Python objects
+Moves come back as column arrays (X/Y/Z/F, modal motion, tool, spindle, work offset) for plotting and analysis
+Toolpath.open keeps the parsed columns in a binary cache next to the program (<name>.tap.gcbin), memory-mapped on reuse
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import time
+
+import numpy as np
+
+NL = ord('\n')
+
+CACHE_SUFFIX = ".gcbin"
+CACHE_MAGIC = b"BLPGCODE"
+CACHE_VERSION = 1  # Bump when the parser output changes
+CACHE_ALIGN = 64
+
+# Per-move columns, in file order
+COLUMNS = [
+    ('line', np.int32),  # 1-based program line
+    ('motion', np.int8),  # Modal G0-G3
+    ('x', np.float64), ('y', np.float64), ('z', np.float64),  # Work position after the move
+    ('f', np.float64),
+    ('tool', np.int16),  # Tool loaded by the last M6
+    ('spindle', np.float32),  # Modal S word
+    ('offset', np.int8),  # Work offset G54-G59 (0 before the first one)
+    ('flags', np.uint8),
+]
+
+FLAG_MACHINE = 1  # G53 move (position columns keep the last work position)
+FLAG_SPINDLE = 2  # Spindle running (M3/M4)
+FLAG_REVERSE = 4  # Spindle running counter-clockwise (M4)
+FLAG_TOOL_CHANGE = 8  # First move after an M6
+
+# G codes whose axis words are not moves (offset setting, home/reference)
+SETUP_G = (10, 28, 30, 92)
+MOTION_G = (0, 1, 2, 3)
+
+# Tool table comments written by the Fusion post: (T15 D=0.5 CR=0. - ZMIN=0.173 - FLAT END MILL)
+TOOL_COMMENT_RE = re.compile(rb'\(T(\d+) D=([-\d.]+)[^)]*?ZMIN=([-\d.]+) - ([^)]*)\)')
+
+
+def map_file(path):
+    """Read-only uint8 view of a file, memory-mapped"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return np.zeros(0, dtype=np.uint8)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(mm, dtype=np.uint8)
+
+
+def scan_words(buf):
+    """Tokenize G-code bytes into words
+
+    Returns (letters, values, lines, line_count): the upper-case letter code, numeric
+    value and 0-based line of every word, in file order. Comments in parentheses or
+    after ';' are skipped, as are letters not directly followed by a number.
+    """
+    n = len(buf)
+    if n == 0:
+        return np.zeros(0, np.uint8), np.zeros(0), np.zeros(0, np.int64), 0
+
+    newline = buf == NL
+    line_of = np.cumsum(newline) - newline
+    line_count = int(line_of[-1]) + 1
+    line_starts = np.flatnonzero(np.r_[True, newline[:-1]])
+
+    def open_on_line(delta):
+        """Running count of delta within each line (resets at every newline)"""
+        total = np.cumsum(delta)
+        base = total[line_starts] - delta[line_starts]
+        return total - base[line_of]
+
+    parens = (buf == ord('(')).astype(np.int32) - (buf == ord(')'))
+    in_comment = (open_on_line(parens) > 0) | (open_on_line((buf == ord(';')).astype(np.int32)) > 0)
+
+    upper = np.where((buf >= 97) & (buf <= 122), buf - 32, buf).astype(np.uint8)
+    is_letter = (upper >= 65) & (upper <= 90) & ~in_comment
+    is_digit = (buf >= 48) & (buf <= 57)
+    is_num = (is_digit | (buf == ord('.')) | (buf == ord('-')) | (buf == ord('+'))) & ~in_comment
+
+    # Number runs that start right after a letter are word values
+    prev_num = np.r_[False, is_num[:-1]]
+    next_num = np.r_[is_num[1:], False]
+    starts = np.flatnonzero(is_num & ~prev_num)
+    ends = np.flatnonzero(is_num & ~next_num) + 1
+    words = starts > 0
+    words[words] = is_letter[starts[words] - 1]
+    starts, ends = starts[words], ends[words]
+
+    # Value = sign * (all digits as one integer) / 10^(digits after the point)
+    # Integer / power of ten rounds the same way as float() on the text
+    digit_count = np.r_[0, np.cumsum(is_digit)]
+    dots = np.flatnonzero((buf == ord('.')) & is_num)
+    dot_index = np.searchsorted(dots, starts)
+    dot_pos = np.where(dot_index < len(dots), dots[np.minimum(dot_index, len(dots) - 1)], n)
+    dot_pos = np.where(dot_pos < ends, dot_pos, ends)
+    decimals = digit_count[ends] - digit_count[dot_pos]
+
+    digit_pos = np.flatnonzero(is_digit)
+    run = np.searchsorted(starts, digit_pos, side='right') - 1
+    in_run = (run >= 0) & (digit_pos < ends[np.maximum(run, 0)])
+    digit_pos, run = digit_pos[in_run], run[in_run]
+    exponent = digit_count[ends[run]] - digit_count[digit_pos + 1]
+    mantissa = np.bincount(run, weights=(buf[digit_pos] - 48) * 10.0 ** exponent, minlength=len(starts))
+
+    values = mantissa / 10.0 ** decimals
+    values[buf[starts] == ord('-')] *= -1
+    return upper[starts - 1], values, line_of[starts], line_count
+
+
+def forward_fill(values):
+    """Carry the last non-NaN value forward (leading NaNs stay NaN)"""
+    index = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(index, out=index)
+    return values[index]
+
+
+def parse_tools(buf):
+    """Tool table from the program header comments: {tool: {'diameter', 'zmin', 'description'}}"""
+    tools = {}
+    for match in TOOL_COMMENT_RE.finditer(buf):
+        tool = int(match.group(1))
+        tools.setdefault(tool, {
+            'diameter': float(match.group(2)),
+            'zmin': float(match.group(3)),
+            'description': match.group(4).decode('ascii', errors='replace').strip(),
+        })
+    return tools
+
+
+def parse_program(path):
+    """Parse a program into per-move columns: ({name: array}, line_count, tools)"""
+    buf = map_file(path)
+    letters, values, lines, line_count = scan_words(buf)
+    tools = parse_tools(buf)
+    count = line_count
+
+    def line_values(letter):
+        """Per-line value of a word (NaN where the line does not have it)"""
+        select = letters == ord(letter)
+        result = np.full(count, np.nan)
+        result[lines[select]] = values[select]
+        return result
+
+    def modal(code_lines, codes):
+        """Per-line modal value of codes set on code_lines (NaN before the first)"""
+        result = np.full(count, np.nan)
+        result[code_lines] = codes
+        return forward_fill(result)
+
+    is_g = letters == ord('G')
+    g_values = values[is_g]
+    g_lines = lines[is_g]
+    if np.any(g_values == 91):
+        raise ValueError(f"Incremental (G91) programs are not supported: {path}")
+
+    motion = np.full(count, np.nan)
+    is_motion = np.isin(g_values, MOTION_G)
+    motion[g_lines[is_motion]] = g_values[is_motion]
+    machine = np.zeros(count, dtype=bool)
+    machine[g_lines[g_values == 53]] = True
+    setup = np.zeros(count, dtype=bool)
+    setup[g_lines[np.isin(g_values, SETUP_G)]] = True
+
+    axes = {axis: line_values(axis) for axis in 'XYZ'}
+    has_axis = ~(np.isnan(axes['X']) & np.isnan(axes['Y']) & np.isnan(axes['Z']))
+    is_move = has_axis & ~setup
+
+    # Work-coordinate position: G53 and setup lines do not change it
+    for axis in 'XYZ':
+        axes[axis][machine | setup] = np.nan
+        axes[axis] = forward_fill(axes[axis])
+
+    # Tool changes: the T word on or before each M6 line becomes the active tool
+    is_m = letters == ord('M')
+    tool_word = forward_fill(line_values('T'))
+    change = np.zeros(count, dtype=bool)
+    change[lines[is_m & (values == 6)]] = True
+    active = np.full(count, np.nan)
+    active[change] = tool_word[change]
+    active = np.nan_to_num(forward_fill(active), nan=0)
+
+    is_offset = np.isin(g_values, (54, 55, 56, 57, 58, 59))
+    offset = np.nan_to_num(modal(g_lines[is_offset], g_values[is_offset]), nan=0)
+    is_spindle = is_m & np.isin(values, (3, 4, 5))
+    spindle_state = modal(lines[is_spindle], values[is_spindle])
+
+    move_lines = np.flatnonzero(is_move)
+    # A move is the first after a tool change if an M6 came after the previous move
+    changes_before = np.cumsum(change)[move_lines]
+    first_after_change = np.diff(np.r_[0, changes_before]) > 0
+    flags = (np.where(machine[move_lines], FLAG_MACHINE, 0)
+             | np.where(np.isin(spindle_state[move_lines], (3, 4)), FLAG_SPINDLE, 0)
+             | np.where(spindle_state[move_lines] == 4, FLAG_REVERSE, 0)
+             | np.where(first_after_change, FLAG_TOOL_CHANGE, 0))
+
+    columns = {
+        'line': move_lines + 1,  # 1-based, as shown in Mach4 and text editors
+        'motion': np.nan_to_num(forward_fill(motion), nan=0)[move_lines],
+        'x': axes['X'][move_lines],
+        'y': axes['Y'][move_lines],
+        'z': axes['Z'][move_lines],
+        'f': forward_fill(line_values('F'))[move_lines],
+        'tool': active[move_lines],
+        'spindle': np.nan_to_num(forward_fill(line_values('S')), nan=0)[move_lines],
+        'offset': offset[move_lines],
+        'flags': flags,
+    }
+    columns = {name: columns[name].astype(dtype) for name, dtype in COLUMNS}
+    return columns, line_count, tools
+
+
+def file_sha1(path):
+    """SHA1 of a file's contents"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(path):
+    """Binary cache file kept next to a program"""
+    return path + CACHE_SUFFIX
+
+
+def write_cache(path, columns, line_count, tools, sha1):
+    """Write parsed columns as <program>.gcbin: magic, header length, JSON header, 64-byte aligned columns"""
+    stat = os.stat(path)
+    rows = len(columns['line'])
+    layout = []
+    offset = 0
+    for name, dtype in COLUMNS:
+        layout.append([name, np.dtype(dtype).str, offset])
+        offset += -(-rows * np.dtype(dtype).itemsize // CACHE_ALIGN) * CACHE_ALIGN
+    header = {
+        'version': CACHE_VERSION,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha1': sha1,
+        'line_count': line_count,
+        'rows': rows,
+        'tools': {str(tool): info for tool, info in tools.items()},
+        'columns': layout,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = -(-(len(CACHE_MAGIC) + 4 + len(header_bytes)) // CACHE_ALIGN) * CACHE_ALIGN
+
+    tmp_path = cache_path(path) + '.part'
+    with open(tmp_path, 'wb') as f:
+        f.write(CACHE_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+        for name, _, column_offset in layout:
+            f.seek(data_start + column_offset)
+            f.write(np.ascontiguousarray(columns[name]).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, cache_path(path))
+
+
+def read_cache(path):
+    """Memory-mapped columns from a program's cache, or None if it is missing or stale
+
+    The cache is current if the program's size and mtime match, or failing that, its SHA1.
+    Returns (columns, line_count, tools).
+    """
+    try:
+        with open(cache_path(path), 'rb') as f:
+            prefix = f.read(len(CACHE_MAGIC) + 4)
+            if prefix[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+                return None
+            header_length = struct.unpack('<I', prefix[len(CACHE_MAGIC):])[0]
+            header = json.loads(f.read(header_length))
+        if header.get('version') != CACHE_VERSION:
+            return None
+        stat = os.stat(path)
+        if (header['size'], header['mtime']) != (stat.st_size, stat.st_mtime) and header['sha1'] != file_sha1(path):
+            return None
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+    data_start = -(-(len(CACHE_MAGIC) + 4 + header_length) // CACHE_ALIGN) * CACHE_ALIGN
+    rows = header['rows']
+    if rows == 0:
+        columns = {name: np.zeros(0, dtype) for name, dtype in COLUMNS}
+    else:
+        columns = {name: np.memmap(cache_path(path), dtype=np.dtype(dtype), mode='r',
+                                   offset=data_start + offset, shape=(rows,))
+                   for name, dtype, offset in header['columns']}
+    tools = {int(tool): info for tool, info in header['tools'].items()}
+    return columns, header['line_count'], tools
+
+
+class Toolpath:
+    """Moves of a G-code program as column arrays, one entry per line with axis words
+
+    x/y/z/f are the modal values after the move (NaN until first set). motion is the
+    modal G0-G3 mode and tool the tool loaded by the last M6. G53 moves are flagged in
+    machine and keep the last work-coordinate position. See COLUMNS and the FLAG_ bits.
+    """
+
+    def __init__(self, path, parsed=None):
+        start = time.perf_counter()
+        self.path = path
+        columns, self.line_count, self.tools = parsed or parse_program(path)
+        for name, _ in COLUMNS:
+            setattr(self, name, columns[name])
+        self.machine = (self.flags & FLAG_MACHINE) != 0
+        self.cached = parsed is not None
+        self.load_seconds = time.perf_counter() - start
+
+    @classmethod
+    def open(cls, path, use_cache=True):
+        """Toolpath from the program's binary cache, parsing and writing the cache if it is stale"""
+        start = time.perf_counter()
+        parsed = read_cache(path) if use_cache else None
+        if parsed:
+            toolpath = cls(path, parsed)
+        else:
+            toolpath = cls(path)
+            if use_cache:
+                try:
+                    columns = {name: getattr(toolpath, name) for name, _ in COLUMNS}
+                    write_cache(path, columns, toolpath.line_count, toolpath.tools, file_sha1(path))
+                except OSError:
+                    pass  # Read-only folder - parse again next time
+        toolpath.load_seconds = time.perf_counter() - start
+        return toolpath
+
+    def __len__(self):
+        return len(self.line)
+
+    def tool_list(self):
+        """Tools in the order they are first used"""
+        _, first = np.unique(self.tool, return_index=True)
+        return [int(self.tool[i]) for i in sorted(first) if self.tool[i]]
+
+    def xy_segments(self, tool=None, cutting=True, resolution=None):
+        """XY line segments (N, 2, 2) for one tool's feed moves (or rapids)
+
+        With a resolution (drawing units per pixel) each run of moves is decimated to
+        the points where it enters a new pixel cell, plus its first and last point, so
+        dense toolpaths draw with at most one vertex per pixel.
+        """
+        wanted = (self.motion != 0) if cutting else (self.motion == 0)
+        if tool is not None:
+            wanted &= self.tool == tool
+        valid = ~self.machine & ~np.isnan(self.x) & ~np.isnan(self.y)
+        pen = wanted & valid
+        pen[1:] &= valid[:-1]  # Segment start (previous move end) must be a work position too
+        pen[0] = False
+
+        # Points: every pen-down move end plus the start point of each run
+        run_start = pen & ~np.r_[False, pen[:-1]]
+        points = np.flatnonzero(pen | np.r_[run_start[1:], False])
+        if len(points) == 0:
+            return np.zeros((0, 2, 2))
+        run_id = np.cumsum(run_start)
+        labels = np.where(pen[points], run_id[points], run_id[np.minimum(points + 1, len(pen) - 1)])
+
+        keep = np.ones(len(points), dtype=bool)
+        if resolution:
+            cell_x = np.floor(self.x[points] / resolution)
+            cell_y = np.floor(self.y[points] / resolution)
+            same_run = labels[1:] == labels[:-1]
+            moved = (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1])
+            keep[1:] = moved | ~same_run
+            keep[:-1] |= ~same_run  # Last point of each run
+            keep[-1] = True
+        points, labels = points[keep], labels[keep]
+
+        xy = np.column_stack([self.x[points], self.y[points]])
+        joined = labels[1:] == labels[:-1]
+        return np.stack([xy[:-1][joined], xy[1:][joined]], axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse a shaping program and summarize its moves")
+    parser.add_argument('tap', help="G-code (.tap) file")
+    parser.add_argument('--no-cache', action='store_true', help="Parse the text even if a cache exists")
+    args = parser.parse_args()
+
+    toolpath = Toolpath.open(args.tap, use_cache=not args.no_cache)
+    print(f"{os.path.basename(args.tap)}: {toolpath.line_count} lines, {len(toolpath)} moves "
+          f"({'cached, ' if toolpath.cached else ''}{toolpath.load_seconds * 1000:.0f}ms)")
+    for tool in toolpath.tool_list():
+        mask = toolpath.tool == tool
+        info = toolpath.tools.get(tool, {})
+        print(f"  T{tool}: {int(mask.sum())} moves, {int((mask & (toolpath.motion == 0)).sum())} rapids"
+              + (f", D={info['diameter']} ZMIN={info['zmin']} {info['description']}" if info else ""))
+
+
+if __name__ == '__main__':
+    main()
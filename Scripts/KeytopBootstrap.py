@@ -0,0 +1,220 @@
+"""
+Keytop Bootstrap - Bootstrap confidence intervals of the solved keytop parameters ({piano}_Bootstrap.csv)
+Each key's probe points are resampled per band and every resample is re-solved in one NumPy batch
+Run by the Fusion add-in as an external process after it solves a job (Fusion's Python has no NumPy)
+"""
+
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+import KeytopSolver
+from KeytopSolver import CONFIG
+from LogsMirror import mirror_path
+
+SAMPLES = 200  # Resamples per key
+CI = 95  # Confidence interval percentage
+MAX_CI_IN = 0.025  # Flag keys whose X/Width CI is wider than this
+MAX_CI_STEP = 0.090  # Flag keys whose LStep/RStep CI is wider than this
+MAX_CI_DEG = 1.25  # Flag keys whose angle CI is wider than this
+
+
+def solve_key_batch(bands, front, key_num, config=None):
+    """Solve a batch of point sets for one key at once
+
+    bands maps 'lf', 'lt', 'rf', 'rt' (left/right x front/tail band) to (B, n, 2)
+    arrays and front is (B, n, 2) - one row per resampled point set. Band
+    membership is fixed by the caller, so no per-point masks are needed.
+    Mirrors KeytopSolver.process_key; returns a dict of (B,) arrays.
+    """
+    config = config or CONFIG
+    n_steps = int(config['max_rotation'] / config['angle_step'])
+    angles = np.arange(-n_steps, n_steps + 1) * config['angle_step']
+    batch = len(front)
+
+    # Angle search: every sample x every angle in one pass. The rotation center
+    # only adds a constant per (sample, angle), which cancels in every slack term.
+    # Points go on the leading axis so min/max reduce across whole (B, A) planes.
+    cos_a = np.cos(np.radians(angles))[None, None, :]
+    sin_a = np.sin(np.radians(angles))[None, None, :]
+    rot = {name: pts[:, :, 0].T[:, :, None] * cos_a - pts[:, :, 1].T[:, :, None] * sin_a
+           for name, pts in bands.items() if pts.shape[1]}
+    lo = {name: x.min(axis=0) for name, x in rot.items()}
+    hi = {name: x.max(axis=0) for name, x in rot.items()}
+
+    xl_outer = np.minimum.reduce([lo[n] for n in ('lf', 'lt') if n in lo])
+    xr_outer = np.maximum.reduce([hi[n] for n in ('rf', 'rt') if n in hi])
+
+    def band_slack(left_name, right_name):
+        slack = 0.0
+        if left_name in hi:
+            slack = slack + (hi[left_name] - xl_outer)
+        if right_name in lo:
+            slack = slack + (xr_outer - lo[right_name])
+        return slack
+
+    metric = band_slack('lf', 'rf') + config['tail_weight'] * band_slack('lt', 'rt')
+    metric = np.broadcast_to(metric, (batch, len(angles)))
+    best_angle = angles[np.argmin(metric, axis=1)]  # first minimum, same as optimize_angle
+
+    # Final parameters at each sample's best angle, rotating about the sample center
+    all_points = np.concatenate([pts for pts in bands.values()] + [front], axis=1)
+    cx = all_points[:, :, 0].mean(axis=1)
+    cy = all_points[:, :, 1].mean(axis=1)
+    rad = np.radians(best_angle)
+    cos_b, sin_b = np.cos(rad)[:, None], np.sin(rad)[:, None]
+
+    def wall(name, reduce, overhang):
+        pts = bands[name]
+        if not pts.shape[1]:
+            return np.full(batch, overhang)  # default=0 like calculate_key_params
+        x = (pts[:, :, 0] - cx[:, None]) * cos_b - (pts[:, :, 1] - cy[:, None]) * sin_b + cx[:, None]
+        return reduce(x, axis=1) + overhang
+
+    xl_front = wall('lf', np.min, -config['front_overhang'])
+    xl_tail = wall('lt', np.min, -config['tail_overhang'])
+    xr_front = wall('rf', np.max, config['front_overhang'])
+    xr_tail = wall('rt', np.max, config['tail_overhang'])
+
+    xl_outer = np.minimum(xl_front, xl_tail)
+    xl_inner = np.maximum(xl_front, xl_tail)
+    xr_outer = np.maximum(xr_front, xr_tail)
+    xr_inner = np.minimum(xr_front, xr_tail)
+
+    fy = (front[:, :, 0] - cx[:, None]) * sin_b + (front[:, :, 1] - cy[:, None]) * cos_b + cy[:, None]
+    y_front = np.median(fy, axis=1)
+
+    # Rotate front corners back to world coordinates for center X
+    cos_r, sin_r = np.cos(-rad), np.sin(-rad)
+    left_x = (xl_outer - cx) * cos_r - (y_front - cy) * sin_r + cx
+    right_x = (xr_outer - cx) * cos_r - (y_front - cy) * sin_r + cx
+
+    shoulders = KeytopSolver.key_shoulders(key_num)
+    return {
+        'X': (left_x + right_x) / 2.0,
+        'Angle': -best_angle,
+        'Width': xr_outer - xl_outer,
+        'LStep': xl_inner - xl_outer if shoulders in ['left', 'both'] else np.zeros(batch),
+        'RStep': xr_outer - xr_inner if shoulders in ['right', 'both'] else np.zeros(batch),
+    }
+
+
+def split_key_bands(key_data, config=None):
+    """Split a key's probe points into front/tail bands (same rule as optimize_angle)
+
+    Returns (bands, front) as NumPy arrays, or None if the key can't be solved.
+    """
+    config = config or CONFIG
+    left = np.array([[p['X'], p['Y']] for p in key_data.get('1', [])]).reshape(-1, 2)
+    right = np.array([[p['X'], p['Y']] for p in key_data.get('2', [])]).reshape(-1, 2)
+    front = np.array([[p['X'], p['Y']] for p in key_data.get('3', [])]).reshape(-1, 2)
+
+    if not (len(left) and len(right)):
+        return None
+    if not len(front):
+        # Same synthesized front edge as process_key
+        front = np.array([[left[:, 0].min(), -1.2], [right[:, 0].max(), -1.2]])
+
+    split = config['band_split_y']
+    bands = {
+        'lf': left[left[:, 1] <= split],
+        'lt': left[left[:, 1] > split],
+        'rf': right[right[:, 1] <= split],
+        'rt': right[right[:, 1] > split],
+    }
+    return bands, front
+
+
+def bootstrap_key(key_num, key_data, samples=SAMPLES, ci=CI, config=None):
+    """Resample a key's probe points and re-solve in batch
+
+    Resampling is stratified by band so every sample keeps the same number of
+    front and tail points per wall (a sample with no tail points would be
+    solved as a different key shape, not as a noisier measurement).
+    Returns {param: (low, high)} confidence intervals, or None if the key can't be solved.
+    """
+    split = split_key_bands(key_data, config)
+    if not split:
+        return None
+    bands, front = split
+
+    rng = np.random.default_rng(key_num)  # Reproducible per key
+
+    def resample(points):
+        return points[rng.integers(0, len(points), size=(samples, len(points)))]
+
+    results = solve_key_batch({name: resample(pts) for name, pts in bands.items()},
+                              resample(front), key_num, config)
+
+    tail = (100 - ci) / 2.0
+    intervals = {}
+    for name, values in results.items():
+        low, high = np.percentile(values, [tail, 100 - tail])
+        intervals[name] = (float(low), float(high))
+    return intervals
+
+
+def bootstrap_section(probe_data, key_params, samples=SAMPLES, ci=CI, limits=None, config=None):
+    """(rows, flags) for every solved key
+
+    rows are [key, param, value, low, high, width, flagged]; flags maps the flagged key
+    numbers to their wide intervals. Flags are advisory.
+    """
+    limits = limits or {'in': MAX_CI_IN, 'step': MAX_CI_STEP, 'deg': MAX_CI_DEG}
+    rows = []
+    flags = {}
+    for key_num, params in sorted(key_params.items()):
+        intervals = bootstrap_key(key_num, probe_data[key_num], samples, ci, config)
+        if not intervals:
+            continue
+        for name, (low, high) in intervals.items():
+            limit = limits['deg'] if name == 'Angle' else limits['step'] if name in ('LStep', 'RStep') else limits['in']
+            is_wide = (high - low) > limit
+            if is_wide:
+                flags.setdefault(key_num, []).append(f"{name} {low:.4f}..{high:.4f}")
+            rows.append([key_num, name, params[name], low, high, high - low, int(is_wide)])
+    return rows, flags
+
+
+def write_report(path, rows):
+    """{piano}_Bootstrap.csv next to the probe CSV"""
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Key', 'Param', 'Value', 'CILow', 'CIHigh', 'CIWidth', 'Flagged'])
+        for row in rows:
+            writer.writerow(row[:2] + [f"{v:.6f}" for v in row[2:6]] + row[6:])
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap confidence intervals of a job's solved key parameters")
+    parser.add_argument('csv', help="Probe CSV ({piano}.csv)")
+    parser.add_argument('--samples', type=int, default=SAMPLES, help="Resamples per key")
+    parser.add_argument('--ci', type=float, default=CI, help="Confidence interval percentage")
+    parser.add_argument('--max-ci-in', type=float, default=MAX_CI_IN, help="Flag X/Width intervals wider than this")
+    parser.add_argument('--max-ci-step', type=float, default=MAX_CI_STEP, help="Flag LStep/RStep intervals wider than this")
+    parser.add_argument('--max-ci-deg', type=float, default=MAX_CI_DEG, help="Flag angle intervals wider than this")
+    args = parser.parse_args()
+
+    start = time.time()
+    if not os.path.exists(args.csv):
+        parser.exit(1, f"No probe CSV: {args.csv}\n")
+    probe_data = KeytopSolver.parse_csv(mirror_path(args.csv))
+    key_params, _, _, source = KeytopSolver.load_or_solve(args.csv, probe_data)
+    rows, flags = bootstrap_section(probe_data, key_params, args.samples, args.ci,
+                                    {'in': args.max_ci_in, 'step': args.max_ci_step, 'deg': args.max_ci_deg})
+
+    report_path = os.path.splitext(args.csv)[0] + "_Bootstrap.csv"
+    write_report(report_path, rows)
+    for key_num, wide in sorted(flags.items()):
+        print(f"  BOOTSTRAP FLAG Key {key_num}: {', '.join(wide)}")
+    print(f"Bootstrap: {args.samples} samples x {len(key_params)} keys ({source} parameters) in "
+          f"{time.time() - start:.2f}s, {len(flags)} key(s) flagged -> {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+"""
+Keytop Solver - Shared keytop parameter solver for the offline archive tools
+Mirrors the calculations in KeytopParametricUpdate.py so historical pianos can be re-solved outside Fusion
+"""
+
+import csv
+import hashlib
+import json
+import math
+import os
+
+from LogsMirror import LOGS_DIR, mirror_path
+
+# Configuration - matches KeytopParametricUpdate.py (production values)
+CONFIG = {
+    'plastic_thickness': 0.09,  # Added to shoulder length calculation
+    'max_rotation': 2.0,
+    'angle_step': 0.01,
+    'tail_weight': 3,
+    'band_split_y': 0.75,
+    'max_points_per_band': 6,
+    'min_points_per_band': 3,
+    'front_overhang': 0.005,
+    'tail_overhang': 0.01,
+}
+
+# Solver sidecar written by KeytopParametricUpdate.py next to each probe CSV
+SOLVER_SIDECAR_VERSION = 1
+
+# Column layout of the KeyParameters_*.csv files read by PlotKeyParameters.py
+PARAMS_HEADER = ['Key', 'ShoulderType', 'CenterX', 'Angle', 'Width', 'LeftStep', 'RightStep']
+
+
+def config_hash(config=None):
+    """Short stable hash of a CONFIG dict (used to detect stale results)"""
+    config = config or CONFIG
+    blob = json.dumps(config, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(blob).hexdigest()[:12]
+
+
+def find_piano_folders(logs_dir=LOGS_DIR):
+    """List (folder_name, csv_path) for every piano folder that has a probe CSV"""
+    folders = []
+    for folder in sorted(os.listdir(logs_dir)):
+        folder_path = os.path.join(logs_dir, folder)
+        if os.path.isdir(folder_path):
+            csv_path = os.path.join(folder_path, f"{folder}.csv")
+            if os.path.exists(csv_path):
+                folders.append((folder, csv_path))
+    return folders
+
+
+def section_from_name(piano_id):
+    """Determine Upper/Lower section from a piano folder name"""
+    if piano_id.endswith('_Upper'):
+        return 'Upper'
+    if piano_id.endswith('_Lower'):
+        return 'Lower'
+    return 'Unknown'
+
+
+def parse_csv(csv_path):
+    """Parse probe data from CSV into structured format"""
+    data = {}
+    with open(mirror_path(csv_path), 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            key = int(row['PianoKey#'])
+            if key not in data:
+                data[key] = {str(i): [] for i in range(1, 6)}
+
+            direction = int(row['Direction'])
+            if direction <= 5:
+                point = {
+                    'X': float(row['X']),
+                    'Y': float(row['Y']),
+                    'Z': float(row.get('Z', 0))
+                }
+                data[key][str(direction)].append(point)
+    return data
+
+
+def median(values):
+    """Calculate median of a list"""
+    if not values:
+        return 0
+    sorted_vals = sorted(values)
+    n = len(sorted_vals)
+    if n % 2:
+        return sorted_vals[n // 2]
+    return (sorted_vals[n // 2 - 1] + sorted_vals[n // 2]) / 2.0
+
+
+def percentile(values, p):
+    """Calculate percentile of a list (p is 0-100)"""
+    if not values:
+        return 0
+    sorted_vals = sorted(values)
+    n = len(sorted_vals)
+    k = (n - 1) * p / 100.0
+    f = int(k)
+    c = f + 1 if f + 1 < n else f
+    return sorted_vals[f] + (k - f) * (sorted_vals[c] - sorted_vals[f])
+
+
+def rotate_point(point, angle_deg, center):
+    """Rotate a point around a center by angle in degrees"""
+    angle_rad = math.radians(angle_deg)
+    cos_a = math.cos(angle_rad)
+    sin_a = math.sin(angle_rad)
+    dx = point[0] - center[0]
+    dy = point[1] - center[1]
+    return [
+        dx * cos_a - dy * sin_a + center[0],
+        dx * sin_a + dy * cos_a + center[1]
+    ]
+
+
+def is_white_key(key_num):
+    """Check if a piano key number is a white key"""
+    midi = key_num + 20
+    note = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'][midi % 12]
+    return note in ['C', 'D', 'E', 'F', 'G', 'A', 'B']
+
+
+def key_shoulders(key_num):
+    """Determine shoulder type for a key"""
+    if key_num == 1:
+        return "right"
+    if key_num == 88:
+        return "none"
+    midi = key_num + 20
+    note = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'][midi % 12]
+    if note in ('B', 'E'):
+        return "left"
+    if note in ('F', 'C'):
+        return "right"
+    if note in ('D', 'G', 'A'):
+        return "both"
+    return "none"
+
+
+def calculate_global_params(probe_data, config=None):
+    """Calculate shoulder length and key height from all keys"""
+    config = config or CONFIG
+    y_front_values = []
+    y_back_values = []
+    z_values = []
+
+    for key_data in probe_data.values():
+        if key_data['3']:
+            y_front_values.extend([p['Y'] for p in key_data['3']])
+        if key_data['4']:
+            y_back_values.extend([p['Y'] for p in key_data['4']])
+        if key_data['5']:
+            z_values.extend([p['Z'] for p in key_data['5']])
+
+    if y_front_values and y_back_values:
+        median_front_y = median(y_front_values)
+        p75_back_y = percentile(y_back_values, 75)
+        shoulder_length = abs(p75_back_y - median_front_y) + config['plastic_thickness']
+    else:
+        shoulder_length = 0
+
+    key_height = median(z_values) if z_values else 0
+
+    return shoulder_length, key_height
+
+
+def optimize_angle(left_points, right_points, center, config=None):
+    """Find the optimal rotation angle to minimize slack"""
+    config = config or CONFIG
+    if not left_points or not right_points:
+        return 0
+
+    best_angle = 0
+    best_metric = float('inf')
+
+    left_front = [p for p in left_points if p[1] <= config['band_split_y']]
+    left_tail = [p for p in left_points if p[1] > config['band_split_y']]
+    right_front = [p for p in right_points if p[1] <= config['band_split_y']]
+    right_tail = [p for p in right_points if p[1] > config['band_split_y']]
+
+    for angle_int in range(int(-config['max_rotation'] / config['angle_step']),
+                           int(config['max_rotation'] / config['angle_step']) + 1):
+        angle = angle_int * config['angle_step']
+
+        lf_rot = [rotate_point(p, angle, center) for p in left_front]
+        lt_rot = [rotate_point(p, angle, center) for p in left_tail]
+        rf_rot = [rotate_point(p, angle, center) for p in right_front]
+        rt_rot = [rotate_point(p, angle, center) for p in right_tail]
+
+        xl_outer = min(
+            min((p[0] for p in lf_rot), default=float('inf')),
+            min((p[0] for p in lt_rot), default=float('inf'))
+        )
+        xr_outer = max(
+            max((p[0] for p in rf_rot), default=float('-inf')),
+            max((p[0] for p in rt_rot), default=float('-inf'))
+        )
+
+        front_slack = (
+            max((p[0] - xl_outer for p in lf_rot), default=0) +
+            max((xr_outer - p[0] for p in rf_rot), default=0)
+        )
+        tail_slack = (
+            max((p[0] - xl_outer for p in lt_rot), default=0) +
+            max((xr_outer - p[0] for p in rt_rot), default=0)
+        )
+
+        metric = front_slack + config['tail_weight'] * tail_slack
+
+        if metric < best_metric:
+            best_metric = metric
+            best_angle = angle
+
+    return best_angle
+
+
+def calculate_key_params(left_points, right_points, front_points, center, angle, key_num, config=None):
+    """Calculate final parameters for a key"""
+    config = config or CONFIG
+    left_rot = [rotate_point(p, angle, center) for p in left_points]
+    right_rot = [rotate_point(p, angle, center) for p in right_points]
+    front_rot = [rotate_point(p, angle, center) for p in front_points]
+
+    left_front = [p for p in left_rot if rotate_point(p, -angle, center)[1] <= config['band_split_y']]
+    left_tail = [p for p in left_rot if rotate_point(p, -angle, center)[1] > config['band_split_y']]
+    right_front = [p for p in right_rot if rotate_point(p, -angle, center)[1] <= config['band_split_y']]
+    right_tail = [p for p in right_rot if rotate_point(p, -angle, center)[1] > config['band_split_y']]
+
+    # Calculate walls with overhangs applied
+    xl_front = min((p[0] for p in left_front), default=0) - config['front_overhang']
+    xl_tail = min((p[0] for p in left_tail), default=0) - config['tail_overhang']
+    xr_front = max((p[0] for p in right_front), default=0) + config['front_overhang']
+    xr_tail = max((p[0] for p in right_tail), default=0) + config['tail_overhang']
+
+    xl_outer = min(xl_front, xl_tail)
+    xl_inner = max(xl_front, xl_tail)
+    xr_outer = max(xr_front, xr_tail)
+    xr_inner = min(xr_front, xr_tail)
+
+    y_front = median([p[1] for p in front_rot])
+    front_left = rotate_point([xl_outer, y_front], -angle, center)
+    front_right = rotate_point([xr_outer, y_front], -angle, center)
+    center_x = (front_left[0] + front_right[0]) / 2.0
+
+    width = xr_outer - xl_outer
+    left_step = xl_inner - xl_outer if key_shoulders(key_num) in ['left', 'both'] else 0
+    right_step = xr_outer - xr_inner if key_shoulders(key_num) in ['right', 'both'] else 0
+
+    return {
+        'X': center_x,
+        'Angle': -angle,  # Inverted for Fusion
+        'Width': width,
+        'LStep': left_step,
+        'RStep': right_step,
+        'y_front': y_front,
+        'xl_front': xl_front,
+        'xl_tail': xl_tail,
+        'xr_front': xr_front,
+        'xr_tail': xr_tail,
+        'xl_outer': xl_outer,
+        'xr_outer': xr_outer,
+    }
+
+
+def process_key(key_num, key_data, config=None):
+    """Process a single key: optimize angle and calculate parameters"""
+    config = config or CONFIG
+    left_points = [[p['X'], p['Y']] for p in key_data.get('1', [])]
+    right_points = [[p['X'], p['Y']] for p in key_data.get('2', [])]
+    front_points = [[p['X'], p['Y']] for p in key_data.get('3', [])]
+
+    if not (left_points and right_points):
+        return None
+
+    # If no front probing data, synthesize front points at Y=-1.2 using leftmost/rightmost X values
+    if not front_points:
+        default_front_y = -1.2
+        left_front_x = min(p[0] for p in left_points)
+        right_front_x = max(p[0] for p in right_points)
+        front_points = [[left_front_x, default_front_y], [right_front_x, default_front_y]]
+
+    all_points = left_points + right_points + front_points
+    center = [
+        sum(p[0] for p in all_points) / len(all_points),
+        sum(p[1] for p in all_points) / len(all_points)
+    ]
+
+    best_angle = optimize_angle(left_points, right_points, center, config)
+    params = calculate_key_params(left_points, right_points, front_points, center, best_angle, key_num, config)
+    params['center'] = center
+    params['raw_angle'] = best_angle
+
+    return params
+
+
+def solve_section(probe_data, config=None):
+    """Solve every white key in a section, returns (key_params, shoulder_length, key_height)"""
+    config = config or CONFIG
+    shoulder_length, key_height = calculate_global_params(probe_data, config)
+
+    key_params = {}
+    for key_num in sorted(probe_data.keys()):
+        if not is_white_key(key_num):
+            continue
+        params = process_key(key_num, probe_data[key_num], config)
+        if params:
+            key_params[key_num] = params
+
+    return key_params, shoulder_length, key_height
+
+
+def solver_sidecar_path(csv_path):
+    """Solver sidecar path for a probe CSV"""
+    return os.path.splitext(csv_path)[0] + "_Solver.json"
+
+
+def load_solver_sidecar(csv_path):
+    """Solved parameters sent to Fusion for a probe CSV, or None if missing or stale
+
+    Returns (key_params, shoulder_length, key_height) with the same per-key fields as
+    process_key(). The sidecar is stale when the CSV size or mtime no longer matches.
+    """
+    path = solver_sidecar_path(csv_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(mirror_path(path), 'r') as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    stat = os.stat(csv_path)
+    if sidecar.get('format') != 'BLPSolver' or sidecar.get('version') != SOLVER_SIDECAR_VERSION:
+        return None
+    if sidecar.get('csv_size') != stat.st_size or sidecar.get('csv_mtime') != stat.st_mtime:
+        return None
+
+    key_params = {int(key_num): params for key_num, params in sidecar['keys'].items()}
+    return key_params, sidecar['shoulder_length'], sidecar['key_height']
+
+
+def load_or_solve(csv_path, probe_data=None, config=None):
+    """Solver sidecar results for a probe CSV, solving from the probe data if unavailable
+
+    Returns (key_params, shoulder_length, key_height, source) where source is
+    'sidecar' or 'solved'.
+    """
+    result = load_solver_sidecar(csv_path)
+    if result:
+        return result + ('sidecar',)
+    if probe_data is None:
+        probe_data = parse_csv(csv_path)
+    return solve_section(probe_data, config) + ('solved',)
+
+
+def write_params_csv(path, key_params, shoulder_length, key_height):
+    """Write solved parameters in the KeyParameters_*.csv layout"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PARAMS_HEADER)
+        for key_num in sorted(key_params.keys()):
+            params = key_params[key_num]
+            writer.writerow([
+                key_num,
+                key_shoulders(key_num),
+                f"{params['X']:.6f}",
+                f"{params['Angle']:.4f}",
+                f"{params['Width']:.6f}",
+                f"{params['LStep']:.6f}",
+                f"{params['RStep']:.6f}",
+            ])
+        f.write(f"# ShoulderLength,{shoulder_length:.6f}\n")
+        f.write(f"# KeyHeight,{key_height:.6f}\n")
@@ -0,0 +1,261 @@
+"""
+Logs Catalog - SQLite index of the piano folders in the Logs archive
+One row per piano folder: make, serial, section, fixture ID, bore angle and the CSV/tap/report files
+Refreshes incrementally and exports a flat lookup file (LogsCatalog.txt) that Mach4 reads in one open
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import time
+
+from KeytopSolver import LOGS_DIR, section_from_name
+
+CATALOG_NAME = "LogsCatalog.sqlite"
+LOOKUP_NAME = "LogsCatalog.txt"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pianos (
+    folder        TEXT PRIMARY KEY,
+    make          TEXT,
+    serial        TEXT,
+    section       TEXT,
+    fixture_id    INTEGER,
+    bore_angle    REAL,
+    folder_mtime  REAL,
+    csv_path      TEXT,
+    csv_size      INTEGER,
+    csv_mtime     REAL,
+    csv_rows      INTEGER,
+    tap_path      TEXT,
+    tap_size      INTEGER,
+    tap_mtime     REAL,
+    tap_lines     INTEGER,
+    report_path   TEXT,
+    report_size   INTEGER,
+    report_mtime  REAL,
+    scanned_at    REAL
+);
+CREATE INDEX IF NOT EXISTS pianos_fixture ON pianos (fixture_id);
+CREATE INDEX IF NOT EXISTS pianos_serial ON pianos (serial);
+"""
+
+FIXTURE_RE = re.compile(r"Fixture ID: (\d+)")
+BORE_ANGLE_RE = re.compile(r"Bore alignment angle: (-?[\d.]+) degrees")
+REPORT_HEAD_LINES = 50  # Fixture ID and bore angle are written at the top of the report
+FILE_COLUMNS = tuple(f"{prefix}_{field}" for prefix in ('csv', 'tap', 'report')
+                     for field in ('path', 'size', 'mtime'))  # A folder is re-written when one of these changes
+
+
+def open_catalog(logs_dir=LOGS_DIR):
+    """Open (and create if needed) the catalog database for a Logs folder"""
+    conn = sqlite3.connect(os.path.join(logs_dir, CATALOG_NAME))
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def split_folder_name(folder):
+    """Split a {Make}_{Serial}_{Section} folder name, returns (make, serial)"""
+    parts = folder.rsplit('_', 2)
+    if len(parts) == 3:
+        return parts[0], parts[1]
+    return folder, ''
+
+
+def count_lines(path):
+    """Count lines in a file without decoding it"""
+    count = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            count += chunk.count(b'\n')
+    return count
+
+
+def parse_report_head(path):
+    """Read fixture ID and bore alignment angle from the top of a _Report.txt"""
+    fixture_id = None
+    bore_angle = None
+    with open(path, 'r', errors='replace') as f:
+        for i, line in enumerate(f):
+            if i >= REPORT_HEAD_LINES:
+                break
+            if fixture_id is None:
+                match = FIXTURE_RE.search(line)
+                if match:
+                    fixture_id = int(match.group(1))
+            if bore_angle is None:
+                match = BORE_ANGLE_RE.search(line)
+                if match:
+                    bore_angle = float(match.group(1))
+            if fixture_id is not None and bore_angle is not None:
+                break
+    return fixture_id, bore_angle
+
+
+def scan_folder(folder_path, folder, previous=None):
+    """Build a catalog row for one piano folder, re-reading only files that changed"""
+    entries = {}
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            if entry.is_file():
+                entries[entry.name] = entry.stat()
+
+    previous = dict(previous) if previous else {}
+    make, serial = split_folder_name(folder)
+    row = {
+        'folder': folder,
+        'make': make,
+        'serial': serial,
+        'section': section_from_name(folder),
+        'folder_mtime': os.stat(folder_path).st_mtime,
+        'scanned_at': time.time(),
+    }
+
+    def changed(prefix, name):
+        stat = entries[name]
+        return (previous.get(f'{prefix}_path') != os.path.join(folder_path, name) or
+                previous.get(f'{prefix}_size') != stat.st_size or
+                previous.get(f'{prefix}_mtime') != stat.st_mtime)
+
+    # Probe CSV
+    csv_name = f"{folder}.csv"
+    if csv_name in entries:
+        stat = entries[csv_name]
+        rows = previous.get('csv_rows')
+        if changed('csv', csv_name):
+            rows = max(count_lines(os.path.join(folder_path, csv_name)) - 1, 0)
+        row.update(csv_path=os.path.join(folder_path, csv_name), csv_size=stat.st_size,
+                   csv_mtime=stat.st_mtime, csv_rows=rows)
+
+    # Shaping program - {piano_id}.tap, newest if there is more than one
+    taps = [name for name in entries if name.lower().endswith('.tap')]
+    tap_name = f"{folder}.tap" if f"{folder}.tap" in entries else \
+        max(taps, key=lambda name: entries[name].st_mtime, default=None)
+    if tap_name:
+        stat = entries[tap_name]
+        lines = previous.get('tap_lines')
+        if changed('tap', tap_name):
+            lines = count_lines(os.path.join(folder_path, tap_name))
+        row.update(tap_path=os.path.join(folder_path, tap_name), tap_size=stat.st_size,
+                   tap_mtime=stat.st_mtime, tap_lines=lines)
+
+    # Report - only the header is read
+    report_name = f"{folder}_Report.txt"
+    if report_name in entries:
+        stat = entries[report_name]
+        fixture_id, bore_angle = previous.get('fixture_id'), previous.get('bore_angle')
+        if changed('report', report_name):
+            fixture_id, bore_angle = parse_report_head(os.path.join(folder_path, report_name))
+        row.update(report_path=os.path.join(folder_path, report_name), report_size=stat.st_size,
+                   report_mtime=stat.st_mtime, fixture_id=fixture_id, bore_angle=bore_angle)
+
+    return row
+
+
+def refresh(logs_dir=LOGS_DIR, full=False, conn=None):
+    """Bring the catalog up to date with the Logs folder, returns (scanned, removed) counts
+
+    Every piano folder is listed and its CSV, tap and report compared by size and mtime
+    with the catalog row - a directory's mtime misses a file rewritten in place (an
+    appended report). Only changed files are read and only changed rows written.
+    full=True re-reads every file.
+    """
+    conn = conn or open_catalog(logs_dir)
+    known = {r['folder']: r for r in conn.execute("SELECT * FROM pianos")}
+
+    present = set()
+    scanned = 0
+    with os.scandir(logs_dir) as it:
+        for entry in it:
+            if not entry.is_dir():
+                continue
+            previous = known.get(entry.name)
+            if previous is None and not os.path.exists(os.path.join(entry.path, f"{entry.name}.csv")):
+                continue  # Not a piano folder
+            present.add(entry.name)
+
+            data = scan_folder(entry.path, entry.name, None if full else previous)
+            if previous is not None and not full and \
+                    all(previous[column] == data.get(column) for column in FILE_COLUMNS):
+                continue
+            columns = ', '.join(data)
+            placeholders = ', '.join('?' for _ in data)
+            conn.execute(f"INSERT OR REPLACE INTO pianos ({columns}) VALUES ({placeholders})",
+                         list(data.values()))
+            scanned += 1
+
+    removed = [folder for folder in known if folder not in present]
+    conn.executemany("DELETE FROM pianos WHERE folder = ?", [(folder,) for folder in removed])
+    conn.commit()
+    return scanned, len(removed)
+
+
+def latest(conn, section=None):
+    """Most recently probed piano folder (optionally for one section), or None"""
+    query = "SELECT * FROM pianos WHERE csv_path IS NOT NULL"
+    args = []
+    if section:
+        query += " AND section = ?"
+        args.append(section)
+    row = conn.execute(query + " ORDER BY csv_mtime DESC LIMIT 1", args).fetchone()
+    return dict(row) if row else None
+
+
+def by_fixture(conn, fixture_id):
+    """Piano folders probed on a fixture, newest first"""
+    rows = conn.execute("SELECT * FROM pianos WHERE fixture_id = ? ORDER BY folder_mtime DESC",
+                        (int(fixture_id),))
+    return [dict(row) for row in rows]
+
+
+def by_serial(conn, serial):
+    """Piano folders for a serial number, newest first"""
+    rows = conn.execute("SELECT * FROM pianos WHERE serial = ? ORDER BY folder_mtime DESC",
+                        (str(serial),))
+    return [dict(row) for row in rows]
+
+
+def export_lookup(conn, path):
+    """Write the flat lookup file read by ProbeScripts (one pipe-separated line per folder)"""
+    with open(path, 'w') as f:
+        f.write("# folder|make|serial|section|fixture_id|bore_angle|tap_file\n")
+        for row in conn.execute("SELECT * FROM pianos ORDER BY folder_mtime DESC"):
+            fixture = '' if row['fixture_id'] is None else str(row['fixture_id'])
+            angle = '' if row['bore_angle'] is None else f"{row['bore_angle']:.4f}"
+            tap = os.path.basename(row['tap_path']) if row['tap_path'] else ''
+            f.write(f"{row['folder']}|{row['make']}|{row['serial']}|{row['section']}|"
+                    f"{fixture}|{angle}|{tap}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the Logs archive and export the Mach4 lookup file")
+    parser.add_argument('--logs', default=LOGS_DIR, help="Logs folder to index")
+    parser.add_argument('--full', action='store_true', help="Re-read every file, ignoring the catalogued sizes and mtimes")
+    parser.add_argument('--fixture', type=int, help="List folders probed on this fixture ID")
+    parser.add_argument('--serial', help="List folders for this serial number")
+    parser.add_argument('--latest', action='store_true', help="Show the most recently probed folder")
+    args = parser.parse_args()
+
+    start = time.time()
+    conn = open_catalog(args.logs)
+    scanned, removed = refresh(args.logs, args.full, conn)
+    export_lookup(conn, os.path.join(args.logs, LOOKUP_NAME))
+    total = conn.execute("SELECT COUNT(*) FROM pianos").fetchone()[0]
+    print(f"Catalog: {total} folders, {scanned} re-scanned, {removed} removed ({time.time() - start:.2f}s)")
+
+    rows = []
+    if args.fixture is not None:
+        rows = by_fixture(conn, args.fixture)
+    elif args.serial:
+        rows = by_serial(conn, args.serial)
+    elif args.latest:
+        rows = [r for r in [latest(conn)] if r]
+    for row in rows:
+        print(f"  {row['folder']}: fixture {row['fixture_id']}, bore {row['bore_angle']}, "
+              f"{row['csv_rows']} probe rows, tap {row['tap_lines']} lines")
+
+
+if __name__ == '__main__':
+    main()
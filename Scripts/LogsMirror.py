@@ -0,0 +1,299 @@
+"""
+Logs Mirror - Local read-through cache of the BLPCNC Logs share
+Files under the share are copied to a local cache directory on first read and served locally
+while their size and mtime on the share are unchanged. Paths outside the share pass through.
+"""
+
+import argparse
+import atexit
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+SHARE_DIR = r"\\BLPCNC\Mach4Hobby\Profiles\BLP\Logs"
+LOCAL_LOGS_DIR = r"C:\Mach4Hobby\Profiles\BLP\Logs"  # The same folder on the CNC PC itself
+LOGS_DIR = LOCAL_LOGS_DIR if os.path.isdir(LOCAL_LOGS_DIR) else SHARE_DIR  # Elsewhere Logs is read through the mirror
+MIRROR_DIR = os.path.join(os.environ.get('LOCALAPPDATA', tempfile.gettempdir()), 'BLPLogsMirror')
+MIRROR_MAX_BYTES = 2 * 1024 ** 3  # LRU eviction above this
+INDEX_NAME = "mirror_index.json"
+INDEX_SAVE_INTERVAL = 30  # Seconds between index writes when only hits changed it (access times, counters)
+INDEX_LOCK_TIMEOUT = 10  # Seconds before another process's index lock is treated as stale
+PROGRAM_EXTENSIONS = ('.tap', '.tap.orig', '.tap.compact', '.gcbin', '.rfh')  # Replaced by every job - not prefetched
+COUNTERS = ('hits', 'misses', 'bytes_copied', 'bytes_saved', 'evictions')
+
+
+def file_sha1(path):
+    """SHA1 of a file's contents"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class LogsMirror:
+    """Read-through cache of a source folder, validated by size+mtime, LRU by bytes"""
+
+    def __init__(self, source_dir=SHARE_DIR, cache_dir=MIRROR_DIR, max_bytes=MIRROR_MAX_BYTES,
+                 verify_hash=False):
+        self.source_dir = os.path.normcase(os.path.abspath(source_dir))
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.verify_hash = verify_hash  # Also check the local copy against its SHA1 on every hit
+        self.counters = dict.fromkeys(COUNTERS, 0)  # This session
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(cache_dir, INDEX_NAME)
+        try:
+            with open(self._index_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self._index = data.get('files', {})
+        self.totals = dict(dict.fromkeys(COUNTERS, 0), **data.get('totals', {}))  # Since the cache was created
+        self._pending = dict.fromkeys(COUNTERS, 0)  # Counted since the last index write
+        self._evicted = {}  # Evicted since the last index write -> eviction time
+        self._dirty = False
+        self._saved_at = 0.0
+
+    def _relative(self, path):
+        """Path relative to the source folder, or None if it is outside it"""
+        full = os.path.normcase(os.path.abspath(path))
+        if not full.startswith(self.source_dir + os.sep):
+            return None
+        return full[len(self.source_dir) + 1:]
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        """Hold the index lock file - one process at a time merges and writes the index"""
+        lock_path = self._index_path + '.lock'
+        deadline = time.time() + INDEX_LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                if time.time() > deadline:
+                    try:
+                        os.remove(lock_path)  # Left behind by a process that died while writing
+                    except OSError:
+                        pass
+                    deadline = time.time() + INDEX_LOCK_TIMEOUT
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    def _merge_index(self):
+        """Merge the index on disk (written by other processes) into this one
+
+        An entry on disk and here keeps the later copy and the later access; entries this
+        process evicted are dropped unless copied again since. Entries whose cached file is
+        gone are dropped so the eviction total counts every file in the cache.
+        """
+        try:
+            with open(self._index_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        for rel, entry in data.get('files', {}).items():
+            mine = self._index.get(rel)
+            if mine is None:
+                if entry.get('copied', 0) > self._evicted.get(rel, 0):
+                    self._index[rel] = entry
+            elif entry.get('copied', 0) > mine.get('copied', 0):
+                self._index[rel] = dict(entry, last_access=max(entry['last_access'], mine['last_access']))
+            else:
+                mine['last_access'] = max(entry['last_access'], mine['last_access'])
+        for rel in [rel for rel in self._index if not os.path.exists(os.path.join(self.cache_dir, rel))]:
+            del self._index[rel]
+        self._evicted = {}
+        return dict(dict.fromkeys(COUNTERS, 0), **data.get('totals', {}))
+
+    def _save_index(self, force=True, keep=None):
+        """Merge and write the index - unless force is off and it was written less than INDEX_SAVE_INTERVAL ago
+
+        The add-in and the Scripts tools share the cache, so the index on disk is merged
+        under a lock file before it is replaced (see _merge_index).
+        """
+        self._dirty = True
+        if not force and time.time() - self._saved_at < INDEX_SAVE_INTERVAL:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._index_lock():
+            totals = self._merge_index()
+            self._evict(keep)
+            self.totals = {name: totals[name] + self._pending[name] for name in COUNTERS}
+            fd, tmp_path = tempfile.mkstemp(prefix=INDEX_NAME + '.', suffix='.tmp', dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({'files': self._index, 'totals': self.totals}, f)
+                os.replace(tmp_path, self._index_path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self._pending = dict.fromkeys(COUNTERS, 0)
+        self._dirty = False
+        self._saved_at = time.time()
+
+    def flush(self):
+        """Write the index if hits changed it since the last write"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _count(self, name, amount=1):
+        self.counters[name] += amount
+        self.totals[name] += amount
+        self._pending[name] += amount
+
+    def _evict(self, keep):
+        """Drop least recently used copies until the cache fits in max_bytes"""
+        total = sum(entry['size'] for entry in self._index.values())
+        for rel in sorted(self._index, key=lambda r: self._index[r]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if rel == keep:
+                continue  # Never evict the file being served
+            total -= self._index[rel]['size']
+            try:
+                os.remove(os.path.join(self.cache_dir, rel))
+            except OSError:
+                pass
+            del self._index[rel]
+            self._evicted[rel] = time.time()
+            self._count('evictions')
+
+    def path(self, source_path):
+        """Local path to read source_path from, copying it into the cache if needed"""
+        rel = self._relative(source_path)
+        if rel is None:
+            return source_path
+
+        stat = os.stat(source_path)
+        local_path = os.path.join(self.cache_dir, rel)
+        with self._lock:
+            entry = self._index.get(rel)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime \
+                    and os.path.exists(local_path) \
+                    and (not self.verify_hash or file_sha1(local_path) == entry['sha1']):
+                entry['last_access'] = time.time()
+                self._count('hits')
+                self._count('bytes_saved', stat.st_size)
+                self._save_index(force=False, keep=rel)
+                return local_path
+
+            # Miss or stale - copy to a unique temp name so a failed copy never looks valid
+            # and two processes copying the same file never write into each other's copy
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(local_path) + '.', suffix='.part',
+                                            dir=os.path.dirname(local_path))
+            os.close(fd)
+            try:
+                shutil.copyfile(source_path, tmp_path)
+                os.replace(tmp_path, local_path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            now = time.time()
+            self._index[rel] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'sha1': file_sha1(local_path) if self.verify_hash else None,
+                'copied': now,
+                'last_access': now,
+            }
+            self._count('misses')
+            self._count('bytes_copied', stat.st_size)
+            self._save_index(keep=rel)
+            return local_path
+
+    def open(self, source_path, mode='r', **kwargs):
+        """Open a file for reading through the cache"""
+        if any(c in mode for c in 'wax+'):
+            raise ValueError(f"LogsMirror only serves reads, got mode {mode!r}")
+        return open(self.path(source_path), mode, **kwargs)
+
+    def prefetch(self, folder, skip_ext=()):
+        """Copy every file in a source folder into the cache, returns the number of files"""
+        count = 0
+        for name in os.listdir(folder):
+            source_path = os.path.join(folder, name)
+            if os.path.isfile(source_path) and not name.lower().endswith(tuple(skip_ext)):
+                self.path(source_path)
+                count += 1
+        return count
+
+    def stats(self, totals=False):
+        """Hit/miss/byte counters (this session, or since the cache was created) plus cache size"""
+        with self._lock:
+            result = dict(self.totals if totals else self.counters)
+            result['files'] = len(self._index)
+            result['cached_bytes'] = sum(entry['size'] for entry in self._index.values())
+        return result
+
+    def clear(self):
+        """Remove every cached copy"""
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self._index = {}
+            self.totals = dict.fromkeys(COUNTERS, 0)
+            self._pending = dict.fromkeys(COUNTERS, 0)
+            self._evicted = {}
+            self._dirty = False
+
+
+_default_mirror = None
+
+
+def get_mirror():
+    """Shared mirror instance for the Python tools"""
+    global _default_mirror
+    if _default_mirror is None:
+        _default_mirror = LogsMirror()
+        atexit.register(_default_mirror.flush)
+    return _default_mirror
+
+
+def mirror_path(path):
+    """Local path to read a Logs file from (unchanged if it is not on the share)"""
+    return get_mirror().path(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local mirror of the BLPCNC Logs share")
+    parser.add_argument('--source', default=SHARE_DIR, help="Share folder being mirrored")
+    parser.add_argument('--cache', default=MIRROR_DIR, help="Local cache folder")
+    parser.add_argument('--prefetch', metavar='FOLDER', help="Copy a piano folder into the cache")
+    parser.add_argument('--clear', action='store_true', help="Empty the cache")
+    args = parser.parse_args()
+
+    mirror = LogsMirror(args.source, args.cache)
+    if args.clear:
+        mirror.clear()
+    if args.prefetch:
+        folder = args.prefetch
+        if not os.path.isabs(folder):
+            folder = os.path.join(args.source, folder)
+        start = time.time()
+        count = mirror.prefetch(folder)
+        print(f"Prefetched {count} files in {time.time() - start:.2f}s")
+        mirror.flush()
+
+    stats = mirror.stats(totals=True)
+    print(f"Mirror {args.cache}: {stats['files']} files, {stats['cached_bytes'] / 1e6:.1f} MB cached "
+          f"(limit {mirror.max_bytes / 1e6:.0f} MB)")
+    print(f"  {stats['hits']} hits, {stats['misses']} misses, {stats['bytes_saved'] / 1e6:.1f} MB saved, "
+          f"{stats['evictions']} evictions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Machine Config - Read the Mach4 profile's Machine.ini, tool table and fixture table
+Axis limits are converted from motor counts to program units (inches, seconds)
+Fixture_1 in fixturetable.tls is G54, Fixture_2 is G55 ... (same numbering as GetFixOffsetVars)
+"""
+
+import argparse
+import configparser
+import os
+
+PROFILE_DIR = r"C:\Mach4Hobby\Profiles\BLP"
+MACHINE_INI = os.path.join(PROFILE_DIR, "Machine.ini")
+TOOL_TABLE = os.path.join(PROFILE_DIR, "ToolTables", "tooltable.tls")
+FIXTURE_TABLE = os.path.join(PROFILE_DIR, "FixtureTables", "fixturetable.tls")
+
+AXES = 'XYZ'
+
+
+def read_ini(path):
+    """Parse a Mach4 ini-style file, keeping key case (sections that repeat are merged)
+
+    Mach4 can leave stray keys above the first section - they are read into a '_' section.
+    """
+    parser = configparser.ConfigParser(strict=False, interpolation=None)
+    parser.optionxform = str
+    with open(path, 'r', errors='replace') as f:
+        parser.read_string("[_]\n" + f.read(), source=path)
+    return parser
+
+
+def axis_limits(path=MACHINE_INI):
+    """Per-axis limits from Machine.ini: {axis: {'velocity', 'accel', 'soft_min', 'soft_max', 'soft_limits'}}
+
+    velocity is in units/s and accel in units/s^2 - Mach4 stores both per motor in counts.
+    """
+    ini = read_ini(path)
+    limits = {}
+    for index, axis in enumerate(AXES):
+        section = f"Axis{index}"
+        if not ini.has_section(section) or ini.get(section, 'Enabled', fallback='0') != '1':
+            continue
+        motor = ini[ini.get(section, 'ChildMotor0')]
+        counts = float(motor['CountsPerUnit'])
+        limits[axis] = {
+            'velocity': float(motor['MaxVelocity']) / counts,
+            'accel': float(motor['MaxAccel']) / counts,
+            'soft_min': float(motor['SoftMinLimit']) / counts,
+            'soft_max': float(motor['SoftMaxLimit']) / counts,
+            'soft_limits': ini.get(section, 'SoftLimitUsed', fallback='0') == '1',
+        }
+    return limits
+
+
+def tool_table(path=TOOL_TABLE):
+    """Tool table: {tool: {'length', 'diameter', 'description', 'x_change', 'y_change', 'z_change'}}
+
+    length includes the length wear, as G43 applies it.
+    """
+    ini = read_ini(path)
+    tools = {}
+    for section in ini.sections():
+        if not section.startswith('Tool') or not section[4:].isdigit():
+            continue
+        data = ini[section]
+
+        def number(key):
+            try:
+                return float(data.get(key, 0) or 0)
+            except ValueError:
+                return 0.0
+
+        tools[int(section[4:])] = {
+            'length': number('Length') + number('LengthWear'),
+            'diameter': number('Diameter') + number('DiameterWear'),
+            'description': data.get('Desc', ''),
+            'x_change': number('XToolChange'),
+            'y_change': number('YToolChange'),
+            'z_change': number('ZToolChange'),
+        }
+    return tools
+
+
+def fixture_offsets(path=FIXTURE_TABLE):
+    """Fixture table: {fixture number: (x, y, z)} - 1 is G54, 2 is G55 ..."""
+    ini = read_ini(path)
+    offsets = {}
+    for section in ini.sections():
+        if section.startswith('Fixture_') and section[8:].isdigit():
+            data = ini[section]
+            offsets[int(section[8:])] = tuple(float(data.get(f"{axis}_Offset", 0)) for axis in AXES)
+    return offsets
+
+
+def fixture_number(work_offset):
+    """Fixture table number of a G54-G59 work offset"""
+    return int(work_offset) - 53
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the machine limits, fixtures and tools from a Mach4 profile")
+    parser.add_argument('--profile', default=PROFILE_DIR, help="Mach4 profile folder")
+    args = parser.parse_args()
+
+    for axis, limit in axis_limits(os.path.join(args.profile, "Machine.ini")).items():
+        print(f"{axis}: {limit['velocity'] * 60:.0f} ipm, {limit['accel']:.0f} in/s^2, "
+              f"soft limits {limit['soft_min']:.3f} to {limit['soft_max']:.3f}"
+              f"{'' if limit['soft_limits'] else ' (not used)'}")
+    for number, offset in sorted(fixture_offsets(os.path.join(args.profile, "FixtureTables", "fixturetable.tls")).items()):
+        if number <= 6:
+            print(f"G{number + 53}: X{offset[0]:.4f} Y{offset[1]:.4f} Z{offset[2]:.4f}")
+    tools = tool_table(os.path.join(args.profile, "ToolTables", "tooltable.tls"))
+    print(f"{len(tools)} tools in the tool table")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""
+Normalize G-code - Streaming expansion of arcs and canned cycles into plain G0/G1 moves
+G2/G3 arcs (IJK or R, G17/G18/G19, G90.1/G91.1 centers) become chords within a tolerance
+G81-G83, G85, G86 and G89 drilling cycles become explicit moves; every other line is passed through unchanged
+"""
+
+import argparse
+import math
+import os
+import re
+import time
+
+ARC_TOLERANCE = 0.0005  # Max chord deviation from the arc (program units)
+PECK_CLEARANCE = 0.01  # G83: rapid back down to this far above the last peck depth
+
+WORD_RE = re.compile(r'([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+COMMENT_RE = re.compile(r'\([^)]*\)|;.*')
+AXES = 'XYZ'
+
+# Plane -> (first axis, second axis, linear axis, center word for each plane axis)
+PLANES = {
+    17: ('X', 'Y', 'Z', 'I', 'J'),
+    18: ('Z', 'X', 'Y', 'K', 'I'),
+    19: ('Y', 'Z', 'X', 'J', 'K'),
+}
+
+CYCLES = (81, 82, 83, 85, 86, 89)
+UNSUPPORTED_CYCLES = (73, 74, 76, 84, 87, 88)  # Tapping/boring cycles need spindle sync - re-post these
+SETUP_G = (10, 28, 30, 92)
+
+
+def format_number(value):
+    """Fusion-style coordinate: 4 decimals, trailing zeros dropped (1. and 0.)"""
+    text = f"{value:.4f}".rstrip('0')
+    return '0.' if text == '-0.' else text
+
+
+class Normalizer:
+    """Modal state of a program as it streams past, expanding arcs and canned cycles"""
+
+    def __init__(self, tolerance=ARC_TOLERANCE):
+        self.tolerance = tolerance
+        self.position = {axis: math.nan for axis in AXES}
+        self.absolute = True
+        self.absolute_centers = False  # G91.1 (incremental IJK) is the Mach4 default
+        self.plane = 17
+        self.motion = None
+        self.retract_initial = True  # G98 / G99
+        self.cycle = {}  # Modal cycle words (Z, R, Q, P, F) and the initial Z level
+        self.line_number = 0
+        self.arcs = self.cycles = self.added = 0
+
+    def error(self, message):
+        return ValueError(f"Line {self.line_number}: {message}")
+
+    def process(self, line):
+        """Output lines for one input line (the line itself unless it was expanded)"""
+        self.line_number += 1
+        code = COMMENT_RE.sub(' ', line).upper()
+        words = WORD_RE.findall(code)
+        if not words:
+            return [line]
+
+        g_codes = [float(value) for letter, value in words if letter == 'G']
+        values = {letter: float(value) for letter, value in words if letter != 'G'}
+        machine = setup = False
+        for g in g_codes:
+            if g == 90:
+                self.absolute = True
+            elif g == 91:
+                self.absolute = False
+            elif g == 90.1:
+                self.absolute_centers = True
+            elif g == 91.1:
+                self.absolute_centers = False
+            elif g in (17, 18, 19):
+                self.plane = int(g)
+            elif g == 98:
+                self.retract_initial = True
+            elif g == 99:
+                self.retract_initial = False
+            elif g == 53:
+                machine = True
+            elif g in SETUP_G:
+                setup = True
+            elif g in (0, 1, 2, 3, 80) or g in CYCLES:
+                if g in CYCLES and self.motion != int(g):
+                    self.cycle = {'initial': self.position['Z']}
+                self.motion = int(g)
+            elif g in UNSUPPORTED_CYCLES:
+                raise self.error(f"G{g:g} cycles cannot be expanded")
+
+        has_axis = any(axis in values for axis in AXES)
+        if machine or setup:
+            # Machine-coordinate and reference moves leave the work position unknown
+            if machine:
+                for axis in AXES:
+                    if axis in values:
+                        self.position[axis] = math.nan
+            return [line]
+
+        if self.motion in (2, 3) and (has_axis or any(word in values for word in 'IJKR')):
+            return self.arc(line, words, values)
+        if self.motion in CYCLES:
+            for word in 'ZRQPF':
+                if word in values:
+                    self.cycle[word] = values[word]
+            if has_axis or any(g in CYCLES for g in g_codes):
+                return self.drill(line, words, values)
+            return [line]
+
+        if has_axis:
+            for axis in AXES:
+                if axis in values:
+                    self.position[axis] = values[axis] if self.absolute else self.position[axis] + values[axis]
+        return [line]
+
+    def carried_words(self, line, words, skip):
+        """(leading, trailing) words of a line that are kept on its first expanded line, plus its comments"""
+        leading = [f"{letter}{value}" for letter, value in words
+                   if letter == 'N' or (letter == 'G' and float(value) not in (2, 3) and float(value) not in CYCLES)]
+        trailing = [f"{letter}{value}" for letter, value in words if letter not in skip and letter not in 'NG']
+        trailing += COMMENT_RE.findall(line)
+        return leading, trailing
+
+    def arc(self, line, words, values):
+        """Expand one G2/G3 move into G1 chords"""
+        a1, a2, linear, c1, c2 = PLANES[self.plane]
+        start = dict(self.position)
+        end = {}
+        for axis in AXES:
+            if axis not in values:
+                end[axis] = start[axis]
+            else:
+                end[axis] = values[axis] if self.absolute else start[axis] + values[axis]
+        if any(math.isnan(start[axis]) for axis in AXES):
+            raise self.error("arc starts from an unknown position")
+
+        s1, s2, e1, e2 = start[a1], start[a2], end[a1], end[a2]
+        clockwise = self.motion == 2
+        if 'R' in values:
+            radius = values['R']
+            d1, d2 = e1 - s1, e2 - s2
+            chord = math.hypot(d1, d2)
+            if chord == 0:
+                raise self.error("R-form arc with coincident end points")
+            h = math.sqrt(max(radius * radius - chord * chord / 4, 0))
+            # Center left of the travel direction for CCW minor arcs, right for CW; R < 0 flips to the major arc
+            side = (-1 if clockwise else 1) * (-1 if radius < 0 else 1)
+            center1 = (s1 + e1) / 2 - side * h * d2 / chord
+            center2 = (s2 + e2) / 2 + side * h * d1 / chord
+        elif self.absolute_centers:
+            center1, center2 = values.get(c1, s1), values.get(c2, s2)
+        else:
+            center1, center2 = s1 + values.get(c1, 0), s2 + values.get(c2, 0)
+
+        r_start = math.hypot(s1 - center1, s2 - center2)
+        r_end = math.hypot(e1 - center1, e2 - center2)
+        angle_start = math.atan2(s2 - center2, s1 - center1)
+        angle_end = math.atan2(e2 - center2, e1 - center1)
+        if clockwise:
+            sweep = -((angle_start - angle_end) % (2 * math.pi)) or -2 * math.pi
+        else:
+            sweep = (angle_end - angle_start) % (2 * math.pi) or 2 * math.pi
+
+        radius = max(r_start, r_end)
+        if self.tolerance < radius:
+            step = 2 * math.acos(1 - self.tolerance / radius)
+        else:
+            step = math.pi / 2
+        count = max(1, math.ceil(abs(sweep) / step))
+
+        helical = end[linear] != start[linear]
+        leading, trailing = self.carried_words(line, words, 'XYZIJKR')
+        output = []
+        previous = start
+        for k in range(1, count + 1):
+            if k == count:
+                point = end
+            else:
+                fraction = k / count
+                angle = angle_start + sweep * fraction
+                r = r_start + (r_end - r_start) * fraction
+                point = {a1: center1 + r * math.cos(angle), a2: center2 + r * math.sin(angle),
+                         linear: start[linear] + (end[linear] - start[linear]) * fraction}
+            coords = []
+            for axis in AXES:
+                if axis == linear and not helical:
+                    continue
+                if self.absolute:
+                    coords.append(f"{axis}{format_number(point[axis])}")
+                else:
+                    delta = round(point[axis] - start[axis], 4) - round(previous[axis] - start[axis], 4)
+                    coords.append(f"{axis}{format_number(delta)}")
+            if k == 1:
+                output.append(" ".join(leading + ['G1'] + coords + trailing))
+            else:
+                output.append(" ".join(coords))
+            previous = point
+
+        self.position = end
+        self.arcs += 1
+        self.added += count - 1
+        return output
+
+    def drill(self, line, words, values):
+        """Expand one canned-cycle hole into rapids, feeds and dwells"""
+        if not self.absolute:
+            raise self.error("incremental (G91) canned cycles are not supported")
+        cycle = self.cycle
+        if 'Z' not in cycle or 'R' not in cycle:
+            raise self.error(f"G{self.motion} needs Z and R")
+        x = values.get('X', self.position['X'])
+        y = values.get('Y', self.position['Y'])
+        if math.isnan(x) or math.isnan(y) or math.isnan(self.position['Z']):
+            raise self.error("canned cycle starts from an unknown position")
+
+        bottom, r_level = cycle['Z'], cycle['R']
+        initial = cycle['initial'] if not math.isnan(cycle.get('initial', math.nan)) else self.position['Z']
+        retract = max(initial, r_level) if self.retract_initial else r_level
+        feed = f" F{format_number(cycle['F'])}" if 'F' in values else ""
+        dwell = f"G4 P{format_number(cycle['P'])}" if cycle.get('P') else None
+
+        leading, trailing = self.carried_words(line, words, 'XYZRQPFL')
+        output = [" ".join(leading + ['G0', f"X{format_number(x)}", f"Y{format_number(y)}"] + trailing),
+                  f"Z{format_number(r_level)}"]
+        if self.motion == 83 and cycle.get('Q'):
+            depth = r_level
+            first = True
+            while depth > bottom:
+                depth = max(depth - cycle['Q'], bottom)
+                output.append(f"G1 Z{format_number(depth)}" + (feed if first else ""))
+                first = False
+                if depth > bottom:
+                    output.append(f"G0 Z{format_number(r_level)}")
+                    output.append(f"Z{format_number(depth + PECK_CLEARANCE)}")
+        else:
+            output.append(f"G1 Z{format_number(bottom)}{feed}")
+
+        if self.motion in (82, 89) and dwell:
+            output.append(dwell)
+        if self.motion in (85, 89):
+            output.append(f"G1 Z{format_number(r_level)}")  # Feed out
+            if retract != r_level:
+                output.append(f"G0 Z{format_number(retract)}")
+        elif self.motion == 86:
+            output += ["M5", f"G0 Z{format_number(retract)}", "M3"]
+        else:
+            output.append(f"G0 Z{format_number(retract)}")
+
+        self.position.update({'X': x, 'Y': y, 'Z': retract})
+        self.cycles += 1
+        self.added += len(output) - 1
+        return output
+
+
+def normalize_lines(lines, tolerance=ARC_TOLERANCE, normalizer=None):
+    """Stream output lines for an iterable of input lines (without newlines)"""
+    normalizer = normalizer or Normalizer(tolerance)
+    for line in lines:
+        yield from normalizer.process(line)
+
+
+def normalize_file(in_path, out_path, tolerance=ARC_TOLERANCE):
+    """Write a normalized copy of a G-code file, returns the normalizer for its counts"""
+    normalizer = Normalizer(tolerance)
+    tmp_path = out_path + '.part'
+    with open(in_path, 'r') as src, open(tmp_path, 'w') as dst:
+        for line in normalize_lines((line.rstrip('\n') for line in src), normalizer=normalizer):
+            dst.write(line + '\n')
+    os.replace(tmp_path, out_path)
+    return normalizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand arcs and canned cycles into G0/G1 moves")
+    parser.add_argument('gcode', help="G-code file to normalize")
+    parser.add_argument('--output', default=None, help="Output file (default: <name>_linear.tap)")
+    parser.add_argument('--tolerance', type=float, default=ARC_TOLERANCE, help="Max chord deviation from arcs")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.gcode)[0] + '_linear.tap'
+    start = time.time()
+    try:
+        result = normalize_file(args.gcode, output, args.tolerance)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    print(f"{result.line_number} lines: {result.arcs} arcs, {result.cycles} cycle holes expanded, "
+          f"{result.added} lines added ({time.time() - start:.2f}s) -> {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,62 +1,45 @@
 """
 Plot Key Parameters - Visualize probe points and parameter-generated outlines
+Parameters come from the add-in's solver sidecar ({piano}_Solver.json), re-solved if it is missing or stale
 """
 
+import argparse
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D
 import csv
 import os
-import glob
+
+import KeytopSolver
+import LogsCatalog
+from KeytopSolver import LOGS_DIR
+from LogsMirror import mirror_path
 
 # Configuration
 KEY_LENGTH = 6.1  # inches
 
-# Find the most recent probe CSV in Downloads
-downloads_path = os.path.join(os.environ.get('USERPROFILE', ''), 'Downloads')
-probe_files = glob.glob(os.path.join(downloads_path, '*_Lower.csv')) + \
-              glob.glob(os.path.join(downloads_path, '*_Upper.csv'))
-if not probe_files:
-    print("No probe CSV files (*_Lower.csv or *_Upper.csv) found in Downloads")
-    exit(1)
-PROBE_CSV = max(probe_files, key=os.path.getmtime)
-print(f"Using probe file: {os.path.basename(PROBE_CSV)}")
-
-# Find the most recent KeyParameters CSV in Documents
-documents_path = os.path.join(os.environ.get('USERPROFILE', ''), 'Documents')
-params_files = glob.glob(os.path.join(documents_path, 'KeyParameters_*.csv'))
-if not params_files:
-    print("No KeyParameters CSV files found in Documents")
-    exit(1)
-PARAMS_CSV = max(params_files, key=os.path.getmtime)
-print(f"Using parameters file: {os.path.basename(PARAMS_CSV)}")
-
-def rotate_point(point, angle_deg, center):
-    """Rotate a point around center by angle (in degrees)."""
-    angle_rad = np.deg2rad(angle_deg)
-    c, s = np.cos(angle_rad), np.sin(angle_rad)
-    dx = point[0] - center[0]
-    dy = point[1] - center[1]
-    x_rot = dx * c - dy * s + center[0]
-    y_rot = dx * s + dy * c + center[1]
-    return np.array([x_rot, y_rot])
 
-def main():
-    # Read probe data
-    probe_df = pd.read_csv(PROBE_CSV)
+def find_most_recent_csv():
+    """Find the most recent probe CSV in the Logs directory (via the Logs catalog)"""
+    conn = LogsCatalog.open_catalog(LOGS_DIR)
+    LogsCatalog.refresh(LOGS_DIR, conn=conn)
+    entry = LogsCatalog.latest(conn)
+    conn.close()
+    return entry['csv_path'] if entry else None
 
-    # Read parameter data
+
+def read_params_csv(params_csv):
+    """Read a KeyParameters_*.csv, returns (params_data, global_params)"""
     params_data = []
     global_params = {}
-
-    # First pass - read data rows
-    with open(PARAMS_CSV, 'r') as f:
+    with open(params_csv, 'r') as f:
         reader = csv.reader(f)
-        headers = next(reader)  # Get headers
-
+        next(reader)  # Headers
         for row in reader:
             if row and row[0] and not row[0].startswith('#'):
-                # Regular data row
                 params_data.append({
                     'Key': int(row[0]),
                     'ShoulderType': row[1],
@@ -66,41 +49,135 @@ def main():
                     'LeftStep': float(row[5]) if row[5] else 0,
                     'RightStep': float(row[6]) if row[6] else 0
                 })
+            elif row and row[0].startswith('# ') and len(row) == 2:
+                # Global parameters are written after the data rows
+                global_params[row[0][2:]] = float(row[1])
+    return params_data, global_params
+
+
+def solver_params(probe_csv):
+    """Parameters for a probe CSV from the add-in's solver sidecar, re-solving if it is missing or stale"""
+    key_params, shoulder_length, key_height, source = KeytopSolver.load_or_solve(probe_csv)
+    if source == 'sidecar':
+        print(f"Using solver sidecar: {os.path.basename(KeytopSolver.solver_sidecar_path(probe_csv))}")
+    else:
+        print("No current solver sidecar - solved from probe data")
+
+    params_data = [{
+        'Key': key_num,
+        'ShoulderType': KeytopSolver.key_shoulders(key_num),
+        'CenterX': params['X'],
+        'Angle': params['Angle'],
+        'Width': params['Width'],
+        'LeftStep': params['LStep'],
+        'RightStep': params['RStep'],
+    } for key_num, params in sorted(key_params.items())]
+    return params_data, {'ShoulderLength': shoulder_length, 'KeyHeight': key_height}
+
+
+def key_outlines(params_data, front_y, shoulder_len):
+    """Build every keytop outline as one (keys, 9, 2) array of closed polygons
+
+    Keys without a shoulder on a side repeat that side's tail corner, so every
+    polygon has the same number of points and the whole set rotates in one step.
+    Returns (outlines, label_xy).
+    """
+    keys = np.array([p['Key'] for p in params_data])
+    center_x = np.array([p['CenterX'] for p in params_data])
+    angle = np.deg2rad([p['Angle'] for p in params_data])  # F360 angle (already negated)
+    half_width = np.array([p['Width'] for p in params_data]) / 2.0
+    left_step = np.array([p['LeftStep'] for p in params_data])
+    right_step = np.array([p['RightStep'] for p in params_data])
+    stype = np.array([p['ShoulderType'] for p in params_data])
+
+    # Y levels from the median front probe of each key (0 if the key has none)
+    y_front = front_y.reindex(keys).fillna(0).to_numpy()
+    y_shoulder = y_front + shoulder_len
+    y_tail = y_front + KEY_LENGTH  # Use hardcoded key length
+
+    has_right = np.isin(stype, ['right', 'both'])
+    has_left = np.isin(stype, ['left', 'both'])
+    right_inner = half_width - right_step
+    left_inner = -half_width + left_step
+
+    # Corners in the rotated frame, relative to the rotation center (0, y_front)
+    corners = np.stack([
+        np.stack([-half_width, y_front], axis=-1),                                  # Front left
+        np.stack([half_width, y_front], axis=-1),                                   # Front right
+        np.stack([half_width, np.where(has_right, y_shoulder, y_tail)], axis=-1),   # Right shoulder outer
+        np.stack([np.where(has_right, right_inner, half_width),
+                  np.where(has_right, y_shoulder, y_tail)], axis=-1),               # Right shoulder inner
+        np.stack([np.where(has_right, right_inner, half_width), y_tail], axis=-1),  # Right tail
+        np.stack([np.where(has_left, left_inner, -half_width), y_tail], axis=-1),   # Left tail
+        np.stack([np.where(has_left, left_inner, -half_width),
+                  np.where(has_left, y_shoulder, y_tail)], axis=-1),                # Left shoulder inner
+        np.stack([-half_width, np.where(has_left, y_shoulder, y_tail)], axis=-1),   # Left shoulder outer
+        np.stack([-half_width, y_front], axis=-1),                                  # Close the polygon
+    ], axis=1)
+    dx = corners[:, :, 0]
+    dy = corners[:, :, 1] - y_front[:, None]
+
+    # Rotate back to the original frame and translate to the key center
+    c, s = np.cos(angle)[:, None], np.sin(angle)[:, None]
+    outlines = np.stack([dx * c - dy * s + center_x[:, None],
+                         dx * s + dy * c + y_front[:, None]], axis=-1)
+
+    label_xy = np.column_stack([center_x, (y_front + y_tail) / 2])
+    return outlines, label_xy
+
+
+def label_paths(labels, size):
+    """Text outlines of the labels centered on (0, 0), in points"""
+    paths = []
+    for text in labels:
+        path = TextPath((0, 0), text, size=size)
+        extents = path.get_extents()
+        paths.append(path.transformed(Affine2D().translate(-(extents.x0 + extents.x1) / 2,
+                                                           -(extents.y0 + extents.y1) / 2)))
+    return paths
+
+
+def plot_outlines(ax, params_data, front_y, shoulder_len):
+    """Draw every keytop outline as one LineCollection and the key numbers as one PathCollection"""
+    if not params_data:
+        return
+    outlines, label_xy = key_outlines(params_data, front_y, shoulder_len)
+    ax.add_collection(LineCollection(outlines, colors='k', linewidths=1.5, alpha=0.8))
+    ax.autoscale_view()
+
+    # Label backgrounds as one scatter, numbers as one offset collection of text outlines
+    # sized in points (follows the figure dpi, so thumbnails scale like text would)
+    ax.scatter(label_xy[:, 0], label_xy[:, 1], s=110, c='white', alpha=0.7,
+               edgecolors='k', linewidths=0.8, zorder=3)
+    ax.add_collection(PathCollection(label_paths([str(param['Key']) for param in params_data], 8),
+                                     offsets=label_xy, offset_transform=ax.transData,
+                                     transform=Affine2D().scale(1 / 72) + ax.figure.dpi_scale_trans,
+                                     facecolors='k', edgecolors='none', zorder=4), autolim=False)
+
+
+def render(probe_csv, params_csv=None):
+    """Build the key parameters figure for one probe CSV (no window is shown)"""
+    # Read probe data
+    probe_df = pd.read_csv(mirror_path(probe_csv))
 
-    # Second pass - read global parameters (they're after the data)
-    with open(PARAMS_CSV, 'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            if line.startswith('# '):
-                parts = line.replace('# ', '').strip().split(',')
-                if len(parts) == 2:
-                    param_name = parts[0]
-                    param_value = float(parts[1])
-                    global_params[param_name] = param_value
-                    print(f"Found global param: {param_name} = {param_value}")
+    # Read parameter data
+    if params_csv:
+        print(f"Using parameters file: {os.path.basename(params_csv)}")
+        params_data, global_params = read_params_csv(params_csv)
+    else:
+        params_data, global_params = solver_params(probe_csv)
 
     # Extract global parameters
     shoulder_len = global_params.get('ShoulderLength', 1.0)  # Better default
     print(f"\nGlobal parameters loaded:")
     print(f"  ShoulderLength: {shoulder_len:.4f} inches")
     print(f"  KeyHeight: {global_params.get('KeyHeight', 0):.4f} inches")
-    print(f"  SlackWeight: {global_params.get('SlackWeight', 0.5):.2f}")
-    print(f"  OptimizationPreference: {global_params.get('OptimizationPreference', 0.5):.2f}")
     print(f"  Key Length (hardcoded): {KEY_LENGTH} inches\n")
 
     # Create figure with same style as RotatedKeyCorners.py
     fig = plt.figure(figsize=(16, 9))
     ax = fig.add_subplot(111)
 
-    # Maximize window
-    manager = plt.get_current_fig_manager()
-    if hasattr(manager, 'window'):
-        if hasattr(manager.window, 'state'):
-            try:
-                manager.window.state('zoomed')  # For TkAgg backend
-            except:
-                pass
-
     # Adjust subplot to fill the figure
     fig.subplots_adjust(left=0.05, right=0.98, top=0.95, bottom=0.05)
 
@@ -118,89 +195,8 @@ def main():
                       s=30, alpha=alpha, label=label)
 
     # Plot parameter-generated outlines
-    for param in params_data:
-        key = param['Key']
-        center_x = param['CenterX']
-        angle = param['Angle']
-        width = param['Width']
-        stype = param['ShoulderType']
-        left_step = param['LeftStep']
-        right_step = param['RightStep']
-
-        # Calculate half width
-        half_width = width / 2.0
-
-        # Find Y position from probe data (median of front points)
-        key_front = probe_df[(probe_df['PianoKey#'] == key) & (probe_df['Direction'] == 3)]
-        if not key_front.empty:
-            y_front = key_front['Y'].median()
-        else:
-            y_front = 0  # fallback
-
-        # Y levels
-        y_shoulder = y_front + shoulder_len
-        y_tail = y_front + KEY_LENGTH  # Use hardcoded key length
-
-        # Build corners in rotated frame
-        # Front corners
-        corners_rot = [
-            [-half_width, y_front],  # Front left
-            [half_width, y_front]    # Front right
-        ]
-
-        # Right side
-        if stype in ['right', 'both']:
-            corners_rot.extend([
-                [half_width, y_shoulder],           # Right shoulder outer
-                [half_width - right_step, y_shoulder],  # Right shoulder inner
-                [half_width - right_step, y_tail]       # Right tail inner
-            ])
-        else:
-            corners_rot.append([half_width, y_tail])  # Right tail outer
-
-        # Back edge
-        if stype in ['left', 'both']:
-            corners_rot.extend([
-                [-half_width + left_step, y_tail],       # Left tail inner
-                [-half_width + left_step, y_shoulder],   # Left shoulder inner
-                [-half_width, y_shoulder]                # Left shoulder outer
-            ])
-        else:
-            corners_rot.append([-half_width, y_tail])  # Left tail outer
-
-        # Close the polygon
-        corners_rot.append(corners_rot[0])
-
-        # Convert to numpy array for rotation
-        corners_rot = np.array(corners_rot)
-
-        # The corners are in the rotated frame where the key is aligned
-        # We need to rotate them back to the original frame
-        # The center of rotation in the rotated frame is at (0, y_front)
-        center_rot = np.array([0, y_front])
-
-        # Rotate each corner back to original frame
-        corners_orig = []
-        for corner in corners_rot[:-1]:  # Exclude the duplicate closing point
-            # The angle in CSV is the F360 angle (inverted), so we need to negate it again
-            # to get back to the original rotation that matches probe points
-            corner_orig = rotate_point(corner, angle, center_rot)  # Use angle directly (it's already negative)
-            # Translate to actual center position
-            corner_orig[0] += center_x
-            corners_orig.append(corner_orig)
-
-        # Plot the outline
-        corners_orig = np.array(corners_orig)
-        xs = np.append(corners_orig[:, 0], corners_orig[0, 0])  # Close polygon
-        ys = np.append(corners_orig[:, 1], corners_orig[0, 1])
-
-        ax.plot(xs, ys, 'k-', linewidth=1.5, alpha=0.8)
-
-        # Add key number at center
-        cx = center_x
-        cy = (y_front + y_tail) / 2
-        ax.text(cx, cy, str(key), fontsize=8, ha='center', va='center',
-                bbox=dict(boxstyle='circle,pad=0.1', facecolor='white', alpha=0.7))
+    front_y = probe_df[probe_df['Direction'] == 3].groupby('PianoKey#')['Y'].median()
+    plot_outlines(ax, params_data, front_y, shoulder_len)
 
     ax.set_xlabel('X (inches)')
     ax.set_ylabel('Y (inches)')
@@ -230,6 +226,31 @@ def main():
         new_x_range = y_range / aspect_ratio
         ax.set_xlim(x_center - new_x_range/2, x_center + new_x_range/2)
 
+    return fig
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot probe points and parameter-generated key outlines")
+    parser.add_argument('csv', nargs='?', help="Probe CSV (default: most recent in the Logs folder)")
+    parser.add_argument('--params', help="KeyParameters_*.csv to plot instead of the solver sidecar")
+    args = parser.parse_args()
+
+    probe_csv = args.csv or find_most_recent_csv()
+    if not probe_csv:
+        print(f"No probe CSV files found in {LOGS_DIR}")
+        return
+    print(f"Using probe file: {os.path.basename(probe_csv)}")
+    render(probe_csv, args.params)
+
+    # Maximize window
+    manager = plt.get_current_fig_manager()
+    if hasattr(manager, 'window'):
+        if hasattr(manager.window, 'state'):
+            try:
+                manager.window.state('zoomed')  # For TkAgg backend
+            except:
+                pass
+
     plt.show()
 
 if __name__ == '__main__':
@@ -1,280 +1,49 @@
 """
 Plot Probe Data - Visualize probed points and calculated keytop outlines
-Compatible with current ProbeKeys CSV format and KeytopParametricUpdate calculations
+Outlines come from the add-in's solver sidecar, or from KeytopSolver (production CONFIG) when it is missing or stale
 """
 
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 import csv
 import os
 import glob
-import math
-
-# Configuration - matches KeytopParametricUpdate.py
-CONFIG = {
-    'plastic_thickness': 0.07,
-    'max_rotation': 2.0,
-    'angle_step': 0.01,
-    'tail_weight': 3,
-    'band_split_y': 0.75,
-    'front_overhang': 0.005,
-    'tail_overhang': 0.01,
-}
+
+import KeytopSolver
+import LogsCatalog
+from GCodeReader import Toolpath
+from LogsMirror import LOGS_DIR, mirror_path
+from matplotlib.collections import LineCollection
 
 KEY_LENGTH = 6.195  # inches (approximate full key length for visualization)
-LOGS_DIR = r"C:\Mach4Hobby\Profiles\BLP\Logs"
+LIVE_INTERVAL_MS = 250  # Live mode poll/redraw period
 
+# Probe point styles: (direction, color, marker, label, alpha)
+DIRECTION_STYLES = [
+    (1, 'blue', 'o', 'Left (+X)', 0.5),
+    (2, 'orange', 'o', 'Right (-X)', 0.5),
+    (3, 'green', '^', 'Front (+Y)', 0.7),
+    (4, 'red', 'v', 'Shoulder (-Y)', 0.7),
+    (5, 'purple', 's', 'Z Height', 0.8)
+]
 
-def find_most_recent_csv():
-    """Find the most recent probe CSV in the Logs directory"""
-    csv_files = []
-
-    for folder in os.listdir(LOGS_DIR):
-        folder_path = os.path.join(LOGS_DIR, folder)
-        if os.path.isdir(folder_path):
-            # Look for CSV files matching the folder name
-            csv_path = os.path.join(folder_path, f"{folder}.csv")
-            if os.path.exists(csv_path):
-                csv_files.append(csv_path)
-
-    if not csv_files:
-        print(f"No probe CSV files found in {LOGS_DIR}")
-        return None
 
-    # Return the most recently modified
-    return max(csv_files, key=os.path.getmtime)
-
-
-def parse_csv(csv_path):
-    """Parse probe data from CSV into structured format"""
-    data = {}
-    with open(csv_path, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            key = int(row['PianoKey#'])
-            if key not in data:
-                data[key] = {str(i): [] for i in range(1, 6)}
-
-            direction = int(row['Direction'])
-            if direction <= 5:
-                point = {
-                    'X': float(row['X']),
-                    'Y': float(row['Y']),
-                    'Z': float(row.get('Z', 0))
-                }
-                data[key][str(direction)].append(point)
-    return data
-
-
-def median(values):
-    """Calculate median of a list"""
-    if not values:
-        return 0
-    sorted_vals = sorted(values)
-    n = len(sorted_vals)
-    if n % 2:
-        return sorted_vals[n // 2]
-    return (sorted_vals[n // 2 - 1] + sorted_vals[n // 2]) / 2.0
-
-
-def percentile(values, p):
-    """Calculate percentile of a list (p is 0-100)"""
-    if not values:
-        return 0
-    sorted_vals = sorted(values)
-    n = len(sorted_vals)
-    k = (n - 1) * p / 100.0
-    f = int(k)
-    c = f + 1 if f + 1 < n else f
-    return sorted_vals[f] + (k - f) * (sorted_vals[c] - sorted_vals[f])
-
-
-def rotate_point(point, angle_deg, center):
-    """Rotate a point around a center by angle in degrees"""
-    angle_rad = math.radians(angle_deg)
-    cos_a = math.cos(angle_rad)
-    sin_a = math.sin(angle_rad)
-    dx = point[0] - center[0]
-    dy = point[1] - center[1]
-    return [
-        dx * cos_a - dy * sin_a + center[0],
-        dx * sin_a + dy * cos_a + center[1]
-    ]
-
-
-def is_white_key(key_num):
-    """Check if a piano key number is a white key"""
-    midi = key_num + 20
-    note = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'][midi % 12]
-    return note in ['C', 'D', 'E', 'F', 'G', 'A', 'B']
-
-
-def key_shoulders(key_num):
-    """Determine shoulder type for a key"""
-    if key_num == 1:
-        return "right"
-    if key_num == 88:
-        return "none"
-    midi = key_num + 20
-    note = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'][midi % 12]
-    if note in ('B', 'E'):
-        return "left"
-    if note in ('F', 'C'):
-        return "right"
-    if note in ('D', 'G', 'A'):
-        return "both"
-    return "none"
-
-
-def calculate_global_params(probe_data):
-    """Calculate shoulder length and key height from all keys"""
-    y_front_values = []
-    y_back_values = []
-    z_values = []
+def find_most_recent_csv():
+    """Find the most recent probe CSV in the Logs directory (via the Logs catalog)"""
+    conn = LogsCatalog.open_catalog(LOGS_DIR)
+    LogsCatalog.refresh(LOGS_DIR, conn=conn)
+    entry = LogsCatalog.latest(conn)
+    conn.close()
 
-    for key_data in probe_data.values():
-        if key_data['3']:
-            y_front_values.extend([p['Y'] for p in key_data['3']])
-        if key_data['4']:
-            y_back_values.extend([p['Y'] for p in key_data['4']])
-        if key_data['5']:
-            z_values.extend([p['Z'] for p in key_data['5']])
-
-    if y_front_values and y_back_values:
-        median_front_y = median(y_front_values)
-        p75_back_y = percentile(y_back_values, 75)
-        shoulder_length = abs(p75_back_y - median_front_y) + CONFIG['plastic_thickness']
-    else:
-        shoulder_length = 0
-
-    key_height = median(z_values) if z_values else 0
-
-    return shoulder_length, key_height
-
-
-def optimize_angle(left_points, right_points, center):
-    """Find the optimal rotation angle to minimize slack"""
-    if not left_points or not right_points:
-        return 0
-
-    best_angle = 0
-    best_metric = float('inf')
-
-    left_front = [p for p in left_points if p[1] <= CONFIG['band_split_y']]
-    left_tail = [p for p in left_points if p[1] > CONFIG['band_split_y']]
-    right_front = [p for p in right_points if p[1] <= CONFIG['band_split_y']]
-    right_tail = [p for p in right_points if p[1] > CONFIG['band_split_y']]
-
-    for angle_int in range(int(-CONFIG['max_rotation'] / CONFIG['angle_step']),
-                           int(CONFIG['max_rotation'] / CONFIG['angle_step']) + 1):
-        angle = angle_int * CONFIG['angle_step']
-
-        lf_rot = [rotate_point(p, angle, center) for p in left_front]
-        lt_rot = [rotate_point(p, angle, center) for p in left_tail]
-        rf_rot = [rotate_point(p, angle, center) for p in right_front]
-        rt_rot = [rotate_point(p, angle, center) for p in right_tail]
-
-        xl_outer = min(
-            min((p[0] for p in lf_rot), default=float('inf')),
-            min((p[0] for p in lt_rot), default=float('inf'))
-        )
-        xr_outer = max(
-            max((p[0] for p in rf_rot), default=float('-inf')),
-            max((p[0] for p in rt_rot), default=float('-inf'))
-        )
-
-        front_slack = (
-            max((p[0] - xl_outer for p in lf_rot), default=0) +
-            max((xr_outer - p[0] for p in rf_rot), default=0)
-        )
-        tail_slack = (
-            max((p[0] - xl_outer for p in lt_rot), default=0) +
-            max((xr_outer - p[0] for p in rt_rot), default=0)
-        )
-
-        metric = front_slack + CONFIG['tail_weight'] * tail_slack
-
-        if metric < best_metric:
-            best_metric = metric
-            best_angle = angle
-
-    return best_angle
-
-
-def calculate_key_params(left_points, right_points, front_points, center, angle, key_num):
-    """Calculate final parameters for a key"""
-    left_rot = [rotate_point(p, angle, center) for p in left_points]
-    right_rot = [rotate_point(p, angle, center) for p in right_points]
-    front_rot = [rotate_point(p, angle, center) for p in front_points]
-
-    left_front = [p for p in left_rot if rotate_point(p, -angle, center)[1] <= CONFIG['band_split_y']]
-    left_tail = [p for p in left_rot if rotate_point(p, -angle, center)[1] > CONFIG['band_split_y']]
-    right_front = [p for p in right_rot if rotate_point(p, -angle, center)[1] <= CONFIG['band_split_y']]
-    right_tail = [p for p in right_rot if rotate_point(p, -angle, center)[1] > CONFIG['band_split_y']]
-
-    # Calculate walls with overhangs applied
-    xl_front = min((p[0] for p in left_front), default=0) - CONFIG['front_overhang']
-    xl_tail = min((p[0] for p in left_tail), default=0) - CONFIG['tail_overhang']
-    xr_front = max((p[0] for p in right_front), default=0) + CONFIG['front_overhang']
-    xr_tail = max((p[0] for p in right_tail), default=0) + CONFIG['tail_overhang']
-
-    xl_outer = min(xl_front, xl_tail)
-    xl_inner = max(xl_front, xl_tail)
-    xr_outer = max(xr_front, xr_tail)
-    xr_inner = min(xr_front, xr_tail)
-
-    y_front = median([p[1] for p in front_rot])
-    front_left = rotate_point([xl_outer, y_front], -angle, center)
-    front_right = rotate_point([xr_outer, y_front], -angle, center)
-    center_x = (front_left[0] + front_right[0]) / 2.0
-
-    width = xr_outer - xl_outer
-    left_step = xl_inner - xl_outer if key_shoulders(key_num) in ['left', 'both'] else 0
-    right_step = xr_outer - xr_inner if key_shoulders(key_num) in ['right', 'both'] else 0
-
-    return {
-        'X': center_x,
-        'Angle': -angle,
-        'Width': width,
-        'LStep': left_step,
-        'RStep': right_step,
-        'y_front': y_front,  # Store for plotting
-        'xl_outer': xl_outer,
-        'xr_outer': xr_outer,
-    }
-
-
-def process_key(key_num, key_data):
-    """Process a single key: optimize angle and calculate parameters"""
-    left_points = [[p['X'], p['Y']] for p in key_data.get('1', [])]
-    right_points = [[p['X'], p['Y']] for p in key_data.get('2', [])]
-    front_points = [[p['X'], p['Y']] for p in key_data.get('3', [])]
-
-    if not (left_points and right_points):
+    if not entry:
+        print(f"No probe CSV files found in {LOGS_DIR}")
         return None
+    return entry['csv_path']
 
-    if not front_points:
-        default_front_y = -1.2
-        left_front_x = min(p[0] for p in left_points)
-        right_front_x = max(p[0] for p in right_points)
-        front_points = [[left_front_x, default_front_y], [right_front_x, default_front_y]]
-
-    all_points = left_points + right_points + front_points
-    center = [
-        sum(p[0] for p in all_points) / len(all_points),
-        sum(p[1] for p in all_points) / len(all_points)
-    ]
 
-    best_angle = optimize_angle(left_points, right_points, center)
-    params = calculate_key_params(left_points, right_points, front_points, center, best_angle, key_num)
-    params['center'] = center
-    params['raw_angle'] = best_angle
-
-    return params
-
-
-def plot_key_outline(ax, params, key_num, shoulder_length, y_front_median):
-    """Plot the calculated keytop outline for a key"""
+def key_outline(params, key_num, shoulder_length, y_front_median):
+    """World-frame corners of the calculated keytop outline for a key (closed polygon)"""
     # Get the actual rotated-frame coordinates
     xl_outer = params['xl_outer']
     xr_outer = params['xr_outer']
@@ -284,7 +53,7 @@ def plot_key_outline(ax, params, key_num, shoulder_length, y_front_median):
 
     left_step = params['LStep']
     right_step = params['RStep']
-    stype = key_shoulders(key_num)
+    stype = KeytopSolver.key_shoulders(key_num)
 
     y_shoulder = y_front + shoulder_length
     y_tail = y_front + KEY_LENGTH
@@ -317,11 +86,17 @@ def plot_key_outline(ax, params, key_num, shoulder_length, y_front_median):
     # We rotated by +angle to align, so rotate by -angle to get back
     corners_world = []
     for corner in corners_rot:
-        world_pt = rotate_point(corner, -angle, center)
+        world_pt = KeytopSolver.rotate_point(corner, -angle, center)
         corners_world.append(world_pt)
 
     # Close the polygon
     corners_world.append(corners_world[0])
+    return corners_world
+
+
+def plot_key_outline(ax, params, key_num, shoulder_length, y_front_median):
+    """Plot the calculated keytop outline for a key"""
+    corners_world = key_outline(params, key_num, shoulder_length, y_front_median)
 
     # Plot
     xs = [c[0] for c in corners_world]
@@ -335,20 +110,52 @@ def plot_key_outline(ax, params, key_num, shoulder_length, y_front_median):
             bbox=dict(boxstyle='circle,pad=0.1', facecolor='white', alpha=0.7, edgecolor='none'))
 
 
-def main():
-    # Find most recent CSV
-    csv_path = find_most_recent_csv()
-    if not csv_path:
-        return
+def find_tap(csv_path):
+    """Shaping program next to a probe CSV - {piano}.tap, else the newest .tap in the folder"""
+    folder = os.path.dirname(csv_path)
+    tap_path = os.path.splitext(csv_path)[0] + ".tap"
+    if os.path.exists(tap_path):
+        return tap_path
+    taps = glob.glob(os.path.join(folder, '*.tap'))
+    return max(taps, key=os.path.getmtime) if taps else None
 
-    print(f"Using: {csv_path}")
 
+def plot_toolpath(ax, tap_path, fig):
+    """Overlay a shaping program's feed moves, one decimated LineCollection per tool"""
+    toolpath = Toolpath.open(mirror_path(tap_path))
+    print(f"Toolpath: {os.path.basename(tap_path)} - {len(toolpath)} moves "
+          f"({toolpath.load_seconds * 1000:.0f}ms)")
+
+    # One vertex per screen pixel is all a full-window view can show
+    cutting = ~toolpath.machine & (toolpath.motion != 0)
+    if not cutting.any():
+        return
+    x_range = np.nanmax(toolpath.x[cutting]) - np.nanmin(toolpath.x[cutting])
+    resolution = x_range / (fig.get_size_inches()[0] * fig.dpi) if x_range > 0 else None
+
+    colors = plt.cm.tab10.colors
+    for index, tool in enumerate(toolpath.tool_list()):
+        segments = toolpath.xy_segments(tool, resolution=resolution)
+        if len(segments) == 0:
+            continue
+        info = toolpath.tools.get(tool)
+        label = f"T{tool} D={info['diameter']}" if info else f"T{tool}"
+        ax.add_collection(LineCollection(segments, colors=[colors[index % len(colors)]],
+                                         linewidths=0.5, alpha=0.5, label=label, zorder=1))
+
+
+def render(csv_path, tap_path=None):
+    """Build the probe data figure for one probe CSV (no window is shown)"""
     # Parse data
-    probe_data = parse_csv(csv_path)
+    probe_data = KeytopSolver.parse_csv(csv_path)
     print(f"Found data for {len(probe_data)} keys")
 
-    # Calculate global parameters
-    shoulder_length, key_height = calculate_global_params(probe_data)
+    # The parameters the add-in sent to Fusion when its sidecar matches this CSV, else the production solver
+    key_params, shoulder_length, key_height, source = KeytopSolver.load_or_solve(csv_path, probe_data)
+    if source == 'sidecar':
+        print(f"Loaded solver sidecar: {KeytopSolver.solver_sidecar_path(csv_path)}")
+    else:
+        print("No current solver sidecar - solved from probe data")
     print(f"Shoulder Length: {shoulder_length:.4f} in")
     print(f"Key Height: {key_height:.4f} in")
 
@@ -357,15 +164,7 @@ def main():
     for key_data in probe_data.values():
         if key_data['3']:
             all_front_y.extend([p['Y'] for p in key_data['3']])
-    y_front_median = median(all_front_y) if all_front_y else 0
-
-    # Process each white key
-    white_keys = [k for k in sorted(probe_data.keys()) if is_white_key(k)]
-    key_params = {}
-    for key_num in white_keys:
-        params = process_key(key_num, probe_data[key_num])
-        if params:
-            key_params[key_num] = params
+    y_front_median = KeytopSolver.median(all_front_y) if all_front_y else 0
 
     print(f"Calculated parameters for {len(key_params)} keys")
 
@@ -384,15 +183,7 @@ def main():
                 all_points['Key'].append(key_num)
 
     # Plot probe points by direction
-    direction_styles = [
-        (1, 'blue', 'o', 'Left (+X)', 0.5),
-        (2, 'orange', 'o', 'Right (-X)', 0.5),
-        (3, 'green', '^', 'Front (+Y)', 0.7),
-        (4, 'red', 'v', 'Shoulder (-Y)', 0.7),
-        (5, 'purple', 's', 'Z Height', 0.8)
-    ]
-
-    for direction, color, marker, label, alpha in direction_styles:
+    for direction, color, marker, label, alpha in DIRECTION_STYLES:
         xs = [all_points['X'][i] for i in range(len(all_points['X']))
               if all_points['Direction'][i] == direction]
         ys = [all_points['Y'][i] for i in range(len(all_points['Y']))
@@ -404,6 +195,9 @@ def main():
     for key_num, params in key_params.items():
         plot_key_outline(ax, params, key_num, shoulder_length, y_front_median)
 
+    if tap_path:
+        plot_toolpath(ax, tap_path, fig)
+
     # Configure plot
     ax.set_xlabel('X (inches)')
     ax.set_ylabel('Y (inches)')
@@ -418,6 +212,261 @@ def main():
 
     # Adjust view to show full data
     ax.autoscale()
+    return fig
+
+
+class CsvTail:
+    """Incremental reader for a probe CSV that ProbeKeys is still appending to"""
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.offset = 0
+        self.header = None
+
+    def read_rows(self):
+        """Rows appended since the last call as (key, direction, x, y, z), plus a restarted flag
+
+        Only complete lines are consumed - a row the writer is halfway through is read
+        next time. A file that shrank was rewritten (new run) and is read from the start.
+        """
+        try:
+            size = os.path.getsize(self.csv_path)
+        except OSError:
+            return [], False  # Not created yet
+
+        restarted = size < self.offset
+        if restarted:
+            self.offset = 0
+            self.header = None
+        if size == self.offset:
+            return [], restarted
+
+        with open(self.csv_path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            return [], restarted
+        self.offset += end
+
+        lines = chunk[:end].decode('utf-8', errors='replace').splitlines()
+        if self.header is None:
+            self.header = lines.pop(0).split(',')
+        rows = []
+        for row in csv.DictReader(lines, fieldnames=self.header):
+            try:
+                rows.append((int(row['PianoKey#']), int(row['Direction']),
+                             float(row['X']), float(row['Y']), float(row.get('Z') or 0)))
+            except (TypeError, ValueError):
+                continue
+        return rows, restarted
+
+
+class LiveProbePlot:
+    """Live view of an in-progress ProbeKeys run using blitting
+
+    Probe points only accumulate, so new points are drawn once onto the cached
+    background. Key outlines are animated artists - only the key that received
+    new points is re-solved, and the background is rebuilt only when the view
+    has to grow. Per-frame cost stays flat as the run fills in.
+    """
+
+    def __init__(self, csv_path, interval_ms=LIVE_INTERVAL_MS):
+        self.csv_path = csv_path
+        self.tail = CsvTail(csv_path)
+        self.fig, self.ax = plt.subplots(figsize=(16, 9))
+        self.fig.subplots_adjust(left=0.05, right=0.98, top=0.95, bottom=0.05)
+        self.ax.set_xlabel('X (inches)')
+        self.ax.set_ylabel('Y (inches)')
+        self.ax.set_aspect('equal')
+        self.ax.grid(True, alpha=0.3)
+        self.ax.set_autoscale_on(False)
+
+        # Every point so far (drawn on full redraws) and the points new this frame (drawn once)
+        self.points = {}
+        self.new_points = {}
+        for direction, color, marker, label, alpha in DIRECTION_STYLES:
+            self.points[direction] = self.ax.scatter([], [], c=color, marker=marker, s=25, alpha=alpha,
+                                                     label=label)
+            self.new_points[direction] = self.ax.scatter([], [], c=color, marker=marker, s=25, alpha=alpha,
+                                                         animated=True)
+        self.ax.legend(loc='upper right')
+        self.title = self.ax.set_title('', animated=True)
+
+        self.outlines = {}  # key -> (Line2D, Text)
+        self.reset()
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+        self.timer = self.fig.canvas.new_timer(interval=interval_ms)
+        self.timer.add_callback(self.update)
+
+    def reset(self):
+        """Forget all data (start of a new run in the same file)"""
+        self.probe_data = {}
+        self.key_params = {}
+        self.shoulder_length = 0
+        self.y_front_median = 0
+        self.front_y = []
+        self.bounds = None  # [x_min, x_max, y_min, y_max] of everything drawn
+        self.point_count = 0
+        self.background = None  # Forces a full redraw
+        for direction in self.points:
+            self.points[direction].set_offsets(np.empty((0, 2)))
+        for line, label in self.outlines.values():
+            line.remove()
+            label.remove()
+        self.outlines = {}
+
+    def on_draw(self, event):
+        """Full redraw (startup, resize, view change) - recapture the background"""
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for line, label in self.outlines.values():
+            self.ax.draw_artist(line)
+            self.ax.draw_artist(label)
+        self.ax.draw_artist(self.title)
+
+    def grow_bounds(self, xs, ys):
+        """Extend the data bounds, returns True if the current view no longer fits them"""
+        x_min, x_max, y_min, y_max = min(xs), max(xs), min(ys), max(ys)
+        if self.bounds:
+            x_min = min(x_min, self.bounds[0])
+            x_max = max(x_max, self.bounds[1])
+            y_min = min(y_min, self.bounds[2])
+            y_max = max(y_max, self.bounds[3])
+        self.bounds = [x_min, x_max, y_min, y_max]
+        (view_x0, view_x1), (view_y0, view_y1) = self.ax.get_xlim(), self.ax.get_ylim()
+        return x_min < view_x0 or x_max > view_x1 or y_min < view_y0 or y_max > view_y1
+
+    def fit_view(self):
+        """Set the view to the data bounds plus a margin so it rarely has to grow again"""
+        x_min, x_max, y_min, y_max = self.bounds
+        margin = 1.0
+        self.ax.set_xlim(x_min - margin, x_max + 4 * margin)  # Room for the keys still to come
+        self.ax.set_ylim(y_min - margin, y_max + margin)
+
+    def update_outline(self, key_num):
+        corners = key_outline(self.key_params[key_num], key_num, self.shoulder_length, self.y_front_median)
+        xs = [c[0] for c in corners]
+        ys = [c[1] for c in corners]
+        cx = sum(xs[:-1]) / len(xs[:-1])
+        cy = sum(ys[:-1]) / len(ys[:-1])
+        if key_num not in self.outlines:
+            line, = self.ax.plot(xs, ys, 'k-', linewidth=1.2, alpha=0.8, animated=True)
+            label = self.ax.text(cx, cy, str(key_num), fontsize=7, ha='center', va='center', animated=True,
+                                 bbox=dict(boxstyle='circle,pad=0.1', facecolor='white', alpha=0.7,
+                                           edgecolor='none'))
+            self.outlines[key_num] = (line, label)
+        else:
+            line, label = self.outlines[key_num]
+            line.set_data(xs, ys)
+            label.set_position((cx, cy))
+        return xs, ys
+
+    def update(self):
+        """Timer callback: read appended rows, re-solve changed keys and redraw"""
+        rows, restarted = self.tail.read_rows()
+        if restarted:
+            self.reset()
+        if not rows:
+            if restarted:
+                self.fig.canvas.draw()
+            return
+
+        changed_keys = set()
+        globals_changed = False
+        new = {direction: [] for direction in self.points}
+        for key_num, direction, x, y, z in rows:
+            if direction not in new:
+                continue
+            if key_num not in self.probe_data:
+                self.probe_data[key_num] = {str(d): [] for d in range(1, 6)}
+            self.probe_data[key_num][str(direction)].append({'X': x, 'Y': y, 'Z': z})
+            new[direction].append((x, y))
+            changed_keys.add(key_num)
+            if direction == 3:
+                self.front_y.append(y)
+            if direction in (3, 4):
+                globals_changed = True  # Shoulder length and the front Y fallback move
+
+        if globals_changed:
+            self.shoulder_length, _ = KeytopSolver.calculate_global_params(self.probe_data)
+            self.y_front_median = KeytopSolver.median(self.front_y)
+
+        # Re-solve only the keys that received points; re-shape every outline if the globals moved
+        for key_num in sorted(changed_keys):
+            if KeytopSolver.is_white_key(key_num):
+                params = KeytopSolver.process_key(key_num, self.probe_data[key_num])
+                if params:
+                    self.key_params[key_num] = params
+        redraw_keys = self.key_params.keys() if globals_changed else changed_keys & self.key_params.keys()
+
+        xs, ys = [], []
+        for direction, points in new.items():
+            if points:
+                self.points[direction].set_offsets(np.vstack([self.points[direction].get_offsets(), points]))
+                xs.extend(p[0] for p in points)
+                ys.extend(p[1] for p in points)
+        for key_num in redraw_keys:
+            outline_xs, outline_ys = self.update_outline(key_num)
+            xs.extend(outline_xs)
+            ys.extend(outline_ys)
+
+        piano_name = os.path.basename(os.path.dirname(self.csv_path))
+        self.point_count += len(rows)
+        self.title.set_text(f'LIVE - {piano_name} ({len(self.probe_data)} keys probed, '
+                            f'{len(self.key_params)} solved, {self.point_count} points)')
+
+        # Bounds always take in the new data - the first frame has no background yet
+        grew = bool(xs) and self.grow_bounds(xs, ys)
+        if self.background is None or grew:
+            if self.bounds:
+                self.fit_view()
+            self.fig.canvas.draw()  # Points are part of the full draw, on_draw redraws the animated artists
+            self.fig.canvas.blit(self.fig.bbox)
+            return
+
+        # Bake the new points into the background, then draw the outlines on top
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        for direction, points in new.items():
+            if points:
+                self.new_points[direction].set_offsets(points)
+                self.ax.draw_artist(self.new_points[direction])
+        self.background = canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def show(self):
+        self.update()
+        self.timer.start()
+        plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot probe points and calculated keytop outlines")
+    parser.add_argument('csv', nargs='?', help="Probe CSV (default: most recent in the Logs folder)")
+    parser.add_argument('--live', action='store_true', help="Follow a ProbeKeys run as the CSV is written")
+    parser.add_argument('--interval', type=int, default=LIVE_INTERVAL_MS, help="Live redraw period (ms)")
+    parser.add_argument('--toolpath', action='store_true', help="Overlay the shaping program from the piano folder")
+    args = parser.parse_args()
+
+    # Find most recent CSV
+    csv_path = args.csv or find_most_recent_csv()
+    if not csv_path:
+        return
+
+    print(f"Using: {csv_path}")
+    if args.live:
+        LiveProbePlot(csv_path, args.interval).show()
+        return
+
+    tap_path = find_tap(csv_path) if args.toolpath else None
+    if args.toolpath and not tap_path:
+        print("No shaping program (.tap) in the piano folder")
+    render(csv_path, tap_path)
 
     # Try to maximize window
     try:
@@ -0,0 +1,253 @@
+"""
+Probe Archive - Columnar binary copies of the probe CSVs for fast cross-piano analysis
+Writes {piano}_Probe.bin next to each {piano}.csv plus a consolidated ProbeArchive.bin for the Logs tree
+Columns are stored as contiguous blocks so np.memmap only touches the columns a query uses
+"""
+
+import argparse
+import csv
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+import KeytopSolver
+from KeytopSolver import LOGS_DIR
+from LogsMirror import mirror_path
+
+MAGIC = b'BLPPROBE'
+VERSION = 1
+ALIGN = 64  # Column blocks start on 64-byte boundaries
+ARCHIVE_NAME = "ProbeArchive.bin"
+
+SECTIONS = ['Unknown', 'Upper', 'Lower']
+
+# Column name -> dtype; piano and section are indexes into the header tables
+COLUMNS = {
+    'piano': np.int16,
+    'section': np.int8,
+    'key': np.int16,
+    'direction': np.int8,
+    'x': np.float64,
+    'y': np.float64,
+    'z': np.float64,
+    'time': np.int64,  # Epoch seconds (local time of the probing PC)
+}
+
+
+def sidecar_path(csv_path):
+    """Binary sidecar path for a probe CSV"""
+    return os.path.splitext(csv_path)[0] + "_Probe.bin"
+
+
+def parse_timestamp(text):
+    """Epoch seconds for a 'YYYY-MM-DD HH:MM:SS' timestamp (0 if missing or malformed)"""
+    try:
+        return int(time.mktime(time.strptime(text.strip(), '%Y-%m-%d %H:%M:%S')))
+    except (ValueError, AttributeError):
+        return 0
+
+
+def read_csv_columns(csv_path, piano_id):
+    """Parse a probe CSV into column arrays"""
+    keys, directions, xs, ys, zs, times = [], [], [], [], [], []
+    stamps = {}
+    with open(mirror_path(csv_path), 'r') as f:
+        for row in csv.DictReader(f):
+            keys.append(int(row['PianoKey#']))
+            directions.append(int(row['Direction']))
+            xs.append(float(row['X']))
+            ys.append(float(row['Y']))
+            zs.append(float(row.get('Z') or 0))
+            stamp = row.get('Timestamp') or ''
+            if stamp not in stamps:
+                stamps[stamp] = parse_timestamp(stamp)
+            times.append(stamps[stamp])
+
+    rows = len(keys)
+    return {
+        'piano': np.zeros(rows, dtype=COLUMNS['piano']),
+        'section': np.full(rows, SECTIONS.index(KeytopSolver.section_from_name(piano_id)),
+                           dtype=COLUMNS['section']),
+        'key': np.array(keys, dtype=COLUMNS['key']),
+        'direction': np.array(directions, dtype=COLUMNS['direction']),
+        'x': np.array(xs, dtype=COLUMNS['x']),
+        'y': np.array(ys, dtype=COLUMNS['y']),
+        'z': np.array(zs, dtype=COLUMNS['z']),
+        'time': np.array(times, dtype=COLUMNS['time']),
+    }
+
+
+def write_columns(path, columns, pianos, sources):
+    """Write column arrays with a JSON header describing pianos, sources and block offsets
+
+    Layout: MAGIC, uint32 version, uint32 header length, JSON header, padded column blocks.
+    """
+    rows = len(columns['key'])
+    layout = []
+    header = {'rows': rows, 'pianos': pianos, 'sections': SECTIONS, 'sources': sources, 'columns': layout}
+
+    for name in COLUMNS:
+        layout.append({'name': name, 'dtype': np.dtype(COLUMNS[name]).str, 'offset': 0})
+
+    # Header length depends on the offsets it contains - repeat until they settle
+    while True:
+        blob = json.dumps(header).encode('utf-8')
+        offset = len(MAGIC) + 8 + len(blob)
+        changed = False
+        for entry in layout:
+            offset = -(-offset // ALIGN) * ALIGN
+            if entry['offset'] != offset:
+                entry['offset'] = offset
+                changed = True
+            offset += rows * np.dtype(entry['dtype']).itemsize
+        if not changed:
+            break
+
+    tmp_path = path + '.part'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<II', VERSION, len(blob)))
+        f.write(blob)
+        for entry in layout:
+            f.write(b'\0' * (entry['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(columns[entry['name']], dtype=entry['dtype']).tobytes())
+    os.replace(tmp_path, path)
+
+
+class ProbeColumns:
+    """Memory-mapped view of a probe column file - columns are mapped on first access"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a probe column file: {path}")
+            version, header_len = struct.unpack('<II', f.read(8))
+            if version != VERSION:
+                raise ValueError(f"Unsupported probe column version {version}: {path}")
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        self.rows = header['rows']
+        self.pianos = header['pianos']
+        self.sections = header['sections']
+        self.sources = header['sources']
+        self._layout = {entry['name']: entry for entry in header['columns']}
+        self._maps = {}
+
+    def __getitem__(self, name):
+        if name not in self._maps:
+            entry = self._layout[name]
+            if self.rows == 0:
+                self._maps[name] = np.zeros(0, dtype=entry['dtype'])
+            else:
+                self._maps[name] = np.memmap(self.path, dtype=entry['dtype'], mode='r',
+                                             offset=entry['offset'], shape=(self.rows,))
+        return self._maps[name]
+
+    def select(self, piano=None, section=None, key=None, direction=None):
+        """Boolean row mask for the given filters (each a single value or a list)"""
+        mask = np.ones(self.rows, dtype=bool)
+        if piano is not None:
+            ids = [self.pianos.index(p) for p in np.atleast_1d(piano) if p in self.pianos]
+            mask &= np.isin(self['piano'], ids)
+        if section is not None:
+            mask &= np.isin(self['section'], [self.sections.index(s) for s in np.atleast_1d(section)])
+        if key is not None:
+            mask &= np.isin(self['key'], np.atleast_1d(key))
+        if direction is not None:
+            mask &= np.isin(self['direction'], np.atleast_1d(direction))
+        return mask
+
+    def to_probe_data(self, piano=None):
+        """Rebuild the parse_csv() structure for one piano (or the only piano in a sidecar)"""
+        mask = self.select(piano=piano) if piano is not None else np.ones(self.rows, dtype=bool)
+        keys, directions = self['key'][mask], self['direction'][mask]
+        xs, ys, zs = self['x'][mask], self['y'][mask], self['z'][mask]
+        data = {}
+        for i in range(len(keys)):
+            key = int(keys[i])
+            if key not in data:
+                data[key] = {str(d): [] for d in range(1, 6)}
+            if directions[i] <= 5:
+                data[key][str(int(directions[i]))].append(
+                    {'X': float(xs[i]), 'Y': float(ys[i]), 'Z': float(zs[i])})
+        return data
+
+
+def csv_source(csv_path):
+    """Size and mtime of a probe CSV, used to detect stale sidecars"""
+    stat = os.stat(csv_path)
+    return {'csv_size': stat.st_size, 'csv_mtime': stat.st_mtime}
+
+
+def open_sidecar(csv_path, piano_id=None):
+    """Open the binary sidecar for a probe CSV, rebuilding it first if the CSV changed"""
+    piano_id = piano_id or os.path.splitext(os.path.basename(csv_path))[0]
+    path = sidecar_path(csv_path)
+    source = csv_source(csv_path)
+    if os.path.exists(path):
+        try:
+            cols = ProbeColumns(path)
+            if cols.sources.get(piano_id) == source:
+                return cols
+        except ValueError:
+            pass
+    write_columns(path, read_csv_columns(csv_path, piano_id), [piano_id], {piano_id: source})
+    return ProbeColumns(path)
+
+
+def load_probe_data(csv_path):
+    """parse_csv()-compatible probe data read from the binary sidecar"""
+    return open_sidecar(csv_path).to_probe_data()
+
+
+def build_archive(logs_dir=LOGS_DIR, force=False):
+    """Refresh every sidecar and the consolidated archive, returns the opened archive"""
+    archive_path = os.path.join(logs_dir, ARCHIVE_NAME)
+    folders = KeytopSolver.find_piano_folders(logs_dir)
+    sources = {piano_id: csv_source(csv_path) for piano_id, csv_path in folders}
+
+    if not force and os.path.exists(archive_path):
+        try:
+            archive = ProbeColumns(archive_path)
+            if archive.sources == sources:
+                return archive
+        except ValueError:
+            pass
+
+    parts = []
+    for index, (piano_id, csv_path) in enumerate(folders):
+        if force and os.path.exists(sidecar_path(csv_path)):
+            os.remove(sidecar_path(csv_path))
+        cols = open_sidecar(csv_path, piano_id)
+        part = {name: np.asarray(cols[name]) for name in COLUMNS}
+        part['piano'] = np.full(cols.rows, index, dtype=COLUMNS['piano'])
+        parts.append(part)
+
+    columns = {name: np.concatenate([p[name] for p in parts]) if parts else np.zeros(0, dtype=dtype)
+               for name, dtype in COLUMNS.items()}
+    write_columns(archive_path, columns, [piano_id for piano_id, _ in folders], sources)
+    return ProbeColumns(archive_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the probe CSV archive to memory-mapped column files")
+    parser.add_argument('--logs', default=LOGS_DIR, help="Logs folder to convert")
+    parser.add_argument('--force', action='store_true', help="Rebuild every sidecar even if up to date")
+    args = parser.parse_args()
+
+    start = time.time()
+    archive = build_archive(args.logs, args.force)
+    size = os.path.getsize(os.path.join(args.logs, ARCHIVE_NAME))
+    print(f"{ARCHIVE_NAME}: {archive.rows} rows from {len(archive.pianos)} pianos, "
+          f"{size / 1e3:.0f} KB ({time.time() - start:.2f}s)")
+
+    for index, piano_id in enumerate(archive.pianos):
+        rows = int(np.count_nonzero(archive['piano'] == index))
+        print(f"  {piano_id}: {rows} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Probe Reports - Parse ProbeKeys / Final Keytop Shaping _Report.txt files into typed records
+Each report is split into runs (one per ProbeKeys or Final Keytop Shaping pass) and cached by size+mtime
+Archive-wide results are returned as pandas DataFrames for calibration drift and per-run statistics
+"""
+
+import argparse
+import os
+import pickle
+import re
+import time
+
+import pandas as pd
+
+import KeytopSolver
+from KeytopSolver import LOGS_DIR
+from LogsMirror import mirror_path
+
+CACHE_NAME = "ProbeReports_cache.pkl"
+CACHE_VERSION = 1  # Bump when the parser output changes
+
+NUM = r'(-?\d+(?:\.\d+)?)'
+LINE_RE = re.compile(r'^(?:\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] )?\s*(.*?)\s*$')
+HEADER_RE = re.compile(r'^===== (.+) =====$')
+
+# Headers that open a new run; any other ===== line belongs to the current run
+RUN_STARTS = [
+    (re.compile(r'^ProbeKeys (Upper|Lower) - (.+) S/N (\S+)$'), 'ProbeKeys'),
+    (re.compile(r'^Test ProbeKeys \(\d+ Keys\) - (.+) S/N (\S+)$'), 'TestProbeKeys'),
+    (re.compile(r'^Final Keytop Shaping Started$'), 'FinalKeytopShaping'),
+]
+
+# Single-value run fields: (pattern, column, type)
+RUN_FIELDS = [
+    (re.compile(r'^Fixture ID: (\d+)$'), 'fixture_id', int),
+    (re.compile(r'^Fixture ID detected: (\d+)'), 'fixture_id_detected', int),
+    (re.compile(rf'^Bore alignment angle: {NUM} degrees$'), 'bore_angle', float),
+    (re.compile(rf'^Probe Drop Depth: {NUM}$'), 'probe_drop_depth', float),
+    (re.compile(rf'^Linearity Threshold: {NUM}$'), 'linearity_threshold', float),
+    (re.compile(rf'^Single Tap Feedrate: {NUM} IPM$'), 'single_tap_feedrate', float),
+    (re.compile(rf'^Average Z height: {NUM}$'), 'avg_z', float),
+    (re.compile(rf'^Average Z: {NUM}'), 'avg_z', float),
+    (re.compile(rf'^Traverse height: {NUM}$'), 'traverse_height', float),
+    (re.compile(rf'^Probe Z depth: {NUM}$'), 'probe_z_depth', float),
+    (re.compile(rf'^Surface Z datum set at: {NUM}$'), 'surface_z_datum', float),
+    (re.compile(r'^Section: (Upper|Lower)$'), 'section', str),
+    (re.compile(r'^CSV output file: (.+)$'), 'csv_file', str),
+    (re.compile(r'^G-code file: (.+)$'), 'gcode_file', str),
+]
+
+OFFSET_RE = re.compile(rf'^([+-][XYZ]): {NUM}$')
+OFFSETS_INLINE_RE = re.compile(rf'([+-][XYZ])={NUM}')
+LEFT_BORE_RE = re.compile(rf'^Left bore center: X{NUM} Y{NUM}$')
+RIGHT_BORE_RE = re.compile(rf'^Right bore center \(in datum coords\): X{NUM} Y{NUM}$')
+SAMPLE_Z_RE = re.compile(rf'^(?:Sample key|Key) (\d+) \(piano(?: key)? (\d+)\): Z={NUM}$')
+SAMPLE_Y_RE = re.compile(rf'^(?:Sample key|Key) (\d+) Y front: {NUM}$')
+SHOULDER_RE = re.compile(rf'^Key (\d+): (left|right) side shoulder accessible \(clearance: {NUM}\)$')
+ID_HOLE_RE = re.compile(rf'^ID hole (\d+): Z={NUM} \(calibrated\), bit=(\d)$')
+
+OFFSET_COLUMNS = {'+X': 'offset_px', '-X': 'offset_mx', '+Y': 'offset_py', '-Y': 'offset_my', '-Z': 'offset_mz'}
+
+
+def parse_report(path):
+    """Parse one _Report.txt into {'runs', 'samples', 'shoulders', 'id_holes'} record lists"""
+    runs, samples, shoulders, id_holes = [], [], [], []
+    run = None
+
+    def start_run(kind, stamp):
+        record = {'run': len(runs), 'kind': kind, 'started': stamp, 'completed': False}
+        runs.append(record)
+        return record
+
+    with open(mirror_path(path), 'r', errors='replace') as f:
+        for raw in f:
+            stamp, text = LINE_RE.match(raw).groups()
+            if not text:
+                continue
+
+            header = HEADER_RE.match(text)
+            if header:
+                title = header.group(1)
+                for pattern, kind in RUN_STARTS:
+                    match = pattern.match(title)
+                    if match:
+                        run = start_run(kind, stamp)
+                        if kind == 'ProbeKeys':
+                            run['section'] = match.group(1)
+                        break
+                else:
+                    if run is not None and 'Complete' in title:
+                        run['completed'] = True
+                continue
+
+            if run is None:
+                run = start_run('Unknown', stamp)
+            run['ended'] = stamp
+
+            for pattern, column, cast in RUN_FIELDS:
+                match = pattern.match(text)
+                if match:
+                    run.setdefault(column, cast(match.group(1)))
+                    break
+            else:
+                match = OFFSET_RE.match(text)
+                if match:
+                    run[OFFSET_COLUMNS[match.group(1)]] = float(match.group(2))
+                    continue
+                if text.startswith('Offsets: '):
+                    for axis, value in OFFSETS_INLINE_RE.findall(text):
+                        run[OFFSET_COLUMNS[axis]] = float(value)
+                    continue
+                match = SAMPLE_Z_RE.match(text)
+                if match:
+                    samples.append({'run': run['run'], 'sample': int(match.group(1)),
+                                    'piano_key': int(match.group(2)), 'kind': 'z',
+                                    'value': float(match.group(3)), 'time': stamp})
+                    continue
+                match = SAMPLE_Y_RE.match(text)
+                if match:
+                    samples.append({'run': run['run'], 'sample': int(match.group(1)), 'piano_key': None,
+                                    'kind': 'y_front', 'value': float(match.group(2)), 'time': stamp})
+                    continue
+                match = SHOULDER_RE.match(text)
+                if match:
+                    shoulders.append({'run': run['run'], 'key': int(match.group(1)), 'side': match.group(2),
+                                      'clearance': float(match.group(3)), 'time': stamp})
+                    continue
+                match = ID_HOLE_RE.match(text)
+                if match:
+                    id_holes.append({'run': run['run'], 'hole': int(match.group(1)),
+                                     'z': float(match.group(2)), 'bit': int(match.group(3)), 'time': stamp})
+                    continue
+                match = LEFT_BORE_RE.match(text)
+                if match:
+                    run['left_bore_x'], run['left_bore_y'] = float(match.group(1)), float(match.group(2))
+                    continue
+                match = RIGHT_BORE_RE.match(text)
+                if match:
+                    run['right_bore_x'], run['right_bore_y'] = float(match.group(1)), float(match.group(2))
+
+    # Y-front samples are logged by sample index only - fill in the piano key from the Z samples
+    for sample in samples:
+        if sample['piano_key'] is None:
+            sample['piano_key'] = next((s['piano_key'] for s in samples
+                                        if s['run'] == sample['run'] and s['kind'] == 'z'
+                                        and s['sample'] == sample['sample']), None)
+
+    return {'runs': runs, 'samples': samples, 'shoulders': shoulders, 'id_holes': id_holes}
+
+
+def load_cache(path):
+    """Load the parsed-report cache (empty if missing, unreadable or from another version)"""
+    try:
+        with open(path, 'rb') as f:
+            cache = pickle.load(f)
+        if cache.get('version') == CACHE_VERSION:
+            return cache
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        pass
+    return {'version': CACHE_VERSION, 'reports': {}}
+
+
+def load_reports(logs_dir=LOGS_DIR, use_cache=True):
+    """Parse every piano folder's report (reusing cached results) into DataFrames
+
+    Returns {'runs', 'samples', 'shoulders', 'id_holes'} DataFrames, each with
+    piano and section columns. Timestamps are converted to datetimes.
+    """
+    cache_path = os.path.join(logs_dir, CACHE_NAME)
+    cache = load_cache(cache_path) if use_cache else {'version': CACHE_VERSION, 'reports': {}}
+    reports = {}
+    parsed = 0
+
+    for piano_id, csv_path in KeytopSolver.find_piano_folders(logs_dir):
+        report_path = os.path.join(os.path.dirname(csv_path), f"{piano_id}_Report.txt")
+        if not os.path.exists(report_path):
+            continue
+        stat = os.stat(report_path)
+        entry = cache['reports'].get(piano_id)
+        if not entry or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'records': parse_report(report_path)}
+            parsed += 1
+        reports[piano_id] = entry
+
+    if use_cache and (parsed or set(reports) != set(cache['reports'])):
+        cache['reports'] = reports
+        with open(cache_path, 'wb') as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    frames = {}
+    for table in ('runs', 'samples', 'shoulders', 'id_holes'):
+        rows = []
+        for piano_id, entry in reports.items():
+            section = KeytopSolver.section_from_name(piano_id)
+            for record in entry['records'][table]:
+                rows.append(dict(record, piano=piano_id, section=record.get('section', section)))
+        frame = pd.DataFrame(rows)
+        for column in ('started', 'ended', 'time'):
+            if column in frame:
+                frame[column] = pd.to_datetime(frame[column])
+        frames[table] = frame
+    frames['parsed'] = parsed
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse every _Report.txt in the Logs folder")
+    parser.add_argument('--logs', default=LOGS_DIR, help="Logs folder to scan")
+    parser.add_argument('--no-cache', action='store_true', help="Re-parse every report")
+    args = parser.parse_args()
+
+    start = time.time()
+    frames = load_reports(args.logs, use_cache=not args.no_cache)
+    runs = frames['runs']
+    print(f"{len(runs)} runs, {len(frames['samples'])} samples, {len(frames['shoulders'])} shoulders, "
+          f"{len(frames['id_holes'])} ID holes ({frames['parsed']} reports parsed, {time.time() - start:.3f}s)")
+    if runs.empty:
+        return
+
+    # Probe calibration drift - single-tap offsets per run over time
+    offsets = [c for c in OFFSET_COLUMNS.values() if c in runs]
+    calibration = runs.dropna(subset=offsets, how='all').sort_values('started')
+    print("\nSingle-tap calibration offsets:")
+    print(calibration[['started', 'piano', 'kind'] + offsets].to_string(index=False))
+    print("\nOffset statistics:")
+    print(calibration[offsets].describe().loc[['mean', 'std', 'min', 'max']].to_string())
+
+    samples = frames['samples']
+    if not samples.empty:
+        print("\nSample spread per ProbeKeys run:")
+        spread = samples.groupby(['piano', 'run', 'kind'])['value'].agg(lambda v: v.max() - v.min())
+        print(spread.unstack('kind').to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Render Archive - Headless batch rendering of PlotProbeData and PlotKeyParameters for every piano folder
+Renders each plot to PNG/SVG in parallel (Agg backend) and writes an index.html of thumbnails
+Folders whose probe CSV, solver sidecar and plot scripts are unchanged since the last render are skipped
+"""
+
+import argparse
+import contextlib
+import hashlib
+import html
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import quote
+
+import matplotlib
+matplotlib.use('Agg')  # Must be selected before the plot scripts import pyplot
+import matplotlib.pyplot as plt
+
+import KeytopSolver
+import PlotKeyParameters
+import PlotProbeData
+from KeytopSolver import LOGS_DIR
+
+RENDER_DIR_NAME = "Renders"
+MANIFEST_NAME = "RenderArchive_manifest.json"
+INDEX_NAME = "index.html"
+THUMB_DPI = 24  # 16x9 in figure -> 384x216 px thumbnail
+
+# Plot name -> (render function, output suffix)
+PLOTS = {
+    'probe': (PlotProbeData.render, 'ProbeData'),
+    'params': (PlotKeyParameters.render, 'KeyParameters'),
+}
+
+
+def file_sha1(path):
+    """SHA1 of a file's contents"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def style_hash(fmt, dpi):
+    """Hash of the plot script sources and output settings - any style change re-renders everything"""
+    h = hashlib.sha1(f"{fmt}|{dpi}".encode('utf-8'))
+    for module in (PlotProbeData, PlotKeyParameters, KeytopSolver):
+        h.update(file_sha1(module.__file__).encode('utf-8'))
+    return h.hexdigest()[:12]
+
+
+def input_stamp(path):
+    """Size and mtime of an input file (None if it does not exist)"""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+def load_manifest(path):
+    """Load the render manifest (empty if missing or unreadable)"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_current(entry, csv_path, style, out_dir):
+    """Check whether a manifest entry still matches the inputs on disk and the plot style"""
+    if not entry or entry.get('style') != style:
+        return False
+    if entry.get('sidecar') != input_stamp(KeytopSolver.solver_sidecar_path(csv_path)):
+        return False
+    if not all(os.path.exists(os.path.join(out_dir, name)) for name in entry['outputs'].values()):
+        return False
+    if entry.get('csv') == input_stamp(csv_path):
+        return True
+    # Size/mtime changed - only re-render if the contents actually differ
+    return entry.get('csv_sha1') == file_sha1(csv_path)
+
+
+def render_folder(piano_id, csv_path, out_dir, plots, fmt, dpi, style):
+    """Worker: render every requested plot for one piano folder, returns its manifest entry"""
+    start = time.time()
+    outputs = {}
+    with contextlib.redirect_stdout(io.StringIO()):  # The plot scripts print progress for interactive use
+        for name in plots:
+            render, suffix = PLOTS[name]
+            fig = render(csv_path)
+            image_name = f"{piano_id}_{suffix}.{fmt}"
+            thumb_name = f"{piano_id}_{suffix}_thumb.png"
+            fig.savefig(os.path.join(out_dir, image_name), dpi=dpi)
+            fig.savefig(os.path.join(out_dir, thumb_name), dpi=THUMB_DPI)
+            plt.close(fig)
+            outputs[name] = image_name
+            outputs[f"{name}_thumb"] = thumb_name
+
+    return {
+        'csv': input_stamp(csv_path),
+        'csv_sha1': file_sha1(csv_path),
+        'sidecar': input_stamp(KeytopSolver.solver_sidecar_path(csv_path)),
+        'style': style,
+        'outputs': outputs,
+        'render_seconds': time.time() - start,
+        'rendered': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def write_index(path, manifest, plots):
+    """Write an HTML page with a thumbnail row per piano, each linking to the full-size render"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Probe Renders</title>\n"
+                "<style>body{font-family:sans-serif}td{padding:4px;vertical-align:top}"
+                "img{border:1px solid #ccc}</style></head><body>\n")
+        f.write(f"<h1>Probe Renders</h1>\n<p>{len(manifest)} pianos, generated "
+                f"{time.strftime('%Y-%m-%d %H:%M:%S')}</p>\n<table>\n")
+        for piano_id in sorted(manifest.keys()):
+            entry = manifest[piano_id]
+            f.write(f"<tr><td><b>{html.escape(piano_id)}</b><br>{entry['rendered']}</td>")
+            for name in plots:
+                if name in entry['outputs']:
+                    image = quote(entry['outputs'][name])
+                    thumb = quote(entry['outputs'][f"{name}_thumb"])
+                    f.write(f"<td><a href=\"{image}\"><img src=\"{thumb}\" "
+                            f"alt=\"{html.escape(PLOTS[name][1])}\"></a></td>")
+            f.write("</tr>\n")
+        f.write("</table>\n</body></html>\n")
+
+
+def render_archive(logs_dir=LOGS_DIR, out_dir=None, plots=tuple(PLOTS), fmt='png', dpi=100,
+                   workers=None, force=False):
+    """Render every stale piano folder in parallel, returns (rendered, skipped) counts"""
+    out_dir = out_dir or os.path.join(logs_dir, RENDER_DIR_NAME)
+    os.makedirs(out_dir, exist_ok=True)
+    style = style_hash(fmt, dpi)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    folders = KeytopSolver.find_piano_folders(logs_dir)
+    present = {piano_id for piano_id, _ in folders}
+
+    pending = []
+    for piano_id, csv_path in folders:
+        entry = manifest.get(piano_id)
+        if not force and entry and set(plots) <= set(entry['outputs']) and \
+                is_current(entry, csv_path, style, out_dir):
+            continue
+        pending.append((piano_id, csv_path))
+
+    print(f"{len(folders)} piano folders, {len(pending)} to render (style {style})")
+
+    start = time.time()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(render_folder, piano_id, csv_path, out_dir, plots, fmt, dpi, style): piano_id
+                       for piano_id, csv_path in pending}
+            for future in as_completed(futures):
+                piano_id = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    print(f"  FAILED {piano_id}: {e}")
+                    manifest.pop(piano_id, None)
+                    continue
+                manifest[piano_id] = entry
+                print(f"  {piano_id}: {len(plots)} plot(s) ({entry['render_seconds']:.2f}s)")
+
+    # Drop folders that no longer exist
+    for piano_id in list(manifest.keys()):
+        if piano_id not in present:
+            del manifest[piano_id]
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    write_index(os.path.join(out_dir, INDEX_NAME), manifest, plots)
+
+    print(f"Rendered {len(pending)} folders in {time.time() - start:.2f}s, "
+          f"skipped {len(folders) - len(pending)} unchanged -> {os.path.join(out_dir, INDEX_NAME)}")
+    return len(pending), len(folders) - len(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render probe plots for every piano in the Logs folder")
+    parser.add_argument('--logs', default=LOGS_DIR, help="Logs folder to scan")
+    parser.add_argument('--output', default=None, help="Output folder (default: Logs/Renders)")
+    parser.add_argument('--plots', default=','.join(PLOTS), help="Comma-separated plots: probe, params")
+    parser.add_argument('--format', default='png', choices=['png', 'svg'], help="Full-size image format")
+    parser.add_argument('--dpi', type=int, default=100, help="Full-size image resolution")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--force', action='store_true', help="Re-render every folder even if unchanged")
+    args = parser.parse_args()
+
+    plots = [name.strip() for name in args.plots.split(',') if name.strip()]
+    for name in plots:
+        if name not in PLOTS:
+            parser.error(f"Unknown plot: {name}")
+
+    render_archive(args.logs, args.output, plots, args.format, args.dpi, args.workers, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+"""
+Reorder Tools - Group a shaping program's tool blocks to load each tool as few times as possible
+The program is split at every M6 into tool blocks; a block must stay after an earlier block it interacts with
+(their cutting paths, widened by the tool radii and a margin, overlap in XY - one may cut what the other left)
+The order with the fewest tool changes is found exactly; modal state is restored wherever a block's predecessor changes
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+import CycleTime
+import MachineConfig
+from GCodeReader import Toolpath, FLAG_MACHINE
+from LogsMirror import mirror_path
+from NormalizeGCode import COMMENT_RE, WORD_RE, format_number
+
+INTERACTION_MARGIN = 0.05  # Added around the tool radii before two blocks count as independent
+CELL_SIZE = 0.025  # Occupancy grid resolution (units)
+DEFAULT_RADIUS = 0.5  # Tool radius when the program header does not list the tool
+MAX_EXACT_BLOCKS = 14  # Above this the order is found greedily (about 1s at 14 independent blocks)
+RESTORED_MOTIONS = ('G0', 'G1', 'G80')  # Motion modes restored on a line of their own (arcs and cycles need axis words)
+
+# Modal groups restored at a moved block boundary: group -> G codes
+G_GROUPS = {
+    'motion': (0, 1, 2, 3, 80),
+    'plane': (17, 18, 19),
+    'distance': (90, 91),
+    'arc_distance': (90.1, 91.1),
+    'feed_mode': (93, 94, 95),
+    'units': (20, 21),
+    'comp': (40, 41, 42),
+    'offset': (54, 55, 56, 57, 58, 59, 54.1),
+    'retract': (98, 99),
+}
+TOOL_GROUPS = ('length', 'speed', 'feed')  # Belong to the loaded tool - not restored for the program end
+M_GROUPS = {
+    'spindle': (3, 4, 5),
+    'coolant': (7, 8, 9),
+}
+
+
+def parse_words(line):
+    """(G numbers, M numbers, other word values) of one line"""
+    words = WORD_RE.findall(COMMENT_RE.sub(' ', line).upper())
+    g_codes = [float(value) for letter, value in words if letter == 'G']
+    m_codes = [float(value) for letter, value in words if letter == 'M']
+    values = {letter: value for letter, value in words if letter not in 'GMN'}
+    return g_codes, m_codes, values
+
+
+def modal_states(lines):
+    """Modal state before each line: list of dicts (group -> word text), one per line plus the end"""
+    state = {}
+    states = []
+    for line in lines:
+        states.append(dict(state))
+        g_codes, m_codes, values = parse_words(line)
+        for g in g_codes:
+            for group, codes in G_GROUPS.items():
+                if g in codes:
+                    state[group] = f"G{g:g}"
+            if g == 43:
+                state['length'] = f"G43 H{values.get('H', values.get('T', '0'))}"
+            elif g == 49:
+                state['length'] = "G49"
+            elif g in (81, 82, 83, 85, 86, 89):
+                state['motion'] = f"G{g:g}"
+        for m in m_codes:
+            for group, codes in M_GROUPS.items():
+                if m in codes:
+                    state[group] = f"M{m:g}"
+        if 'F' in values:
+            state['feed'] = f"F{format_number(float(values['F']))}"
+        if 'S' in values:
+            state['speed'] = f"S{format_number(float(values['S'])).rstrip('.')}"
+    states.append(dict(state))
+    return states
+
+
+def restore_lines(current, wanted):
+    """Lines that take the modal state from current to wanted
+
+    An arc or canned cycle motion is not restored - a bare G2/G3/G8x line is not a valid
+    move, so the next move line has to carry it (SplitProgram adds it there).
+    """
+    g_words = [wanted[group] for group in ('units', 'distance', 'arc_distance', 'plane', 'feed_mode',
+                                           'comp', 'offset', 'retract')
+               if group in wanted and wanted[group] != current.get(group)]
+    lines = [" ".join(g_words)] if g_words else []
+    if 'length' in wanted and wanted['length'] != current.get('length'):
+        lines.append(wanted['length'])
+    spindle = [wanted[group] for group in ('speed', 'spindle') if group in wanted and wanted[group] != current.get(group)]
+    if spindle:
+        lines.append(" ".join(spindle))
+    if 'coolant' in wanted and wanted['coolant'] != current.get('coolant'):
+        lines.append(wanted['coolant'])
+    motion = [wanted[group] for group in ('motion', 'feed') if group in wanted and wanted[group] != current.get(group)
+              and (group != 'motion' or wanted[group] in RESTORED_MOTIONS)]
+    if motion:
+        lines.append(" ".join(motion))
+    return lines
+
+
+def split_blocks(lines):
+    """(prologue end, blocks, epilogue start) - each block is a dict with start/end line indexes and tool
+
+    A block starts at its M6 line, moved back over the comments, blank lines and optional
+    stops (M0/M1) that precede it. The epilogue starts at the program end (M2/M30).
+    """
+    change_lines, end_line = [], len(lines)
+    for index, line in enumerate(lines):
+        g_codes, m_codes, values = parse_words(line)
+        if 6 in m_codes:
+            change_lines.append((index, int(float(values.get('T', 0)))))
+        elif (2 in m_codes or 30 in m_codes) and end_line == len(lines):
+            end_line = index
+
+    blocks = []
+    for index, tool in change_lines:
+        start = index
+        while start > 0:
+            g_codes, m_codes, values = parse_words(lines[start - 1])
+            if g_codes or values or any(m not in (0, 1) for m in m_codes):
+                break
+            start -= 1
+        blocks.append({'start': start, 'change': index, 'tool': tool})
+    for block, following in zip(blocks, blocks[1:] + [None]):
+        block['end'] = following['start'] if following else end_line
+    prologue_end = blocks[0]['start'] if blocks else end_line
+    return prologue_end, blocks, end_line
+
+
+def block_occupancy(toolpath, blocks, margin=INTERACTION_MARGIN, cell=CELL_SIZE):
+    """Occupancy grid (bool, shared extent) of each block's cutting moves, widened by tool radius + margin / 2"""
+    line_index = toolpath.line - 1
+    cutting = (toolpath.motion != 0) & ~toolpath.machine
+    known = ~np.isnan(toolpath.x) & ~np.isnan(toolpath.y)
+    segment = cutting & known & np.r_[False, known[:-1] & ~toolpath.machine[:-1]]
+    rows = np.flatnonzero(segment)
+    if len(rows) == 0:
+        return [None] * len(blocks)
+
+    x_min, y_min = np.nanmin(toolpath.x[rows]) - 1.5, np.nanmin(toolpath.y[rows]) - 1.5
+    x_max, y_max = np.nanmax(toolpath.x[rows]) + 1.5, np.nanmax(toolpath.y[rows]) + 1.5
+    shape = (int((y_max - y_min) / cell) + 1, int((x_max - x_min) / cell) + 1)
+
+    grids = []
+    for block in blocks:
+        mask = segment & (line_index >= block['start']) & (line_index < block['end'])
+        block_rows = np.flatnonzero(mask)
+        if len(block_rows) == 0:
+            grids.append(None)
+            continue
+        x0, y0 = toolpath.x[block_rows - 1], toolpath.y[block_rows - 1]
+        x1, y1 = toolpath.x[block_rows], toolpath.y[block_rows]
+        steps = np.maximum(np.ceil(np.hypot(x1 - x0, y1 - y0) / (cell / 2)).astype(np.int64), 1)
+        owner = np.repeat(np.arange(len(block_rows)), steps + 1)
+        fraction = (np.arange(len(owner)) - np.repeat(np.cumsum(steps + 1) - (steps + 1), steps + 1)) / steps[owner]
+        px = x0[owner] + (x1 - x0)[owner] * fraction
+        py = y0[owner] + (y1 - y0)[owner] * fraction
+        grid = np.zeros(shape, dtype=bool)
+        grid[((py - y_min) / cell).astype(np.int64), ((px - x_min) / cell).astype(np.int64)] = True
+
+        info = toolpath.tools.get(block['tool'])
+        reach = (info['diameter'] / 2 if info else DEFAULT_RADIUS) + margin / 2
+        cells = int(np.ceil(reach / cell))
+        dilated = np.zeros_like(grid)
+        ys, xs = np.nonzero(grid)
+        for dy in range(-cells, cells + 1):
+            for dx in range(-cells, cells + 1):
+                if (dx * dx + dy * dy) * cell * cell > (reach + cell) ** 2:
+                    continue
+                dilated[np.clip(ys + dy, 0, shape[0] - 1), np.clip(xs + dx, 0, shape[1] - 1)] = True
+        grids.append(dilated)
+    return grids
+
+
+def dependencies(blocks, grids, lines):
+    """{block: set of earlier blocks it must follow}
+
+    Blocks interact when their occupancy overlaps. A block that does not end with a G53
+    retract also keeps the block after it in place, as that block starts from its position.
+    """
+    after = {j: set() for j in range(len(blocks))}
+    for j in range(len(blocks)):
+        for i in range(j):
+            if grids[i] is None or grids[j] is None or (grids[i] & grids[j]).any():
+                after[j].add(i)
+    for i, block in enumerate(blocks[:-1]):
+        retracted = False
+        for line in reversed(lines[block['start']:block['end']]):
+            g_codes, m_codes, values = parse_words(line)
+            if any(axis in values for axis in 'XYZ'):
+                retracted = 53 in g_codes and 'Z' in values and not ('X' in values or 'Y' in values)
+                break
+        if not retracted:
+            after[i + 1].add(i)
+    return after
+
+
+def best_order(blocks, after):
+    """Block order with the fewest tool changes, closest to the original order among equals"""
+    n = len(blocks)
+    tools = [block['tool'] for block in blocks]
+    if n > MAX_EXACT_BLOCKS:
+        # Greedy: keep the loaded tool while any ready block uses it, else the earliest ready block
+        placed, order = set(), []
+        while len(order) < n:
+            ready = [j for j in range(n) if j not in placed and after[j] <= placed]
+            same = [j for j in ready if order and tools[j] == tools[order[-1]]]
+            pick = (same or ready)[0]
+            placed.add(pick)
+            order.append(pick)
+        return order
+
+    # Exact: best (changes, order) for every set of placed blocks and last block, one set size at a time
+    required = [sum(1 << i for i in after[j]) for j in range(n)]
+    layer = {(1 << j, j): (1, (j,)) for j in range(n) if not after[j]}
+    for _ in range(1, n):
+        following = {}
+        for (mask, last), (changes, order) in layer.items():
+            for j in range(n):
+                if mask & (1 << j) or mask & required[j] != required[j]:
+                    continue
+                key = (mask | (1 << j), j)
+                candidate = (changes + (tools[j] != tools[last]), order + (j,))
+                if key not in following or candidate < following[key]:
+                    following[key] = candidate
+        layer = following
+    return list(min(layer.values())[1])
+
+
+def change_count(blocks, order):
+    tools = [blocks[j]['tool'] for j in order]
+    return sum(1 for k, tool in enumerate(tools) if k == 0 or tool != tools[k - 1])
+
+
+def own_groups(lines, block):
+    """Modal groups a block sets itself before its first feed move (G43 H, S, F, ...)"""
+    states = modal_states(lines[block['start']:block['end']])
+    for index, line in enumerate(lines[block['start']:block['end']]):
+        motion = states[index + 1].get('motion', 'G0')
+        if motion not in ('G0', 'G80') and any(axis in parse_words(line)[2] for axis in 'XYZ'):
+            return set(states[index + 1])
+    return set(states[-1])
+
+
+def reorder(lines, blocks, order, prologue_end, epilogue_start):
+    """Program lines with the blocks in a new order
+
+    A block that follows a block of the same tool loses its M6 (and the optional stop
+    before it). Where a block's predecessor changes, the modal state it started with
+    in the original program is restored first - except the groups its own preamble sets
+    (own_groups), so the G43 H, S and F come from the block itself.
+    """
+    states = modal_states(lines)
+    output = list(lines[:prologue_end])
+    previous = None
+    for position, j in enumerate(order):
+        block = blocks[j]
+        body = lines[block['start']:block['end']]
+        if position > 0 and block['tool'] == blocks[previous]['tool']:
+            keep = []
+            for index, line in enumerate(body, block['start']):
+                g_codes, m_codes, values = parse_words(line)
+                if index == block['change'] or (index < block['change'] and m_codes and
+                                                all(m in (0, 1) for m in m_codes) and not g_codes and not values):
+                    continue
+                keep.append(line)
+            body = keep
+        original_previous = j - 1 if j > 0 else None
+        if previous != original_previous:
+            current = states[blocks[previous]['end']] if previous is not None else states[prologue_end]
+            own = own_groups(lines, block)
+            output += restore_lines(current, {group: value for group, value in states[block['start']].items()
+                                              if group not in own})
+        output += body
+        previous = j
+    last = blocks[order[-1]]['end'] if order else prologue_end
+    output += restore_lines(states[last], {group: value for group, value in states[epilogue_start].items()
+                                           if group not in TOOL_GROUPS})
+    output += lines[epilogue_start:]
+    return output
+
+
+def block_moves(toolpath, blocks, order):
+    """Move columns (x, y, z, motion, feed, retracted) of the blocks in the given order
+
+    retracted is 1 on the rows still at a G53 retract (CycleTime.retracted_rows) - their
+    work Z is whatever the block before left, so it is not compared.
+    """
+    line_index = toolpath.line - 1
+    retracted = CycleTime.retracted_rows(toolpath, CycleTime.filled_positions(toolpath)[:, 2])[0]
+    parts = []
+    for j in order:
+        mask = (line_index >= blocks[j]['start']) & (line_index < blocks[j]['end']) & \
+            ((toolpath.flags & FLAG_MACHINE) == 0)
+        parts.append(np.column_stack([toolpath.x[mask], toolpath.y[mask], toolpath.z[mask],
+                                      toolpath.motion[mask], toolpath.f[mask], retracted[mask]]))
+    return np.concatenate(parts) if parts else np.zeros((0, 6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reorder a program's tool blocks for the fewest tool changes")
+    parser.add_argument('tap', help="G-code (.tap) file")
+    parser.add_argument('--output', default=None, help="Output file (default: <name>_reordered.tap)")
+    parser.add_argument('--margin', type=float, default=INTERACTION_MARGIN,
+                        help="Clearance between two blocks' tools before they count as independent")
+    parser.add_argument('--tool-change', type=float, default=CycleTime.TOOL_CHANGE_SECONDS, help="Seconds per tool change")
+    parser.add_argument('--profile', default=MachineConfig.PROFILE_DIR, help="Mach4 profile folder (cycle times)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tap_path = mirror_path(args.tap)
+    with open(tap_path, 'r') as f:
+        lines = f.read().splitlines()
+    toolpath = Toolpath.open(tap_path)
+    prologue_end, blocks, epilogue_start = split_blocks(lines)
+    if not blocks:
+        parser.exit(1, "No tool changes (M6) in the program\n")
+
+    grids = block_occupancy(toolpath, blocks, args.margin)
+    after = dependencies(blocks, grids, lines)
+    order = best_order(blocks, after)
+
+    print(f"{os.path.basename(args.tap)}: {len(blocks)} tool blocks")
+    for j, block in enumerate(blocks):
+        title = next((COMMENT_RE.findall(line)[0] for line in lines[block['start']:block['change']]
+                      if COMMENT_RE.findall(line)), "")
+        print(f"  {j + 1}. T{block['tool']} lines {block['start'] + 1}-{block['end']} {title}"
+              + (f"  after {', '.join(str(i + 1) for i in sorted(after[j]))}" if after[j] else ""))
+    before, now = change_count(blocks, range(len(blocks))), change_count(blocks, order)
+    order_text = " ".join(f"{j + 1}(T{blocks[j]['tool']})" for j in order)
+    print(f"  Order: {order_text}")
+    if now == before:
+        print(f"  {before} tool changes - no order with fewer changes keeps the dependencies")
+        return
+
+    output_lines = reorder(lines, blocks, order, prologue_end, epilogue_start)
+    output = args.output or os.path.splitext(args.tap)[0] + '_reordered.tap'
+    tmp_path = output + '.part'
+    with open(tmp_path, 'w') as f:
+        f.write("\n".join(output_lines) + "\n")
+
+    # Verified as the .part file - the output name only ever holds a checked program
+    reordered = Toolpath(tmp_path)
+    expected = block_moves(toolpath, blocks, order)
+    actual = block_moves(reordered, [{'start': 0, 'end': len(output_lines)}], [0])
+    if expected.shape == actual.shape:
+        # Z at a G53 retract and the modal F of rapids are what the block before left
+        stale = (expected[:, 5] > 0) | (actual[:, 5] > 0)
+        expected[stale, 2] = actual[stale, 2] = np.nan
+        rapid = expected[:, 3] == 0
+        expected[rapid, 4] = actual[rapid, 4] = np.nan
+    if expected.shape != actual.shape or not np.allclose(expected[:, :5], actual[:, :5], equal_nan=True):
+        os.remove(tmp_path)
+        parser.exit(1, f"Reordered moves do not match the original blocks - {output} not written\n")
+    os.replace(tmp_path, output)
+
+    limits = MachineConfig.axis_limits(os.path.join(args.profile, "Machine.ini"))
+    motion_before = CycleTime.estimate(toolpath, limits)[0].sum()
+    motion_after = CycleTime.estimate(reordered, limits)[0].sum()
+    saved = (before - now) * args.tool_change + motion_before - motion_after
+    print(f"  Tool changes {before} -> {now} ({before - now} saved), estimated time saved "
+          f"{CycleTime.format_duration(saved)} (motion {motion_before - motion_after:+.0f}s)")
+    print(f"  Moves verified against the original blocks -> {output} ({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Resolve Archive - Re-solve keytop parameters for every probed piano in the Logs folder
+Writes KeyParameters_{piano}.csv into each piano folder plus a consolidated archive table
+and the per-key angle/width priors (KeyPriors.json) used by the Fusion add-in
+Folders whose probe CSV and CONFIG are unchanged since the last run are skipped
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import KeytopSolver
+from KeytopSolver import CONFIG, LOGS_DIR
+
+MANIFEST_NAME = "ResolveArchive_manifest.json"
+ARCHIVE_NAME = "KeyParameters_Archive.csv"
+PRIORS_NAME = "KeyPriors.json"  # Angle search priors read by the Fusion add-in
+
+ARCHIVE_HEADER = ['Piano', 'Section'] + KeytopSolver.PARAMS_HEADER + \
+                 ['ShoulderLength', 'KeyHeight', 'ConfigHash']
+
+
+def file_sha1(path):
+    """SHA1 of a file's contents"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(path):
+    """Load the resolve manifest (empty if missing or unreadable)"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_current(entry, csv_path, params_path, cfg_hash):
+    """Check whether a manifest entry still matches the CSV on disk and the CONFIG"""
+    if not entry or entry.get('config_hash') != cfg_hash:
+        return False
+    if not os.path.exists(params_path):
+        return False
+    stat = os.stat(csv_path)
+    if entry.get('csv_size') == stat.st_size and entry.get('csv_mtime') == stat.st_mtime:
+        return True
+    # Size/mtime changed - only re-solve if the contents actually differ
+    return entry.get('csv_sha1') == file_sha1(csv_path)
+
+
+def solve_folder(piano_id, csv_path, config):
+    """Worker: solve one piano folder and write its KeyParameters CSV"""
+    start = time.time()
+    stat = os.stat(csv_path)
+    probe_data = KeytopSolver.parse_csv(csv_path)
+    key_params, shoulder_length, key_height = KeytopSolver.solve_section(probe_data, config)
+
+    params_path = os.path.join(os.path.dirname(csv_path), f"KeyParameters_{piano_id}.csv")
+    KeytopSolver.write_params_csv(params_path, key_params, shoulder_length, key_height)
+
+    rows = []
+    for key_num in sorted(key_params.keys()):
+        params = key_params[key_num]
+        rows.append([key_num, KeytopSolver.key_shoulders(key_num), params['X'], params['Angle'],
+                     params['Width'], params['LStep'], params['RStep']])
+
+    return piano_id, {
+        'csv_size': stat.st_size,
+        'csv_mtime': stat.st_mtime,
+        'csv_sha1': file_sha1(csv_path),
+        'config_hash': KeytopSolver.config_hash(config),
+        'section': KeytopSolver.section_from_name(piano_id),
+        'shoulder_length': shoulder_length,
+        'key_height': key_height,
+        'rows': rows,
+        'solve_seconds': time.time() - start,
+    }
+
+
+def write_archive(path, manifest):
+    """Write the consolidated parameter table for every piano in the manifest"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ARCHIVE_HEADER)
+        for piano_id in sorted(manifest.keys()):
+            entry = manifest[piano_id]
+            for row in entry['rows']:
+                key_num, stype, center_x, angle, width, lstep, rstep = row
+                writer.writerow([
+                    piano_id, entry['section'], key_num, stype,
+                    f"{center_x:.6f}", f"{angle:.4f}", f"{width:.6f}",
+                    f"{lstep:.6f}", f"{rstep:.6f}",
+                    f"{entry['shoulder_length']:.6f}", f"{entry['key_height']:.6f}",
+                    entry['config_hash'],
+                ])
+
+
+def update_priors(path, manifest):
+    """Merge every archived job's angle and width per key into the add-in's priors store"""
+    try:
+        with open(path, 'r') as f:
+            store = json.load(f)
+    except (OSError, ValueError):
+        store = {}
+
+    for piano_id, entry in manifest.items():
+        if entry['section'] not in ('Upper', 'Lower'):
+            continue
+        store.setdefault(entry['section'], {})[piano_id] = {
+            str(row[0]): [round(row[3], 4), round(row[4], 6)] for row in entry['rows']
+        }
+
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w') as f:
+        json.dump(store, f, indent=1)
+    os.replace(tmp_path, path)  # The add-in may be reading it for a warm start
+
+
+def resolve_archive(logs_dir=LOGS_DIR, config=None, workers=None, force=False):
+    """Re-solve every stale piano folder in parallel, returns (solved, skipped) counts"""
+    config = config or CONFIG
+    cfg_hash = KeytopSolver.config_hash(config)
+    manifest_path = os.path.join(logs_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    folders = KeytopSolver.find_piano_folders(logs_dir)
+    present = {piano_id for piano_id, _ in folders}
+
+    pending = []
+    for piano_id, csv_path in folders:
+        params_path = os.path.join(os.path.dirname(csv_path), f"KeyParameters_{piano_id}.csv")
+        if not force and is_current(manifest.get(piano_id), csv_path, params_path, cfg_hash):
+            continue
+        pending.append((piano_id, csv_path))
+
+    print(f"{len(folders)} piano folders, {len(pending)} to solve (config {cfg_hash})")
+
+    start = time.time()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(solve_folder, piano_id, csv_path, config): piano_id
+                       for piano_id, csv_path in pending}
+            for future in as_completed(futures):
+                piano_id = futures[future]
+                try:
+                    _, entry = future.result()
+                except Exception as e:
+                    print(f"  FAILED {piano_id}: {e}")
+                    manifest.pop(piano_id, None)
+                    continue
+                manifest[piano_id] = entry
+                print(f"  {piano_id}: {len(entry['rows'])} keys ({entry['solve_seconds']:.2f}s)")
+
+    # Drop folders that no longer exist
+    for piano_id in list(manifest.keys()):
+        if piano_id not in present:
+            del manifest[piano_id]
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    write_archive(os.path.join(logs_dir, ARCHIVE_NAME), manifest)
+    # The add-in's warm starts must only learn from production solves, not --set experiments
+    if cfg_hash == KeytopSolver.config_hash(CONFIG):
+        update_priors(os.path.join(logs_dir, PRIORS_NAME), manifest)
+    else:
+        print(f"Config {cfg_hash} differs from the production CONFIG - {PRIORS_NAME} not updated")
+
+    print(f"Solved {len(pending)} folders in {time.time() - start:.2f}s, "
+          f"skipped {len(folders) - len(pending)} unchanged")
+    return len(pending), len(folders) - len(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-solve keytop parameters for every piano in the Logs folder")
+    parser.add_argument('--logs', default=LOGS_DIR, help="Logs folder to scan")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--force', action='store_true', help="Re-solve every folder even if unchanged")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help="Override a CONFIG value, e.g. --set plastic_thickness=0.07")
+    args = parser.parse_args()
+
+    config = dict(CONFIG)
+    for item in args.set:
+        name, _, value = item.partition('=')
+        if name not in config:
+            parser.error(f"Unknown CONFIG key: {name}")
+        config[name] = float(value)
+
+    resolve_archive(args.logs, config, args.workers, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+Run From Here Index - Modal-state checkpoints for resuming a program mid-file (<name>.tap.rfh sidecar)
+Every N lines the full modal state before that line is recorded with the line's byte offset in the file
+RunFromHere (ScreenLoad.lua) seeks to the last checkpoint at or before the selected line and replays from there
+The sidecar is plain text: key=value header lines, a column line, then one comma-separated checkpoint per line
+"""
+
+import argparse
+import os
+import time
+
+from LogsMirror import mirror_path
+from NormalizeGCode import COMMENT_RE, WORD_RE, CYCLES, format_number
+
+INDEX_VERSION = 2
+INTERVAL = 500  # Lines between checkpoints - the longest replay RunFromHere has to do
+INDEX_EXTENSION = '.rfh'
+COLUMNS = ('line', 'offset', 'x', 'y', 'z', 'retracted', 'distance', 'work_offset', 'tool', 'next_tool', 'speed',
+           'spindle', 'coolant', 'feed', 'plane', 'motion', 'retract', 'cycle', 'cycle_initial', 'cycle_r', 'cycle_z')
+
+
+class ModalTracker:
+    """Modal state of a program line by line, as RunFromHere needs it to resume
+
+    Positions are the last programmed work coordinates (absolute, G91 moves added up).
+    A G53 Z move sets retracted until the program moves Z again. Inside a canned cycle
+    Z is the retract level (initial Z for G98, R for G99) and cycle is the line of the
+    G81-G89 that started it.
+    """
+
+    def __init__(self):
+        self.position = {'x': None, 'y': None, 'z': None}
+        self.retracted = False
+        self.distance = 'G90'
+        self.work_offset = None
+        self.tool = None
+        self.next_tool = None
+        self.speed = None
+        self.spindle = 'M5'
+        self.coolant = 'M9'
+        self.feed = None
+        self.plane = 'G17'
+        self.motion = None
+        self.cycle = None
+        self.cycle_words = {}
+        self.retract_initial = True
+
+    def update(self, number, line):
+        """Apply one line (0-based line number)"""
+        words = WORD_RE.findall(COMMENT_RE.sub(' ', line).upper())
+        if not words:
+            return
+        g_codes = [float(value) for letter, value in words if letter == 'G']
+        m_codes = [float(value) for letter, value in words if letter == 'M']
+        values = {letter: float(value) for letter, value in words if letter not in 'GMN'}
+
+        machine = False
+        for g in g_codes:
+            if g in (90, 91):
+                self.distance = f"G{g:g}"
+            elif g in (17, 18, 19):
+                self.plane = f"G{g:g}"
+            elif 54 <= g <= 59:
+                self.work_offset = f"G{g:g}"
+            elif g == 98:
+                self.retract_initial = True
+            elif g == 99:
+                self.retract_initial = False
+            elif g == 53:
+                machine = True
+            elif g in (0, 1, 2, 3, 80) or g in CYCLES:
+                if g in CYCLES and self.cycle is None:
+                    self.cycle = number
+                    self.cycle_words = {'initial': self.position['z']}
+                elif g not in CYCLES:
+                    self.cycle = None
+                self.motion = f"G{g:g}"
+
+        if 'T' in values:
+            self.next_tool = int(values['T'])
+        for m in m_codes:
+            if m == 6:
+                self.tool = self.next_tool
+            elif m in (3, 4, 5):
+                self.spindle = f"M{m:g}"
+            elif m in (7, 8, 9):
+                self.coolant = f"M{m:g}"
+            elif m in (2, 30):
+                self.spindle, self.coolant, self.motion, self.cycle = 'M5', 'M9', None, None
+        if 'S' in values:
+            self.speed = values['S']
+        if 'F' in values:
+            self.feed = values['F']
+
+        if machine:
+            if 'Z' in values:
+                self.retracted = True
+            return
+        if self.cycle is not None:
+            for word in 'ZR':
+                if word in values:
+                    self.cycle_words[word] = values[word]
+        for axis in 'xyz':
+            value = values.get(axis.upper())
+            if value is None:
+                continue
+            if self.cycle is not None and axis == 'z':
+                continue
+            if self.distance == 'G91' and self.position[axis] is not None:
+                value += self.position[axis]
+            self.position[axis] = value
+            if axis == 'z':
+                self.retracted = False
+        if self.cycle is not None and ('X' in values or 'Y' in values or any(g in CYCLES for g in g_codes)):
+            level = self.cycle_words.get('initial') if self.retract_initial else self.cycle_words.get('R')
+            if level is not None:
+                self.position['z'] = level
+                self.retracted = False
+
+    def row(self, number, offset):
+        """Checkpoint fields in COLUMNS order (empty when unknown)"""
+        def text(value):
+            return '' if value is None else format_number(value)
+
+        return [str(number), str(offset), text(self.position['x']), text(self.position['y']),
+                text(self.position['z']), '1' if self.retracted else '0', self.distance, self.work_offset or '',
+                '' if self.tool is None else str(self.tool), '' if self.next_tool is None else str(self.next_tool),
+                text(self.speed), self.spindle, self.coolant, text(self.feed), self.plane, self.motion or '',
+                'G98' if self.retract_initial else 'G99', '' if self.cycle is None else str(self.cycle),
+                text(self.cycle_words.get('initial')), text(self.cycle_words.get('R')),
+                text(self.cycle_words.get('Z'))]
+
+
+def program_lines(data):
+    """(0-based line number, byte offset, text) of every line in the file contents"""
+    offset = 0
+    for number, raw in enumerate(data.split(b'\n')):
+        if offset >= len(data):
+            break
+        yield number, offset, raw.rstrip(b'\r').decode('latin-1')
+        offset += len(raw) + 1
+
+
+def build_index(tap_path, interval=INTERVAL):
+    """(header dict, checkpoint rows) for a program - a checkpoint holds the state before its line"""
+    mtime = int(os.path.getmtime(tap_path))
+    with open(tap_path, 'rb') as f:
+        data = f.read()
+    tracker = ModalTracker()
+    rows = []
+    count = 0
+    for number, offset, line in program_lines(data):
+        if number % interval == 0:
+            rows.append(tracker.row(number, offset))
+        tracker.update(number, line)
+        count = number + 1
+    header = {'version': INDEX_VERSION, 'file': os.path.basename(tap_path), 'size': len(data), 'mtime': mtime,
+              'lines': count, 'interval': interval}
+    return header, rows
+
+
+def write_index(tap_path, interval=INTERVAL):
+    """Write <tap>.rfh next to the program, returns (path, header)"""
+    header, rows = build_index(tap_path, interval)
+    index_path = tap_path + INDEX_EXTENSION
+    tmp_path = index_path + '.part'
+    with open(tmp_path, 'w', newline='\n') as f:
+        for key, value in header.items():
+            f.write(f"{key}={value}\n")
+        f.write(",".join(COLUMNS) + "\n")
+        for row in rows:
+            f.write(",".join(row) + "\n")
+    os.replace(tmp_path, index_path)
+    return index_path, header
+
+
+def read_index(index_path):
+    """(header dict, checkpoint dicts) from a sidecar"""
+    header, columns, rows = {}, None, []
+    with open(index_path, 'r') as f:
+        for line in f.read().splitlines():
+            if columns is None and '=' in line:
+                key, value = line.split('=', 1)
+                header[key] = value
+            elif columns is None:
+                columns = line.split(',')
+            elif line:
+                rows.append(dict(zip(columns, line.split(','))))
+    if header.get('version') != str(INDEX_VERSION):
+        raise ValueError(f"Unsupported index version: {header.get('version')}")
+    return header, rows
+
+
+def resume_state(tap_path, index_path, line):
+    """Modal state before a 0-based line: one seek to the nearest checkpoint, then a replay
+
+    Returns (tracker, lines replayed). Fails if the index does not match the program
+    (size or whole-second mtime changed).
+    """
+    header, rows = read_index(index_path)
+    if int(header['size']) != os.path.getsize(tap_path) or int(header['mtime']) != int(os.path.getmtime(tap_path)):
+        raise ValueError(f"{os.path.basename(index_path)} does not match {os.path.basename(tap_path)} "
+                         f"(program changed since it was indexed)")
+    checkpoint = max((row for row in rows if int(row['line']) <= line), key=lambda row: int(row['line']))
+
+    tracker = ModalTracker()
+    for axis in 'xyz':
+        tracker.position[axis] = float(checkpoint[axis]) if checkpoint[axis] else None
+    tracker.retracted = checkpoint['retracted'] == '1'
+    tracker.distance = checkpoint['distance']
+    tracker.work_offset = checkpoint['work_offset'] or None
+    tracker.tool = int(checkpoint['tool']) if checkpoint['tool'] else None
+    tracker.next_tool = int(checkpoint['next_tool']) if checkpoint['next_tool'] else None
+    tracker.speed = float(checkpoint['speed']) if checkpoint['speed'] else None
+    tracker.spindle, tracker.coolant, tracker.plane = checkpoint['spindle'], checkpoint['coolant'], checkpoint['plane']
+    tracker.feed = float(checkpoint['feed']) if checkpoint['feed'] else None
+    tracker.motion = checkpoint['motion'] or None
+    tracker.retract_initial = checkpoint['retract'] != 'G99'
+    tracker.cycle = int(checkpoint['cycle']) if checkpoint['cycle'] else None
+    tracker.cycle_words = {word: float(checkpoint[column]) for word, column in
+                           (('initial', 'cycle_initial'), ('R', 'cycle_r'), ('Z', 'cycle_z')) if checkpoint[column]}
+
+    number = int(checkpoint['line'])
+    with open(tap_path, 'rb') as f:
+        f.seek(int(checkpoint['offset']))
+        while number < line:
+            raw = f.readline()
+            if not raw:
+                break
+            tracker.update(number, raw.rstrip(b'\r\n').decode('latin-1'))
+            number += 1
+    return tracker, number - int(checkpoint['line'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the Run From Here checkpoint index (<name>.tap.rfh)")
+    parser.add_argument('tap', help="G-code (.tap) file")
+    parser.add_argument('--interval', type=int, default=INTERVAL, help="Lines between checkpoints")
+    parser.add_argument('--line', type=int, default=None,
+                        help="Show the resume state before this line (1-based, as in the G-code window)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tap_path = mirror_path(args.tap)
+    if args.line is None:
+        index_path, header = write_index(tap_path, args.interval)
+        print(f"{os.path.basename(args.tap)}: {header['lines']} lines, checkpoint every {args.interval} "
+              f"-> {index_path} ({time.perf_counter() - start:.2f}s)")
+        return
+
+    index_path = tap_path + INDEX_EXTENSION
+    try:
+        tracker, replayed = resume_state(tap_path, index_path, args.line - 1)
+    except (OSError, ValueError):
+        write_index(tap_path, args.interval)  # Missing, older version or stale
+        tracker, replayed = resume_state(tap_path, index_path, args.line - 1)
+    position = " ".join(f"{axis.upper()}{format_number(value) if value is not None else '?'}"
+                        for axis, value in tracker.position.items())
+    print(f"Before line {args.line} ({replayed} lines replayed, {(time.perf_counter() - start) * 1000:.0f}ms):")
+    print(f"  Position {position}{' (retracted)' if tracker.retracted else ''}")
+    print(f"  {tracker.distance} {tracker.plane} {tracker.work_offset or ''} {tracker.motion or ''} "
+          f"{'G98' if tracker.retract_initial else 'G99'} F{format_number(tracker.feed) if tracker.feed is not None else '?'}")
+    print(f"  Tool T{tracker.tool} (next T{tracker.next_tool}), spindle S{format_number(tracker.speed).rstrip('.') if tracker.speed else '?'} "
+          f"{tracker.spindle}, coolant {tracker.coolant}")
+    if tracker.cycle is not None:
+        print(f"  Inside a canned cycle started on line {tracker.cycle + 1} - resume from there")
+
+
+if __name__ == '__main__':
+    main()
@@ -759,17 +759,186 @@ function SetSRO(value)
     scr.SetProperty("slideSRO", "Value", tostring(value))
 end
 
--- Helper function for Run From Here functionality
-function RunFromHere()
-    local selectedLine = mc.mcCntlGetGcodeLineNbr(inst)
+-- Canned cycles tracked by the Run From Here replay (same as Scripts/RunFromHereIndex.py)
+local RFH_CYCLES = {[81] = true, [82] = true, [83] = true, [85] = true, [86] = true, [89] = true}
+
+-- Apply one G-code line (0-based number) to a Run From Here state
+-- Same rules as ModalTracker in Scripts/RunFromHereIndex.py
+function RunFromHereReplayLine(state, number, line)
+    local cleanLine = line:gsub("%b()", " "):gsub(";.*", ""):upper()
+    local gCodes, mCodes, values = {}, {}, {}
+    for letter, value in cleanLine:gmatch("([A-Z])%s*([-+]?[%d%.]+)") do
+        local code = tonumber(value)
+        if code then
+            if letter == "G" then
+                gCodes[#gCodes + 1] = code
+            elseif letter == "M" then
+                mCodes[#mCodes + 1] = code
+            elseif letter ~= "N" then
+                values[letter] = code
+            end
+        end
+    end
 
-    -- If at beginning, no need for run-from-here
-    if selectedLine <= 1 then
-        return false  -- Continue with normal cycle start
+    local machine, cycleCode = false, false
+    for _, g in ipairs(gCodes) do
+        if g == 90 or g == 91 then
+            state.distance = string.format("G%d", g)
+        elseif g == 17 or g == 18 or g == 19 then
+            state.plane = string.format("G%d", g)
+        elseif g == 54 or g == 55 or g == 56 or g == 57 or g == 58 or g == 59 then
+            state.workOffset = string.format("G%d", g)
+        elseif g == 98 or g == 99 then
+            state.retractMode = string.format("G%d", g)
+        elseif g == 53 then
+            machine = true
+        elseif g == 0 or g == 1 or g == 2 or g == 3 or g == 80 or RFH_CYCLES[g] then
+            if RFH_CYCLES[g] then
+                cycleCode = true
+                if not state.cycle then
+                    state.cycle = number
+                    state.cycleInitial, state.cycleR, state.cycleZ = state.z, nil, nil
+                end
+            else
+                state.cycle = nil
+            end
+            state.motion = string.format("G%d", g)
+        end
+    end
+
+    if values.T then state.nextTool = values.T end
+    for _, m in ipairs(mCodes) do
+        if m == 6 then
+            state.tool = state.nextTool
+        elseif m == 3 or m == 4 or m == 5 then
+            state.spindleDir = string.format("M%d", m)
+        elseif m == 7 or m == 8 or m == 9 then
+            state.coolant = string.format("M%d", m)
+        elseif m == 2 or m == 30 then
+            state.spindleDir, state.coolant, state.motion, state.cycle = "M5", "M9", nil, nil
+        end
+    end
+    if values.S then state.spindleSpeed = values.S end
+    if values.F then state.feedRate = values.F end
+
+    if machine then
+        if values.Z then state.retracted = true end
+        return
+    end
+    if state.cycle then
+        if values.R then state.cycleR = values.R end
+        if values.Z then state.cycleZ = values.Z end
+    end
+    for _, axis in ipairs({"X", "Y", "Z"}) do
+        local key = axis:lower()
+        if values[axis] and not (state.cycle and axis == "Z") then
+            if state.distance == "G91" and state[key] then
+                state[key] = state[key] + values[axis]
+            else
+                state[key] = values[axis]
+            end
+            if axis == "Z" then state.retracted = false end
+        end
+    end
+    -- Inside a canned cycle Z is the retract level: initial Z for G98, R for G99
+    if state.cycle and (values.X or values.Y or cycleCode) then
+        local level = state.cycleInitial
+        if state.retractMode == "G99" then level = state.cycleR end
+        if level then
+            state.z = level
+            state.retracted = false
+        end
+    end
+end
+
+-- Modal state before a 0-based line from the <file>.rfh checkpoint index (Scripts/RunFromHereIndex.py)
+-- One seek to the last checkpoint at or before the line, then a replay of at most one interval
+-- Returns state, selected line text - or nil if there is no index or it does not match the file
+function RunFromHereIndexState(filePath, targetLine)
+    local index = io.open(filePath .. ".rfh", "r")
+    if not index then return nil end
+    local header, columns, checkpoint = {}, nil, nil
+    for line in index:lines() do
+        line = line:gsub("\r$", "")
+        if not columns then
+            local key, value = line:match("^(%w+)=(.*)$")
+            if key then
+                header[key] = value
+            else
+                columns = {}
+                for name in line:gmatch("[^,]+") do columns[#columns + 1] = name end
+            end
+        elseif line ~= "" then
+            local row, column = {}, 1
+            for value in (line .. ","):gmatch("([^,]*),") do
+                row[columns[column] or column] = value
+                column = column + 1
+            end
+            if tonumber(row.line) > targetLine then break end
+            checkpoint = row
+        end
+    end
+    index:close()
+    if header.version ~= "2" or not checkpoint then return nil end
+
+    local file = io.open(filePath, "rb")
+    if not file then return nil end
+    if file:seek("end") ~= tonumber(header.size) or wx.wxFileModificationTime(filePath) ~= tonumber(header.mtime) then
+        file:close()  -- Program changed since the index was written
+        return nil
     end
 
+    local state = {
+        x = tonumber(checkpoint.x), y = tonumber(checkpoint.y), z = tonumber(checkpoint.z),
+        retracted = checkpoint.retracted == "1",
+        distance = checkpoint.distance,
+        workOffset = checkpoint.work_offset ~= "" and checkpoint.work_offset or nil,
+        tool = tonumber(checkpoint.tool),
+        nextTool = tonumber(checkpoint.next_tool),
+        spindleSpeed = tonumber(checkpoint.speed),
+        spindleDir = checkpoint.spindle,
+        coolant = checkpoint.coolant,
+        feedRate = tonumber(checkpoint.feed),
+        plane = checkpoint.plane,
+        motion = checkpoint.motion ~= "" and checkpoint.motion or nil,
+        retractMode = checkpoint.retract,
+        cycle = tonumber(checkpoint.cycle),
+        cycleInitial = tonumber(checkpoint.cycle_initial),
+        cycleR = tonumber(checkpoint.cycle_r),
+        cycleZ = tonumber(checkpoint.cycle_z)
+    }
+    file:seek("set", tonumber(checkpoint.offset))
+    local number = tonumber(checkpoint.line)
+    while number < targetLine do
+        local line = file:read("*l")
+        if not line then break end
+        RunFromHereReplayLine(state, number, (line:gsub("\r$", "")))
+        number = number + 1
+    end
+    local selectedContent = file:read("*l") or ""
+    file:close()
+    return state, (selectedContent:gsub("\r$", ""))
+end
+
+-- Run From Here state from the checkpoint index - returns state, safeLine, adjustmentWarning, selectedContent
+-- Inside a canned cycle the start moves back to the cycle's first line and the state is taken there
+function RunFromHereIndexed(filePath, selectedLine)
+    local state, selectedContent = RunFromHereIndexState(filePath, selectedLine)
+    if not state then return nil end
+    local safeLine, adjustmentWarning = selectedLine, nil
+    if state.cycle and state.cycle < selectedLine then
+        safeLine = state.cycle
+        adjustmentWarning = string.format("Starting from line %d (canned cycle start)", safeLine + 1)
+        state = RunFromHereIndexState(filePath, safeLine)
+        if not state then return nil end
+    end
+    return state, safeLine, adjustmentWarning, selectedContent
+end
+
+-- Run From Here state by reading the whole file and scanning backwards through the raw text
+-- Fallback when there is no checkpoint index - returns state, safeLine, adjustmentWarning, selectedContent
+function RunFromHereScan(filePath, selectedLine)
     -- Read file directly for fast line access
-    local filePath = mc.mcCntlGetGcodeFileName(inst)
     local lines = {}
     local file = io.open(filePath, "r")
     if file then
@@ -879,8 +1048,27 @@ function RunFromHere()
         end
     end
 
-    -- Build preview message (use cached lines table, +1 for 0-indexed to 1-indexed)
-    local selectedContent = lines[selectedLine + 1] or ""
+    -- +1 for 0-indexed to 1-indexed
+    return state, safeLine, adjustmentWarning, lines[selectedLine + 1] or ""
+end
+
+-- Helper function for Run From Here functionality
+function RunFromHere()
+    local selectedLine = mc.mcCntlGetGcodeLineNbr(inst)
+
+    -- If at beginning, no need for run-from-here
+    if selectedLine <= 1 then
+        return false  -- Continue with normal cycle start
+    end
+
+    -- Checkpoint index first (one seek and a short replay), whole-file scan if there is none
+    local filePath = mc.mcCntlGetGcodeFileName(inst)
+    local state, safeLine, adjustmentWarning, selectedContent = RunFromHereIndexed(filePath, selectedLine)
+    if not state then
+        state, safeLine, adjustmentWarning, selectedContent = RunFromHereScan(filePath, selectedLine)
+    end
+
+    -- Build preview message
     local message = string.format("Run from line %d?\n────────────────\nSelected: %s\n",
                                  selectedLine + 1, selectedContent)
 
@@ -904,6 +1092,9 @@ function RunFromHere()
 
     if state.x and state.y and state.z then
         message = message .. string.format("• Position: X%.4f Y%.4f Z%.4f\n", state.x, state.y, state.z)
+        if state.retracted then
+            message = message .. "• Z retracted (G53) - the program moves Z next\n"
+        end
     else
         message = message .. "• Position: ERROR - Missing coordinate data\n"
     end
@@ -999,11 +1190,17 @@ function RunFromHereExecute(state, safeLine)
     end
 
     -- 3. Set work offset and modes
-    local setupCmd = "G90 G94 G17"
+    local setupCmd = "G90 G94 " .. (state.plane or "G17")
     if state.workOffset then
         setupCmd = setupCmd .. " " .. state.workOffset
     end
+    if state.retractMode then
+        setupCmd = setupCmd .. " " .. state.retractMode
+    end
     mc.mcCntlGcodeExecuteWait(inst, setupCmd)
+    if state.nextTool and state.nextTool ~= state.tool then
+        mc.mcCntlGcodeExecuteWait(inst, string.format("T%d", state.nextTool))  -- Tool the program preselected
+    end
 
     -- 4. Start spindle
     if state.spindleSpeed and state.spindleDir ~= "M5" then
@@ -1019,58 +1216,61 @@ function RunFromHereExecute(state, safeLine)
     -- 6. Move to XY position
     mc.mcCntlGcodeExecuteWait(inst, string.format("G0 X%.4f Y%.4f", state.x, state.y))
 
-    -- 7. Show plunge confirmation dialog
-    local currentZ = mc.mcAxisGetPos(inst, mc.Z_AXIS)
-    local plungeMsg = string.format(
-        "Ready to Start Program\n────────────────────\n\n" ..
-        "Machine positioned at:\n" ..
-        "X%.4f Y%.4f\n" ..
-        "Current Z: %.4f\n\n" ..
-        "Program Z height: %.4f\n\n" ..
-        "Choose how to proceed:",
-        state.x, state.y, currentZ, state.z
-    )
+    -- 7. Show plunge confirmation dialog (not after a G53 retract - the program moves Z itself)
+    local plungeResult = 2
+    if not state.retracted then
+        local currentZ = mc.mcAxisGetPos(inst, mc.Z_AXIS)
+        local plungeMsg = string.format(
+            "Ready to Start Program\n────────────────────\n\n" ..
+            "Machine positioned at:\n" ..
+            "X%.4f Y%.4f\n" ..
+            "Current Z: %.4f\n\n" ..
+            "Program Z height: %.4f\n\n" ..
+            "Choose how to proceed:",
+            state.x, state.y, currentZ, state.z
+        )
 
-    local plungeDlg = wx.wxDialog(wx.NULL, wx.wxID_ANY, "Ready to Start",
-                                  wx.wxDefaultPosition, wx.wxDefaultSize)
+        local plungeDlg = wx.wxDialog(wx.NULL, wx.wxID_ANY, "Ready to Start",
+                                      wx.wxDefaultPosition, wx.wxDefaultSize)
 
-    local plungePanel = wx.wxPanel(plungeDlg, wx.wxID_ANY)
-    local plungeSizer = wx.wxBoxSizer(wx.wxVERTICAL)
+        local plungePanel = wx.wxPanel(plungeDlg, wx.wxID_ANY)
+        local plungeSizer = wx.wxBoxSizer(wx.wxVERTICAL)
 
-    local plungeText = wx.wxStaticText(plungePanel, wx.wxID_ANY, plungeMsg)
-    plungeSizer:Add(plungeText, 0, wx.wxALL, 15)
-    plungeSizer:AddSpacer(10)
+        local plungeText = wx.wxStaticText(plungePanel, wx.wxID_ANY, plungeMsg)
+        plungeSizer:Add(plungeText, 0, wx.wxALL, 15)
+        plungeSizer:AddSpacer(10)
 
-    local plungeBtnSizer = wx.wxBoxSizer(wx.wxHORIZONTAL)
-    local plungeBtn = wx.wxButton(plungePanel, wx.wxID_ANY, "Plunge and Start")
-    local currentBtn = wx.wxButton(plungePanel, wx.wxID_ANY, "Start at Current Z")
-    local abortBtn = wx.wxButton(plungePanel, wx.wxID_CANCEL, "Abort")
+        local plungeBtnSizer = wx.wxBoxSizer(wx.wxHORIZONTAL)
+        local plungeBtn = wx.wxButton(plungePanel, wx.wxID_ANY, "Plunge and Start")
+        local currentBtn = wx.wxButton(plungePanel, wx.wxID_ANY, "Start at Current Z")
+        local abortBtn = wx.wxButton(plungePanel, wx.wxID_CANCEL, "Abort")
 
-    plungeBtn:Connect(wx.wxEVT_COMMAND_BUTTON_CLICKED, function(event)
-        plungeDlg:EndModal(1)
-    end)
-    currentBtn:Connect(wx.wxEVT_COMMAND_BUTTON_CLICKED, function(event)
-        plungeDlg:EndModal(2)
-    end)
+        plungeBtn:Connect(wx.wxEVT_COMMAND_BUTTON_CLICKED, function(event)
+            plungeDlg:EndModal(1)
+        end)
+        currentBtn:Connect(wx.wxEVT_COMMAND_BUTTON_CLICKED, function(event)
+            plungeDlg:EndModal(2)
+        end)
 
-    plungeBtn:SetDefault()
-    plungeBtnSizer:Add(plungeBtn, 0, wx.wxALL, 5)
-    plungeBtnSizer:Add(currentBtn, 0, wx.wxALL, 5)
-    plungeBtnSizer:Add(abortBtn, 0, wx.wxALL, 5)
+        plungeBtn:SetDefault()
+        plungeBtnSizer:Add(plungeBtn, 0, wx.wxALL, 5)
+        plungeBtnSizer:Add(currentBtn, 0, wx.wxALL, 5)
+        plungeBtnSizer:Add(abortBtn, 0, wx.wxALL, 5)
 
-    plungeSizer:Add(plungeBtnSizer, 0, wx.wxALIGN_CENTER + wx.wxALL, 15)
+        plungeSizer:Add(plungeBtnSizer, 0, wx.wxALIGN_CENTER + wx.wxALL, 15)
 
-    plungePanel:SetSizerAndFit(plungeSizer)
-    plungeDlg:SetClientSize(plungePanel:GetSize())
-    plungeDlg:Centre()
+        plungePanel:SetSizerAndFit(plungeSizer)
+        plungeDlg:SetClientSize(plungePanel:GetSize())
+        plungeDlg:Centre()
 
-    local plungeResult = plungeDlg:ShowModal()
-    plungeDlg:Destroy()
+        plungeResult = plungeDlg:ShowModal()
+        plungeDlg:Destroy()
 
-    if plungeResult == wx.wxID_CANCEL then
-        mc.mcCntlGcodeExecuteWait(inst, "M5 M9")
-        mc.mcCntlSetLastError(inst, "Run From Here aborted")
-        return
+        if plungeResult == wx.wxID_CANCEL then
+            mc.mcCntlGcodeExecuteWait(inst, "M5 M9")
+            mc.mcCntlSetLastError(inst, "Run From Here aborted")
+            return
+        end
     end
 
     -- 8. Move to Z position (only if user chose to plunge)
@@ -1087,6 +1287,9 @@ function RunFromHereExecute(state, safeLine)
         feedCmd = string.format("G1 F%.1f", state.feedRate)
     end
     mc.mcCntlGcodeExecuteWait(inst, feedCmd)
+    if state.distance == "G91" then
+        mc.mcCntlGcodeExecuteWait(inst, "G91")  -- Resume point is in incremental mode
+    end
 
     -- 10. Jump to line and start cycle
     mc.mcCntlSetGcodeLineNbr(inst, safeLine)
@@ -0,0 +1,308 @@
+"""
+Split Program - Per-key and per-tool sub-programs of a shaping program, plus a key -> line range index
+Every move is tagged with each key it reaches (its X extent plus the tool radius against the solved key outlines)
+A sub-program keeps each selected tool block's preamble (tool change, spindle, offset, coolant) and its retract
+Each stretch starts at the program's last point above the block's cuts: G0 there from clearance, then its own approach
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+import CycleTime
+import EnvelopeCheck
+import KeytopSolver
+from GCodeReader import Toolpath
+from LogsMirror import mirror_path
+from NormalizeGCode import CYCLES, format_number
+from ReorderTools import G_GROUPS, RESTORED_MOTIONS, modal_states, parse_words, restore_lines, split_blocks
+
+INDEX_SUFFIX = '_KeyIndex.csv'
+
+
+def parse_selection(text):
+    """Numbers from a '12,15-17' style list"""
+    numbers = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        try:
+            numbers.update(range(int(first), int(last or first) + 1))
+        except ValueError:
+            raise ValueError(f"Bad number list: {text}")
+    return numbers
+
+
+def block_layout(lines, toolpath, block):
+    """(body start, body end, clearance Z) of a tool block - line indexes, end exclusive
+
+    The body starts after the G43 line (the first move after the tool change without
+    one) and ends at the last feed move; the rest of the block is preamble and retract.
+    Returns None for a block without feed moves.
+    """
+    rows = np.flatnonzero((toolpath.line > block['change']) & (toolpath.line <= block['end']))
+    feed_rows = rows[(toolpath.motion[rows] != 0) & ~toolpath.machine[rows]]
+    if len(feed_rows) == 0:
+        return None
+    first_move = int(toolpath.line[rows[0]]) - 1
+    body_start = next((index + 1 for index in range(block['change'], int(toolpath.line[feed_rows[0]]) - 1)
+                       if 43 in parse_words(lines[index])[0]), first_move + 1)
+    body_end = int(toolpath.line[feed_rows[-1]])
+    work_rows = rows[~toolpath.machine[rows]]
+    return body_start, body_end, float(np.nanmax(toolpath.z[work_rows]))
+
+
+def line_keys(lines, toolpath, key_params, layouts):
+    """(key numbers, mask) - mask[line, k] is True where a body line belongs to key k
+
+    A cutting move belongs to every key whose outer walls its X extent (the full circle
+    for an arc) overlaps, widened by the tool radius - one pass can cut several keys.
+    Cutting moves outside every key go with the neighbouring cutting moves, rapids with
+    the cut they lead into, and lines without a move with the next move.
+    """
+    keys = sorted(key_params)
+    left = np.array([key_params[key_num]['xl_outer'] for key_num in keys])
+    right = np.array([key_params[key_num]['xr_outer'] for key_num in keys])
+    work = CycleTime.filled_positions(toolpath)
+    low, high = EnvelopeCheck.move_bounds(work, EnvelopeCheck.arc_bounds(toolpath, lines, work))
+    radius = EnvelopeCheck.tool_radii(toolpath, {})
+    reach = (low[:, :1] - radius[:, None] <= right) & (high[:, :1] + radius[:, None] >= left)
+
+    mask = np.zeros((len(lines), len(keys)), dtype=bool)
+    for body_start, body_end, _ in layouts:
+        rows = np.flatnonzero((toolpath.line > body_start) & (toolpath.line <= body_end))
+        tagged = (toolpath.motion[rows] != 0) & ~toolpath.machine[rows] & reach[rows].any(axis=1)
+        if not tagged.any():
+            continue
+        # Next tagged move (rapids, untagged cuts), then the last one for the tail
+        positions = np.arange(len(rows))
+        following = np.where(tagged, positions, len(rows))
+        following = np.minimum.accumulate(following[::-1])[::-1]
+        preceding = np.maximum.accumulate(np.where(tagged, positions, -1))
+        source = np.where(following < len(rows), following, preceding)
+        # Every line takes the next move at or after it (the last move for the tail)
+        line_rows = np.minimum(np.searchsorted(toolpath.line[rows], np.arange(body_start, body_end) + 1),
+                               len(rows) - 1)
+        mask[body_start:body_end] = reach[rows[source[line_rows]]]
+    return keys, mask
+
+
+def line_runs(selected, layout):
+    """(start, end) line ranges (0-based, end exclusive) of the selected lines in a block body"""
+    body_start, body_end, _ = layout
+    segment = np.r_[False, selected[body_start:body_end], False].astype(np.int8)
+    edges = np.flatnonzero(np.diff(segment))
+    return [(body_start + int(start), body_start + int(end)) for start, end in zip(edges[::2], edges[1::2])]
+
+
+def key_runs(keys, mask, blocks, layouts):
+    """Runs of consecutive body lines of each key: dicts with key, tool, block, start, end (0-based, end exclusive)"""
+    runs = []
+    for number, (block, layout) in enumerate(zip(blocks, layouts)):
+        if layout is None:
+            continue
+        for k, key_num in enumerate(keys):
+            for start, end in line_runs(mask[:, k], layout):
+                runs.append({'key': key_num, 'tool': block['tool'], 'block': number, 'start': start, 'end': end})
+    return runs
+
+
+def position_before(toolpath, line):
+    """Work position (x, y, z) the program is at when it reaches a line (0-based)"""
+    row = max(np.searchsorted(toolpath.line, line + 1) - 1, 0)
+    return float(toolpath.x[row]), float(toolpath.y[row]), float(toolpath.z[row])
+
+
+def entry_lines(toolpath, layout):
+    """(lines, top) - lines (0-based, ascending) after which a stretch can be entered from above
+
+    The program is there after a rapid at or above its highest cut in the block (top),
+    any move strictly above it, or a G53 retract - so the G0 down to it and the program's
+    own approach and plunge moves after it never enter the stock. The end of a feed
+    plunge to the top cut is not an entry: the plunge itself must be kept.
+    """
+    body_start, body_end, _ = layout
+    rows = np.flatnonzero((toolpath.line > body_start) & (toolpath.line <= body_end))
+    cutting = (toolpath.motion[rows] != 0) & ~toolpath.machine[rows]
+    top = float(np.nanmax(toolpath.z[rows[cutting]]))
+    z = toolpath.z[rows]
+    safe = toolpath.machine[rows] | (z > top + 1e-6) | ((toolpath.motion[rows] == 0) & (z >= top - 1e-6))
+    return np.unique(toolpath.line[rows[safe]] - 1), top
+
+
+def sub_program(lines, toolpath, blocks, layouts, selected, prologue_end, epilogue_start, tools=None):
+    """(output lines, copied, entries) for a line selection
+
+    copied maps the output index of every copied body line to its original index and
+    entries maps the output index of every added G0 entry move to the lowest Z it may
+    reach (the block's top cut). Each stretch of selected lines is moved back to the
+    program's last safe point before it (entry_lines), entered from the block's
+    clearance height with G0, and continues with the program's own approach moves and feeds.
+    """
+    states = modal_states(lines)
+    output = list(lines[:prologue_end])
+    copied = {}
+    entries = {}
+    machine_lines = set((toolpath.line[toolpath.machine] - 1).tolist())
+    for block, layout in zip(blocks, layouts):
+        if layout is None or (tools and block['tool'] not in tools):
+            continue
+        selected_runs = line_runs(selected, layout)
+        if not selected_runs:
+            continue
+        body_start, body_end, clearance = layout
+        safe_lines, top = entry_lines(toolpath, layout)
+        stretches = []
+        for start, end in selected_runs:
+            before = safe_lines[safe_lines < start]
+            start = int(before[-1]) + 1 if len(before) else body_start
+            if stretches and start <= stretches[-1][1]:
+                stretches[-1][1] = end
+            else:
+                stretches.append([start, end])
+
+        output.extend(lines[block['start']:body_start])
+        current = states[body_start]
+        for start, end in stretches:
+            wanted = states[start]
+            if start > body_start:  # The body start follows the G43 move to clearance
+                x, y, z = position_before(toolpath, start)
+                entry = [f"G0 Z{format_number(clearance)}", f"G0 X{format_number(x)} Y{format_number(y)}"]
+                if z < clearance and start - 1 not in machine_lines:  # Work Z is stale after a G53 retract
+                    entry.append(f"G0 Z{format_number(z)}")
+                for line in entry:
+                    entries[len(output)] = top
+                    output.append(line)
+            output.extend(restore_lines(dict(current, motion='G0'), wanted))
+            # An arc or cycle mode is not restored on its own - the first move line carries it
+            carry = wanted.get('motion') if wanted.get('motion', 'G0') not in RESTORED_MOTIONS else None
+            for index in range(start, end):
+                line = lines[index]
+                if carry:
+                    g_codes, _, values = parse_words(line)
+                    if any(g in G_GROUPS['motion'] or g in CYCLES for g in g_codes):
+                        carry = None
+                    elif any(letter in values for letter in 'XYZIJKR'):
+                        line, carry = f"{carry} {line}", None
+                copied[len(output)] = index
+                output.append(line)
+            current = states[end]
+        output.extend(lines[body_end:block['end']])
+    output.extend(lines[epilogue_start:])
+    return output, copied, entries
+
+
+def cut_moves(toolpath, line_indexes):
+    """(motion, x, y, z) of the feed moves on the given 0-based lines, in line order"""
+    rows = np.flatnonzero(np.isin(toolpath.line - 1, line_indexes) & (toolpath.motion != 0) & ~toolpath.machine)
+    return np.column_stack([toolpath.motion[rows], toolpath.x[rows], toolpath.y[rows], toolpath.z[rows]])
+
+
+def low_entries(toolpath, entries):
+    """1-based lines of added entry moves that are not rapids or end below their block's top cut"""
+    bad = []
+    for index, top in sorted(entries.items()):
+        rows = np.flatnonzero(toolpath.line == index + 1)
+        if not len(rows) or (toolpath.motion[rows] != 0).any() or (toolpath.z[rows] < top - 1e-6).any():
+            bad.append(index + 1)
+    return bad
+
+
+def write_index(path, runs):
+    """key, tool, block, first_line, last_line (1-based, original file) for every run"""
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w') as f:
+        f.write("key,tool,block,first_line,last_line\n")
+        for run in sorted(runs, key=lambda run: (run['key'], run['start'])):
+            f.write(f"{run['key']},{run['tool']},{run['block'] + 1},{run['start'] + 1},{run['end']}\n")
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split a shaping program into per-key / per-tool sub-programs")
+    parser.add_argument('tap', help="G-code (.tap) file")
+    parser.add_argument('--csv', default=None, help="Probe CSV (default: <name>.csv next to the tap)")
+    parser.add_argument('--keys', default=None, help="Keys to keep, e.g. 12,15-17 (default: all)")
+    parser.add_argument('--tools', default=None, help="Tools to keep, e.g. 19,22 (default: all)")
+    parser.add_argument('--per-key', action='store_true', help="One program per selected key")
+    parser.add_argument('--index-only', action='store_true', help="Only write the key -> line range index")
+    parser.add_argument('--output', default=None, help="Output file (default: <name>_K<keys>[_T<tools>].tap)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    csv_path = mirror_path(args.csv or os.path.splitext(args.tap)[0] + ".csv")
+    if not os.path.exists(csv_path):
+        parser.exit(1, f"No probe CSV: {csv_path}\n")
+    key_params, _, _, source = KeytopSolver.load_or_solve(csv_path)
+
+    tap_path = mirror_path(args.tap)
+    with open(tap_path, 'r') as f:
+        lines = f.read().splitlines()
+    toolpath = Toolpath.open(tap_path)
+    prologue_end, blocks, epilogue_start = split_blocks(lines)
+    if not blocks:
+        parser.exit(1, "No tool changes (M6) in the program\n")
+    layouts = [block_layout(lines, toolpath, block) for block in blocks]
+    keys, mask = line_keys(lines, toolpath, key_params, [layout for layout in layouts if layout])
+    runs = key_runs(keys, mask, blocks, layouts)
+
+    base = os.path.splitext(args.tap)[0]
+    index_path = base + INDEX_SUFFIX
+    write_index(index_path, runs)
+    print(f"{os.path.basename(args.tap)}: {len(blocks)} tool blocks, {len(runs)} key runs over "
+          f"{len(set(run['key'] for run in runs))} keys ({source} key outlines) -> {index_path}")
+    if args.index_only:
+        return
+
+    try:
+        selected_keys = parse_selection(args.keys) if args.keys else set(run['key'] for run in runs)
+        tools = parse_selection(args.tools) if args.tools else None
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    missing = selected_keys - set(run['key'] for run in runs)
+    if missing == selected_keys:
+        parser.exit(1, f"No moves in key(s) {args.keys}\n")
+    if missing:
+        print(f"  No moves in key(s) {', '.join(str(k) for k in sorted(missing))} - skipped")
+        selected_keys -= missing
+
+    groups = [{key_num} for key_num in sorted(selected_keys)] if args.per_key else [selected_keys]
+    for group in groups:
+        selected = mask[:, [k for k, key_num in enumerate(keys) if key_num in group]].any(axis=1)
+        output_lines, copied, entries = sub_program(lines, toolpath, blocks, layouts, selected, prologue_end, epilogue_start,
+                                           tools)
+        if not copied:
+            print(f"  Key(s) {args.keys or 'all'}: no moves with tool(s) {args.tools}")
+            continue
+        name = f"_K{min(group)}" if args.per_key else f"_K{args.keys.replace(',', '_')}" if args.keys else "_Kall"
+        if tools:
+            name += f"_T{args.tools.replace(',', '_')}"
+        output = args.output if args.output and not args.per_key else base + name + '.tap'
+        tmp_path = output + '.part'
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(output_lines) + "\n")
+
+        # The copied lines must cut exactly the original moves, and every added entry stays above the cuts
+        split = Toolpath(tmp_path)
+        expected = cut_moves(toolpath, np.array(list(copied.values())))
+        actual = cut_moves(split, np.array(list(copied.keys())))
+        low = low_entries(split, entries)
+        if expected.shape != actual.shape or not np.allclose(expected, actual, equal_nan=True) or low:
+            os.remove(tmp_path)
+            if low:
+                parser.exit(1, f"Entry moves below the cuts on line(s) {', '.join(map(str, low))} - "
+                               f"{output} not written\n")
+            parser.exit(1, f"Split moves do not match the original - {output} not written\n")
+        os.replace(tmp_path, output)
+        block_count = len(set(run['block'] for run in runs if run['key'] in group
+                              and (not tools or run['tool'] in tools)))
+        print(f"  {output}: {len(output_lines)} lines, {len(expected)} cutting moves from {block_count} tool blocks")
+    print(f"  ({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
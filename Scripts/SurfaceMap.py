@@ -0,0 +1,238 @@
+"""
+Surface Map - Load SurfaceMap.txt / SurfaceMap*.csv grids and render cached heatmaps
+Heatmaps are interpolated (bilinear like ApplySurfaceMap, or bicubic) with contours and the grid nodes
+Rendered PNGs are cached by map content hash in SurfaceMaps/HeatmapCache so reopening a map is instant
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+import time
+
+import numpy as np
+from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.figure import Figure
+
+SURFACE_MAPS_DIR = r"C:\Mach4Hobby\Profiles\BLP\SurfaceMaps"
+CACHE_DIR_NAME = "HeatmapCache"
+CACHE_INDEX_NAME = "index.txt"
+RENDER_VERSION = 1  # Bump when the heatmap style changes
+
+HEADER_FIELDS = ['XMIN', 'XMAX', 'XCOUNT', 'YMIN', 'YMAX', 'YCOUNT']
+FIELD_RE = re.compile(r'^(XMIN|XMAX|XCOUNT|YMIN|YMAX|YCOUNT)=(-?[\d.]+)\s*$', re.MULTILINE)
+Z_RE = re.compile(r'^Z=(.*)$', re.MULTILINE)
+
+# Same ramp as ShowHeatmapScreen: blue (low) -> cyan -> green -> yellow -> red (high)
+HEATMAP_COLORS = ['#0000ff', '#00ffff', '#00ff00', '#ffff00', '#ff0000']
+
+
+class SurfaceMap:
+    """Row-major Z grid (z[row, col], row 0 at YMIN) with its bounds"""
+
+    def __init__(self, path, x_min, x_max, x_count, y_min, y_max, y_count, z, sha1):
+        self.path = path
+        self.x_min, self.x_max, self.x_count = x_min, x_max, x_count
+        self.y_min, self.y_max, self.y_count = y_min, y_max, y_count
+        self.z = z
+        self.sha1 = sha1
+
+    @property
+    def xs(self):
+        return np.linspace(self.x_min, self.x_max, self.x_count)
+
+    @property
+    def ys(self):
+        return np.linspace(self.y_min, self.y_max, self.y_count)
+
+    def cells(self, mx, my):
+        """Grid cell (x0, x1, xf, y0, y1, yf) of machine X/Y arrays, clamped to the map like ApplySurfaceMap"""
+        x_scale = 1 / ((self.x_max - self.x_min) / (self.x_count - 1))
+        y_scale = 1 / ((self.y_max - self.y_min) / (self.y_count - 1))
+        xi = (np.maximum(self.x_min, np.minimum(self.x_max, mx)) - self.x_min) * x_scale
+        yi = (np.maximum(self.y_min, np.minimum(self.y_max, my)) - self.y_min) * y_scale
+        x0, y0 = np.floor(xi).astype(np.int64), np.floor(yi).astype(np.int64)
+        x1 = np.minimum(x0 + 1, self.x_count - 1)
+        y1 = np.minimum(y0 + 1, self.y_count - 1)
+        x0 = np.clip(x0, 0, self.x_count - 1)
+        y0 = np.clip(y0, 0, self.y_count - 1)
+        return x0, x1, xi - x0, y0, y1, yi - y0
+
+    def interpolate(self, mx, my):
+        """Bilinear surface Z at machine X/Y arrays (same arithmetic as ApplySurfaceMap, so results match exactly)"""
+        x0, x1, xf, y0, y1, yf = self.cells(mx, my)
+        z00, z10 = self.z[y0, x0], self.z[y0, x1]
+        z01, z11 = self.z[y1, x0], self.z[y1, x1]
+        return z00 + (z10 - z00) * xf + (z01 - z00) * yf + (z00 - z10 - z01 + z11) * xf * yf
+
+    def twist(self, mx, my):
+        """Bilinear cross term d2Z/dXdY of the cell under each machine X/Y point"""
+        x0, x1, _, y0, y1, _ = self.cells(mx, my)
+        x_step = (self.x_max - self.x_min) / (self.x_count - 1)
+        y_step = (self.y_max - self.y_min) / (self.y_count - 1)
+        z = self.z
+        return (z[y0, x0] - z[y0, x1] - z[y1, x0] + z[y1, x1]) / (x_step * y_step)
+
+    def margin(self):
+        """(rows, cols) of edge padding - ProbeSurfaceGrid extends the edge values when adding a margin"""
+        def padding(lines):
+            lead = 0
+            while lead < len(lines) - 1 and np.array_equal(lines[lead], lines[lead + 1]):
+                lead += 1
+            return lead
+
+        rows = min(padding(self.z), padding(self.z[::-1]))
+        cols = min(padding(self.z.T), padding(self.z.T[::-1]))
+        return rows, cols
+
+    def probed_mask(self):
+        """Grid nodes that were probed (False for margin nodes copied from the edge)"""
+        rows, cols = self.margin()
+        mask = np.zeros(self.z.shape, dtype=bool)
+        mask[rows:self.y_count - rows, cols:self.x_count - cols] = True
+        return mask
+
+
+def load_map(path):
+    """Load a surface map in either format
+
+    SurfaceMap.txt: '#' comments, XMIN= ... YCOUNT= lines and a single Z= line.
+    SurfaceMap*.csv: one line of xmin,xmax,xcount,ymin,ymax,ycount followed by the Z values.
+    Z values are row-major with X varying fastest.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    sha1 = hashlib.sha1(data).hexdigest()
+    text = data.decode('utf-8', errors='replace')
+
+    if 'XMIN=' in text:
+        fields = {name: float(value) for name, value in FIELD_RE.findall(text)}
+        missing = [name for name in HEADER_FIELDS if name not in fields]
+        z_line = Z_RE.search(text)
+        if missing or not z_line:
+            raise ValueError(f"Surface map {path} is missing {', '.join(missing) or 'Z='}")
+        header = [fields[name] for name in HEADER_FIELDS]
+        z = np.array(z_line.group(1).split(','), dtype=float)
+    else:
+        values = np.array(text.replace('\n', ',').strip(', ').split(','), dtype=float)
+        header, z = values[:6], values[6:]
+
+    x_min, x_max, x_count, y_min, y_max, y_count = header
+    x_count, y_count = int(x_count), int(y_count)
+    if len(z) != x_count * y_count:
+        raise ValueError(f"Surface map {path} has {len(z)} Z values, expected {x_count} x {y_count}")
+    return SurfaceMap(path, x_min, x_max, x_count, y_min, y_max, y_count, z.reshape(y_count, x_count), sha1)
+
+
+def cache_path(surface_map, method, cache_dir):
+    """Cached PNG path for a map's content and render settings"""
+    return os.path.join(cache_dir, f"{surface_map.sha1[:16]}_{method}_v{RENDER_VERSION}.png")
+
+
+def render_heatmap(surface_map, out_path, method='bilinear', contours=10):
+    """Render a map to a PNG: interpolated heatmap, contour lines and grid nodes
+
+    Uses a bare Figure (no pyplot) so no GUI backend or window is involved.
+    """
+    smap = surface_map
+    z_min, z_max = float(smap.z.min()), float(smap.z.max())
+    x_step = (smap.x_max - smap.x_min) / max(smap.x_count - 1, 1)
+    y_step = (smap.y_max - smap.y_min) / max(smap.y_count - 1, 1)
+
+    width, height = smap.x_max - smap.x_min, smap.y_max - smap.y_min
+    aspect = height / width if width > 0 else 1
+    fig = Figure(figsize=(8, max(3, min(12, 8 * aspect + 1))))
+    ax = fig.add_subplot(111)
+    cmap = LinearSegmentedColormap.from_list('surface', HEATMAP_COLORS)
+
+    # Node-centered pixels so imshow interpolates between probe points
+    extent = [smap.x_min - x_step / 2, smap.x_max + x_step / 2,
+              smap.y_min - y_step / 2, smap.y_max + y_step / 2]
+    image = ax.imshow(smap.z, origin='lower', extent=extent, cmap=cmap, vmin=z_min, vmax=z_max,
+                      interpolation=method, aspect='equal')
+    fig.colorbar(image, ax=ax, label='Z (machine)')
+
+    if contours and z_max > z_min and smap.x_count > 1 and smap.y_count > 1:
+        lines = ax.contour(smap.xs, smap.ys, smap.z, levels=contours, colors='k', linewidths=0.5, alpha=0.6)
+        ax.clabel(lines, fmt='%.3f', fontsize=6)
+
+    grid_x, grid_y = np.meshgrid(smap.xs, smap.ys)
+    probed = smap.probed_mask()
+    ax.scatter(grid_x[probed], grid_y[probed], s=6, c='k', label='Probed')
+    if not probed.all():
+        ax.scatter(grid_x[~probed], grid_y[~probed], s=4, facecolors='none', edgecolors='k', linewidths=0.4,
+                   alpha=0.5, label='Margin')
+
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    ax.set_xlabel('X (machine)')
+    ax.set_ylabel('Y (machine)')
+    ax.set_title(f"{os.path.basename(smap.path)} - {smap.x_count} x {smap.y_count}, "
+                 f"Z {z_min:.4f} to {z_max:.4f} ({z_max - z_min:.4f} total)")
+    fig.tight_layout()
+
+    tmp_path = out_path + '.part.png'
+    fig.savefig(tmp_path, dpi=100)
+    os.replace(tmp_path, out_path)
+
+
+def update_index(cache_dir, map_path, png_path):
+    """Record the current PNG for a map name in the cache index (map file name|PNG file name)"""
+    index_path = os.path.join(cache_dir, CACHE_INDEX_NAME)
+    entries = {}
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            for line in f:
+                if '|' in line and not line.startswith('#'):
+                    name, png = line.rstrip('\n').split('|', 1)
+                    entries[name] = png
+    entries[os.path.basename(map_path)] = os.path.basename(png_path)
+    with open(index_path, 'w') as f:
+        f.write("# map_file|png_file\n")
+        for name in sorted(entries):
+            f.write(f"{name}|{entries[name]}\n")
+
+
+def heatmap(path, method='bilinear', cache_dir=None, force=False):
+    """Cached heatmap PNG for a surface map, rendering it only if the map content is new
+
+    Returns (png_path, rendered).
+    """
+    surface_map = load_map(path)
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    png_path = cache_path(surface_map, method, cache_dir)
+    rendered = force or not os.path.exists(png_path)
+    if rendered:
+        render_heatmap(surface_map, png_path, method)
+    update_index(cache_dir, path, png_path)
+    return png_path, rendered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render cached heatmaps of surface maps")
+    parser.add_argument('maps', nargs='*', help="Surface map files (default: every map in the SurfaceMaps folder)")
+    parser.add_argument('--dir', default=SURFACE_MAPS_DIR, help="SurfaceMaps folder")
+    parser.add_argument('--method', default='bilinear', choices=['bilinear', 'bicubic'], help="Interpolation")
+    parser.add_argument('--force', action='store_true', help="Re-render even if cached")
+    parser.add_argument('--show', action='store_true', help="Open the rendered image(s)")
+    args = parser.parse_args()
+
+    paths = args.maps or sorted(glob.glob(os.path.join(args.dir, 'SurfaceMap*.txt')) +
+                                glob.glob(os.path.join(args.dir, 'SurfaceMap*.csv')))
+    for path in paths:
+        start = time.time()
+        try:
+            png_path, rendered = heatmap(path, args.method, force=args.force)
+        except ValueError as e:
+            print(f"  SKIPPED {os.path.basename(path)}: {e}")
+            continue
+        print(f"  {os.path.basename(path)}: {'rendered' if rendered else 'cached'} -> {png_path} "
+              f"({(time.time() - start) * 1000:.0f}ms)")
+        if args.show and hasattr(os, 'startfile'):
+            os.startfile(png_path)
+
+
+if __name__ == '__main__':
+    main()
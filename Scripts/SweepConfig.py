@@ -0,0 +1,335 @@
+"""
+Sweep Config - Evaluate grids or random samples of solver CONFIG values against the probe archive
+Keys, angles and configs are evaluated as broadcast NumPy dimensions instead of per-key Python loops
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import time
+
+import numpy as np
+
+import KeytopSolver
+import ProbeArchive
+from KeytopSolver import CONFIG, LOGS_DIR
+
+# Parameters the sweep is allowed to vary
+SWEEP_PARAMS = ['tail_weight', 'band_split_y', 'front_overhang', 'tail_overhang',
+                'max_rotation', 'plastic_thickness']
+
+# Default ranges for random sampling (lo, hi)
+DEFAULT_RANGES = {
+    'tail_weight': (1.0, 5.0),
+    'band_split_y': (0.25, 1.10),
+    'front_overhang': (0.0, 0.015),
+    'tail_overhang': (0.0, 0.02),
+    'max_rotation': (1.0, 3.0),
+    'plastic_thickness': (0.05, 0.11),
+}
+
+CONFIG_CHUNK = 64  # configs evaluated per broadcast block (bounds memory use)
+
+RESULT_STATS = ['width_mean', 'width_std', 'angle_abs_mean', 'angle_std',
+                'step_mean', 'step_std', 'shoulder_mean', 'residual_mean', 'residual_max']
+
+
+def pad_points(point_lists):
+    """Pack ragged point lists into a (K, P, 2) array and a (K, P) validity mask"""
+    width = max((len(pts) for pts in point_lists), default=0) or 1
+    arr = np.zeros((len(point_lists), width, 2))
+    mask = np.zeros((len(point_lists), width), dtype=bool)
+    for i, pts in enumerate(point_lists):
+        if pts:
+            arr[i, :len(pts)] = pts
+            mask[i, :len(pts)] = True
+    return arr, mask
+
+
+def load_corpus(logs_dir=LOGS_DIR):
+    """Pack every solvable white key in the archive into padded arrays"""
+    key_nums, piano_idx = [], []
+    lefts, rights, fronts = [], [], []
+    pianos, shoulder_base, key_heights = [], [], []
+
+    for piano_id, csv_path in KeytopSolver.find_piano_folders(logs_dir):
+        probe_data = ProbeArchive.load_probe_data(csv_path)  # Binary sidecar, rebuilt if the CSV changed
+        # Shoulder length without plastic thickness (added per config)
+        base, key_height = KeytopSolver.calculate_global_params(probe_data, dict(CONFIG, plastic_thickness=0))
+        pianos.append(piano_id)
+        shoulder_base.append(base if base else np.nan)
+        key_heights.append(key_height)
+
+        for key_num in sorted(probe_data.keys()):
+            if not KeytopSolver.is_white_key(key_num):
+                continue
+            key_data = probe_data[key_num]
+            left = [[p['X'], p['Y']] for p in key_data['1']]
+            right = [[p['X'], p['Y']] for p in key_data['2']]
+            front = [[p['X'], p['Y']] for p in key_data['3']]
+            if not (left and right):
+                continue
+            if not front:
+                # Same synthesized front edge as process_key
+                front = [[min(p[0] for p in left), -1.2], [max(p[0] for p in right), -1.2]]
+            key_nums.append(key_num)
+            piano_idx.append(len(pianos) - 1)
+            lefts.append(left)
+            rights.append(right)
+            fronts.append(front)
+
+    left, left_mask = pad_points(lefts)
+    right, right_mask = pad_points(rights)
+    front, front_mask = pad_points(fronts)
+
+    # Rotation center: mean of all points per key (matches process_key)
+    total = (left * left_mask[..., None]).sum(1) + (right * right_mask[..., None]).sum(1) + \
+            (front * front_mask[..., None]).sum(1)
+    count = left_mask.sum(1) + right_mask.sum(1) + front_mask.sum(1)
+    center = total / count[:, None]
+
+    shoulders = [KeytopSolver.key_shoulders(k) for k in key_nums]
+    return {
+        'pianos': pianos,
+        'key_num': np.array(key_nums),
+        'piano_idx': np.array(piano_idx),
+        'left': left, 'left_mask': left_mask,
+        'right': right, 'right_mask': right_mask,
+        'front': front, 'front_mask': front_mask,
+        'center': center,
+        'has_left': np.array([s in ('left', 'both') for s in shoulders]),
+        'has_right': np.array([s in ('right', 'both') for s in shoulders]),
+        'shoulder_base': np.array(shoulder_base),
+        'key_height': np.array(key_heights),
+    }
+
+
+def rotate_x(points, center, cos_a, sin_a):
+    """Rotated X of points (K, P, 2) for every angle -> (K, A, P)"""
+    dx = points[:, None, :, 0] - center[:, None, None, 0]
+    dy = points[:, None, :, 1] - center[:, None, None, 1]
+    return dx * cos_a[None, :, None] - dy * sin_a[None, :, None] + center[:, None, None, 0]
+
+
+def band_slack(corpus, lx, rx, xl_outer, xr_outer, split):
+    """Front/tail slack (K, A) for one band_split_y value"""
+    ly = corpus['left'][..., 1]
+    ry = corpus['right'][..., 1]
+    slacks = []
+    for left_band, right_band in (
+            (corpus['left_mask'] & (ly <= split), corpus['right_mask'] & (ry <= split)),
+            (corpus['left_mask'] & (ly > split), corpus['right_mask'] & (ry > split))):
+        l_max = np.where(left_band[:, None, :], lx, -np.inf).max(axis=2)
+        r_min = np.where(right_band[:, None, :], rx, np.inf).min(axis=2)
+        slack = np.where(left_band.any(1)[:, None], l_max - xl_outer, 0.0) + \
+                np.where(right_band.any(1)[:, None], xr_outer - r_min, 0.0)
+        slacks.append(slack)
+    return slacks
+
+
+def solve_configs(corpus, configs):
+    """Solve every key for every config, returns dict of (C, K) arrays"""
+    step = CONFIG['angle_step']
+    max_rot = np.array([c['max_rotation'] for c in configs])
+    n_max = int(max_rot.max() / step)
+    angle_int = np.arange(-n_max, n_max + 1)
+    angles = angle_int * step
+    rad = np.radians(angles)
+    cos_a, sin_a = np.cos(rad), np.sin(rad)
+
+    center = corpus['center']
+    lx = rotate_x(corpus['left'], center, cos_a, sin_a)
+    rx = rotate_x(corpus['right'], center, cos_a, sin_a)
+    xl_outer = np.where(corpus['left_mask'][:, None, :], lx, np.inf).min(axis=2)
+    xr_outer = np.where(corpus['right_mask'][:, None, :], rx, -np.inf).max(axis=2)
+
+    # Band membership only changes when band_split_y crosses a probed Y, so splits that
+    # fall between the same pair of probe rows share one slack evaluation
+    splits = np.array([c['band_split_y'] for c in configs])
+    probe_y = np.unique(np.concatenate([corpus['left'][..., 1][corpus['left_mask']],
+                                        corpus['right'][..., 1][corpus['right_mask']]]))
+    split_class = np.searchsorted(probe_y, splits, side='right')
+    _, first, split_idx = np.unique(split_class, return_index=True, return_inverse=True)
+    unique_splits = splits[first]
+    front_slack = np.empty((len(unique_splits),) + xl_outer.shape)
+    tail_slack = np.empty_like(front_slack)
+    for i, split in enumerate(unique_splits):
+        front_slack[i], tail_slack[i] = band_slack(corpus, lx, rx, xl_outer, xr_outer, split)
+
+    tail_weight = np.array([c['tail_weight'] for c in configs])
+    in_range = np.abs(angle_int)[None, :] <= (max_rot / step).astype(int)[:, None]  # (C, A)
+
+    metric = front_slack[split_idx] + tail_weight[:, None, None] * tail_slack[split_idx]
+    metric = np.where(in_range[:, None, :], metric, np.inf)
+    best = np.argmin(metric, axis=2)  # (C, K) - first minimum, same tie-break as the scalar loop
+    theta = angles[best]
+    k_idx = np.arange(len(corpus['key_num']))[None, :]
+    residual = front_slack[split_idx[:, None], k_idx, best] + tail_slack[split_idx[:, None], k_idx, best]
+
+    params = key_params(corpus, configs, theta, splits)
+    params['residual'] = residual
+    return params
+
+
+def key_params(corpus, configs, theta, splits):
+    """Vectorized calculate_key_params for chosen angles theta (C, K)"""
+    center = corpus['center'][None]  # (1, K, 2)
+    rad = np.radians(theta)
+    cos_a, sin_a = np.cos(rad)[..., None], np.sin(rad)[..., None]
+
+    def rotate(points):
+        dx = points[None, ..., 0] - center[..., 0, None]
+        dy = points[None, ..., 1] - center[..., 1, None]
+        return dx * cos_a - dy * sin_a + center[..., 0, None], dx * sin_a + dy * cos_a + center[..., 1, None]
+
+    lx, _ = rotate(corpus['left'])
+    rx, _ = rotate(corpus['right'])
+    _, fy = rotate(corpus['front'])
+
+    split = splits[:, None, None]
+    front_oh = np.array([c['front_overhang'] for c in configs])[:, None]
+    tail_oh = np.array([c['tail_overhang'] for c in configs])[:, None]
+
+    def wall(x, mask, band, reduce, fill):
+        sel = mask[None] & band
+        value = reduce(np.where(sel, x, fill), axis=2)
+        return np.where(sel.any(2), value, 0.0)  # default=0 like the scalar solver
+
+    ly = corpus['left'][None, ..., 1]
+    ry = corpus['right'][None, ..., 1]
+    xl_front = wall(lx, corpus['left_mask'], ly <= split, np.min, np.inf) - front_oh
+    xl_tail = wall(lx, corpus['left_mask'], ly > split, np.min, np.inf) - tail_oh
+    xr_front = wall(rx, corpus['right_mask'], ry <= split, np.max, -np.inf) + front_oh
+    xr_tail = wall(rx, corpus['right_mask'], ry > split, np.max, -np.inf) + tail_oh
+
+    xl_outer = np.minimum(xl_front, xl_tail)
+    xl_inner = np.maximum(xl_front, xl_tail)
+    xr_outer = np.maximum(xr_front, xr_tail)
+    xr_inner = np.minimum(xr_front, xr_tail)
+
+    y_front = np.nanmedian(np.where(corpus['front_mask'][None], fy, np.nan), axis=2)
+
+    # Rotate the front corners back to world coordinates
+    cx, cy = center[..., 0], center[..., 1]
+    cos_b, sin_b = cos_a[..., 0], -sin_a[..., 0]
+    left_x = (xl_outer - cx) * cos_b - (y_front - cy) * sin_b + cx
+    right_x = (xr_outer - cx) * cos_b - (y_front - cy) * sin_b + cx
+
+    return {
+        'X': (left_x + right_x) / 2.0,
+        'Angle': -theta,
+        'Width': xr_outer - xl_outer,
+        'LStep': np.where(corpus['has_left'][None], xl_inner - xl_outer, 0.0),
+        'RStep': np.where(corpus['has_right'][None], xr_outer - xr_inner, 0.0),
+    }
+
+
+def config_stats(corpus, configs, params):
+    """Per-config summary statistics over every key in the corpus"""
+    steps = np.concatenate([
+        np.where(corpus['has_left'][None], params['LStep'], np.nan),
+        np.where(corpus['has_right'][None], params['RStep'], np.nan)], axis=1)
+    plastic = np.array([c['plastic_thickness'] for c in configs])
+    shoulder = np.nanmean(corpus['shoulder_base']) + plastic \
+        if np.isfinite(corpus['shoulder_base']).any() else np.full(len(configs), np.nan)
+    return {
+        'width_mean': params['Width'].mean(1),
+        'width_std': params['Width'].std(1),
+        'angle_abs_mean': np.abs(params['Angle']).mean(1),
+        'angle_std': params['Angle'].std(1),
+        'step_mean': np.nanmean(steps, 1),
+        'step_std': np.nanstd(steps, 1),
+        'shoulder_mean': shoulder,
+        'residual_mean': params['residual'].mean(1),
+        'residual_max': params['residual'].max(1),
+    }
+
+
+def run_sweep(corpus, configs, chunk=CONFIG_CHUNK):
+    """Evaluate configs in broadcast blocks, returns one stats dict per config"""
+    results = []
+    for start in range(0, len(configs), chunk):
+        block = configs[start:start + chunk]
+        stats = config_stats(corpus, block, solve_configs(corpus, block))
+        for i, config in enumerate(block):
+            row = {name: config[name] for name in SWEEP_PARAMS}
+            row.update({name: float(values[i]) for name, values in stats.items()})
+            results.append(row)
+    return results
+
+
+def parse_values(text):
+    """Parse 'v1,v2,...' or 'lo:hi:n' into a list of floats"""
+    if ':' in text:
+        lo, hi, n = text.split(':')
+        return list(np.linspace(float(lo), float(hi), int(n)))
+    return [float(v) for v in text.split(',')]
+
+
+def build_configs(grid, random_count, ranges, seed):
+    """Build the list of CONFIG dicts from grid axes or a random sample"""
+    if random_count:
+        rng = np.random.default_rng(seed)
+        samples = {name: rng.uniform(lo, hi, random_count) for name, (lo, hi) in ranges.items()}
+        return [dict(CONFIG, **{name: float(samples[name][i]) for name in samples})
+                for i in range(random_count)]
+
+    names = list(grid.keys())
+    return [dict(CONFIG, **dict(zip(names, values)))
+            for values in itertools.product(*(grid[n] for n in names))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep solver CONFIG values against the probe archive")
+    parser.add_argument('--logs', default=LOGS_DIR, help="Logs folder to scan")
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=VALUES',
+                        help="Grid axis, e.g. tail_weight=1,2,3 or band_split_y=0.5:1.0:6")
+    parser.add_argument('--random', type=int, default=0, help="Random sample size instead of a grid")
+    parser.add_argument('--range', action='append', default=[], metavar='NAME=LO:HI',
+                        help="Random sampling range (defaults cover all sweep params)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='SweepResults.csv', help="Results CSV path")
+    parser.add_argument('--top', type=int, default=10, help="Configs to print, ranked by residual")
+    args = parser.parse_args()
+
+    grid = {}
+    for item in args.grid:
+        name, _, values = item.partition('=')
+        if name not in SWEEP_PARAMS:
+            parser.error(f"Cannot sweep {name}; choose from {', '.join(SWEEP_PARAMS)}")
+        grid[name] = parse_values(values)
+
+    ranges = dict(DEFAULT_RANGES)
+    for item in args.range:
+        name, _, values = item.partition('=')
+        lo, hi = values.split(':')
+        ranges[name] = (float(lo), float(hi))
+
+    configs = build_configs(grid, args.random, ranges, args.seed)
+
+    start = time.time()
+    corpus = load_corpus(args.logs)
+    print(f"Loaded {len(corpus['key_num'])} keys from {len(corpus['pianos'])} pianos "
+          f"in {time.time() - start:.2f}s")
+
+    start = time.time()
+    results = run_sweep(corpus, configs)
+    print(f"Evaluated {len(configs)} configs in {time.time() - start:.2f}s")
+
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SWEEP_PARAMS + RESULT_STATS)
+        writer.writeheader()
+        for row in results:
+            writer.writerow({k: f"{v:.6f}" for k, v in row.items()})
+    print(f"Results written to {os.path.abspath(args.output)}")
+
+    print(f"\nTop {args.top} configs by mean residual:")
+    for row in sorted(results, key=lambda r: r['residual_mean'])[:args.top]:
+        cfg = '  '.join(f"{name}={row[name]:.4g}" for name in SWEEP_PARAMS)
+        print(f"  residual={row['residual_mean']:.5f}  width={row['width_mean']:.4f}  "
+              f"step={row['step_mean']:.4f}  |angle|={row['angle_abs_mean']:.3f}  {cfg}")
+
+
+if __name__ == '__main__':
+    main()